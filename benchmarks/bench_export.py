@@ -0,0 +1,374 @@
+"""
+Export benchmarks, on synthetic scenes (see fakebpy.make_scene), without blender.
+
+    python benchmarks/bench_export.py --objects 20 --tris 20000 --duplicates 0.25 --materials 4
+
+Every benchmark reports its best time over --repeat runs, tris/sec, MB/sec written and peak memory.
+--json keeps the numbers, to compare against later runs (or other engines).
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+
+import fakebpy
+
+
+io_ogre = fakebpy.load_addon()
+
+from io_ogre import ogre_types
+from io_ogre import ogre_export
+from io_ogre import zxml
+from io_ogre import zmat
+from io_ogre import zmesh
+from io_ogre import zprof
+from io_ogre import zlod
+
+
+#
+# ## Measuring ##
+#
+
+
+def dir_size(path) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def clear_dir(path) -> None:
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isdir(full):
+            shutil.rmtree(full)
+        else:
+            os.remove(full)
+
+
+def measure(name, run, tris, out_dir=None, repeat=3) -> dict:
+    """Best of repeat runs; bytes written are whatever run left in out_dir"""
+    best = None
+    peak = None
+    written = 0
+    for i in range(repeat):
+        if out_dir is not None:
+            clear_dir(out_dir)
+        gc.collect()
+        per_run = zprof.reset_peak()
+        time_start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - time_start
+        best = seconds if best is None else min(best, seconds)
+        run_peak = zprof.peak_rss()
+        if run_peak is not None:
+            peak = run_peak if peak is None else max(peak, run_peak)
+        if out_dir is not None:
+            written = dir_size(out_dir)
+    
+    return {
+        "name": name,
+        "seconds": best,
+        "tris": tris,
+        "tris_per_sec": tris / best if best and tris else None,
+        "bytes_written": written,
+        "mb_per_sec": written / 1048576.0 / best if best and written else None,
+        "peak_rss": peak,
+        # without a per run reset, the peak covers everything before the benchmark, too
+        "peak_per_run": per_run,
+    }
+
+
+def format_row(r) -> str:
+    num = lambda v, fmt: "n/a" if v is None else fmt % v
+    return "%-22s %10s %14s %10s %10s" % (
+        r["name"],
+        num(r["seconds"], "%.4f s"),
+        num(r["tris_per_sec"], "%.0f tri/s"),
+        num(r["mb_per_sec"], "%.1f MB/s"),
+        num(r["peak_rss"] and r["peak_rss"] / 1048576.0, "%.0f MB"))
+
+
+#
+# ## Benchmarks ##
+#
+
+
+def mesh_objects(context) -> list:
+    return [obj for obj in context.scene.objects if obj.type == "MESH"]
+
+
+def unique_objects(context) -> list:
+    seen = set()
+    objects = list()
+    for obj in mesh_objects(context):
+        if obj.data.as_pointer() not in seen:
+            seen.add(obj.data.as_pointer())
+            objects.append(obj)
+    return objects
+
+
+def build_meshes(context, vectorized=True, animation=False) -> list:
+    return [ogre_types.Mesh(obj, context.depsgraph, ANIMATION=animation, VECTORIZED=vectorized)
+            for obj in unique_objects(context)]
+
+
+def build_skinned(context, vectorized=True) -> list:
+    """Skeletons and skinned meshes of the objects with an armature"""
+    og_meshes = list()
+    for obj in unique_objects(context):
+        armature = obj.find_armature()
+        if armature is not None:
+            skeleton = ogre_types.Skeleton(armature, obj)
+            og_meshes.append(ogre_types.Mesh(obj, context.depsgraph, ARMATURE=True, VECTORIZED=vectorized,
+                                             skeleton=skeleton))
+    return og_meshes
+
+
+def mesh_graph(og_mesh) -> list:
+    """The .mesh.xml as an XMLnode graph, built like the exporter did before it streamed"""
+    geometry = og_mesh.geometry
+    xn_mesh = zxml.XMLnode()
+    
+    xn_mesh.append("mesh", {})
+    xn_mesh.add("sharedgeometry", {"vertexcount": og_mesh.vertexcount})
+    xn_mesh.add("vertexbuffer", dict(og_mesh.attr_dict))
+    
+    first = True
+    for pos, nor, uv, tan, bin in geometry.iter_vertices():
+        if first:
+            xn_mesh.add("vertex", {})
+            first = False
+        else:
+            xn_mesh.append("vertex", {})
+        xn_mesh.add("position", dict(zip("xyz", pos)))
+        xn_mesh.append("normal", dict(zip("xyz", nor)))
+        xn_mesh.append("texcoord", dict(zip("uv", uv)))
+        xn_mesh.append("tangent", dict(zip("xyz", tan)))
+        xn_mesh.append("binormal", dict(zip("xyz", bin)))
+        xn_mesh.pointer_up()
+    xn_mesh.pointer_up()
+    xn_mesh.pointer_up()
+    xn_mesh.append("submeshes", {})
+    shared, submeshes = og_mesh.build_submeshes()
+    for index, submesh in enumerate(submeshes):
+        attr = {
+            "material": submesh.material,
+            "operationtype": "triangle_list",
+            "use32bitindexes": str(submesh.use32bitindexes(shared)),
+            "usesharedvertices": "true"
+        }
+        if index == 0:
+            xn_mesh.add("submesh", attr)
+        else:
+            xn_mesh.append("submesh", attr)
+        xn_mesh.add("faces", {"count": len(submesh.indices)})
+        
+        first = True
+        for tri in submesh.iter_faces():
+            if first:
+                xn_mesh.add("face", {"v1": tri[0], "v2": tri[1], "v3": tri[2]})
+                first = False
+            else:
+                xn_mesh.append("face", {"v1": tri[0], "v2": tri[1], "v3": tri[2]})
+        xn_mesh.pointer_up()
+        xn_mesh.pointer_up()
+    xn_mesh.pointer_up()
+    xn_mesh.append("submeshnames", {})
+    for index, submesh in enumerate(submeshes):
+        if index == 0:
+            xn_mesh.add("submesh", {"index": index, "name": submesh.material})
+        else:
+            xn_mesh.append("submesh", {"index": index, "name": submesh.material})
+    xn_mesh.pointer_up()
+    return xn_mesh.graph
+
+
+def material_graph(materials) -> list:
+    mn_mat = zmat.MATnode()
+    for material in materials:
+        og_material = ogre_types.Material(material)
+        mn_mat.bracket("material", og_material.name)
+        mn_mat.entry("receive_shadows", og_material.receive_shadows)
+        mn_mat.bracket("technique", "")
+        mn_mat.bracket("pass", og_material.name)
+        mn_mat.entry("ambient", og_material.ambient)
+        mn_mat.entry("diffuse", og_material.diffuse)
+        mn_mat.entry("specular", og_material.specular)
+        mn_mat.entry("emissive", og_material.emissive)
+        for et in og_material.pass_dict:
+            mn_mat.entry(et, og_material.pass_dict[et])
+        mn_mat.pointer_reset()
+    return mn_mat.graph
+
+
+def run_benchmarks(args, out_dir) -> list:
+    texture_dir = None
+    if args.textures:
+        texture_dir = os.path.join(out_dir, "textures")
+        os.makedirs(texture_dir, exist_ok=True)
+    context = fakebpy.make_scene(objects=args.objects,
+                                 tris=args.tris,
+                                 duplicates=args.duplicates,
+                                 materials=args.materials,
+                                 slots=args.slots,
+                                 texture_dir=texture_dir,
+                                 colours=args.colours,
+                                 bones=args.bones,
+                                 shapes=args.shapes,
+                                 seed=args.seed)
+    
+    work_dir = os.path.join(out_dir, "export")
+    os.makedirs(work_dir, exist_ok=True)
+    
+    scene_tris = sum(len(obj.data.polygons) for obj in mesh_objects(context))
+    unique_tris = sum(len(obj.data.polygons) for obj in unique_objects(context))
+    og_meshes = build_meshes(context)
+    
+    def bench(name):
+        return not args.only or name in args.only
+    
+    results = list()
+    
+    if bench("extract"):
+        results.append(measure("extract", lambda: build_meshes(context, True), unique_tris, repeat=args.repeat))
+    if bench("extract-legacy"):
+        results.append(measure("extract-legacy", lambda: build_meshes(context, False), unique_tris,
+                               repeat=args.repeat))
+    if bench("extract-skinned") and args.bones:
+        results.append(measure("extract-skinned", lambda: build_skinned(context, True), unique_tris,
+                               repeat=args.repeat))
+    if bench("extract-shapes") and args.shapes:
+        results.append(measure("extract-shapes", lambda: build_meshes(context, True, animation=True), unique_tris,
+                               repeat=args.repeat))
+    
+    if bench("optimize"):
+        def run():
+            for og_mesh in build_meshes(context):
+                og_mesh.optimize_vertex_cache()
+        results.append(measure("extract+optimize", run, unique_tris, repeat=args.repeat))
+    
+    if bench("lod"):
+        levels = zlod.lod_levels(args.lod_levels)
+        
+        def run():
+            for og_mesh in og_meshes:
+                geometry, submeshes = og_mesh.build_submeshes()
+                zlod.generate_lods(geometry, submeshes, levels)
+        results.append(measure("lod", run, unique_tris, repeat=args.repeat))
+    
+    if bench("xml-graph"):
+        def run():
+            seri = zxml.XMLserializer()
+            for i, og_mesh in enumerate(og_meshes):
+                seri.write_file(os.path.join(work_dir, "%d.mesh.xml" % i), graph=mesh_graph(og_mesh))
+        results.append(measure("xml-graph", run, unique_tris, work_dir, args.repeat))
+    
+    if bench("xml-stream"):
+        def run():
+            for i, og_mesh in enumerate(og_meshes):
+                geometry, submeshes = og_mesh.build_submeshes()
+                ogre_export.write_mesh_xml(os.path.join(work_dir, "%d.mesh.xml" % i), og_mesh, geometry, submeshes)
+        results.append(measure("xml-stream", run, unique_tris, work_dir, args.repeat))
+    
+    if bench("mesh-binary"):
+        def run():
+            seri = zmesh.MESHserializer()
+            for i, og_mesh in enumerate(og_meshes):
+                geometry, submeshes = og_mesh.build_submeshes()
+                seri.write_file(os.path.join(work_dir, "%d.mesh" % i), geometry, submeshes=submeshes)
+        results.append(measure("mesh-binary", run, unique_tris, work_dir, args.repeat))
+    
+    if bench("material"):
+        def run():
+            graph = material_graph(fakebpy.data.materials)
+            zmat.MATserializer().write_file(os.path.join(work_dir, "scene.material"), graph)
+        results.append(measure("material", run, 0, work_dir, args.repeat))
+    
+    if bench("export"):
+        def run():
+            ogre_export.write_loop(context, os.path.join(work_dir, "scene.scene"),
+                                   ARMATURE=args.bones > 0,
+                                   ANIMATION=args.bones > 0 or args.shapes > 0,
+                                   PHYSICS=True,
+                                   MATERIALS=True,
+                                   BINARY=True,
+                                   VECTORIZED=True,
+                                   KEEP_XML=args.keep_xml,
+                                   BINARY_WRITER='CONVERTER' if args.converter else 'NATIVE',
+                                   CONVERTER=args.converter,
+                                   CONVERTER_TIMEOUT=args.converter_timeout
+                                   )
+        results.append(measure("export", run, scene_tris, work_dir, args.repeat))
+    
+    if bench("export-batched"):
+        def run():
+            ogre_export.write_loop(context, os.path.join(work_dir, "scene.scene"),
+                                   ARMATURE=False,
+                                   ANIMATION=False,
+                                   PHYSICS=True,
+                                   MATERIALS=True,
+                                   BINARY=True,
+                                   VECTORIZED=True,
+                                   KEEP_XML=args.keep_xml,
+                                   STATIC_BATCH=True
+                                   )
+        results.append(measure("export-batched", run, scene_tris, work_dir, args.repeat))
+    
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the exporter on synthetic scenes")
+    parser.add_argument("--objects", type=int, default=20, help="objects in the scene")
+    parser.add_argument("--tris", type=int, default=20000, help="tris per object")
+    parser.add_argument("--duplicates", type=float, default=0.25, help="share of objects repeating a mesh (0..1)")
+    parser.add_argument("--materials", type=int, default=4, help="materials, cycled through the objects")
+    parser.add_argument("--slots", type=int, default=1, help="materials (submeshes) per object")
+    parser.add_argument("--textures", action="store_true", help="give every material an image texture")
+    parser.add_argument("--colours", action="store_true", help="give every mesh a vertex colour layer")
+    parser.add_argument("--bones", type=int, default=0, help="skin every object to an armature of this many bones")
+    parser.add_argument("--shapes", type=int, default=0, help="give every mesh this many shape keys (poses)")
+    parser.add_argument("--lod-levels", type=int, default=3, help="LOD levels in the lod benchmark")
+    parser.add_argument("--keep-xml", action="store_true", help="write .mesh.xml files in the export benchmark")
+    parser.add_argument("--converter", default="",
+                        help="convert the export benchmark's xml with this command (eg. benchmarks/fake_converter.py)")
+    parser.add_argument("--converter-timeout", type=float, default=0.0, help="seconds per conversion (0: no limit)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the best one counts")
+    parser.add_argument("--only", nargs="*", help="benchmarks to run (default: all)",
+                        choices=("extract", "extract-legacy", "extract-skinned", "extract-shapes", "optimize", "lod",
+                                 "xml-graph", "xml-stream", "mesh-binary", "material", "export", "export-batched"))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    
+    out_dir = tempfile.mkdtemp(prefix="boe_bench_")
+    try:
+        results = run_benchmarks(args, out_dir)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    
+    print("scene: %d objects, %d tris each, %.0f%% duplicates, %d materials, %d per object" % (
+          args.objects, args.tris, args.duplicates * 100.0, args.materials, args.slots))
+    for r in results:
+        print(format_row(r))
+    
+    if args.json:
+        with open(args.json, mode="w", encoding="UTF-8") as fw:
+            json.dump({
+                "scene": {k: v for k, v in vars(args).items() if k not in ("json", "only")},
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "results": results,
+            }, fw, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Stand-in for the blender command line the batch exporter (io_ogre/zjobs.py) starts workers with,
+so job lists can be run without blender:
+    
+    python io_ogre/zjobs.py jobs.json --blender "python benchmarks/fake_blender.py"
+
+Takes `--background [<file>] --python <script> -- <args>`, loads the file and runs the script.
+The "file" is json: the make_scene arguments (see fakebpy.make_scene) and the scene names ("scenes"),
+and how to misbehave on loading it: "crash" (always), "flaky" (crash on the first n loads),
+"sleep" (seconds, first). Scripts can load files too, with bpy.ops.wm.open_mainfile (the warm workers do).
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import runpy
+
+import fakebpy
+
+
+def load_scenes(spec) -> list:
+    """(name, context) per scene of the spec, seeded apart"""
+    keys = ("objects", "tris", "duplicates", "materials", "slots", "colours", "bones", "shapes", "seed")
+    params = {key: spec[key] for key in keys if key in spec}
+    scenes = list()
+    for index, name in enumerate(spec.get("scenes", ["Scene"])):
+        params["seed"] = spec.get("seed", 0) + index
+        context = fakebpy.make_scene(**params)
+        context.scene.name = name
+        context.depsgraph = types.SimpleNamespace(update=lambda: None)
+        context.scene.view_layers = [types.SimpleNamespace(depsgraph=context.depsgraph)]
+        scenes.append((name, context))
+    return scenes
+
+
+def load(spec) -> None:
+    """Replace the scenes with the spec's, the first one active (like blender has it)"""
+    bpy = sys.modules["bpy"]
+    scenes = load_scenes(spec)
+    bpy.context = scenes[0][1]
+    bpy.data.scenes = {name: context.scene for name, context in scenes}
+
+
+def open_mainfile(filepath) -> set:
+    """bpy.ops.wm.open_mainfile"""
+    with open(filepath) as f:
+        spec = json.load(f)
+    
+    time.sleep(spec.get("sleep", 0.0))
+    if spec.get("crash"):
+        os._exit(139)
+    if spec.get("flaky"):
+        # the loads so far, next to the file
+        path_attempts = filepath + ".attempts"
+        attempts = 0
+        if os.path.exists(path_attempts):
+            with open(path_attempts) as f:
+                attempts = int(f.read())
+        with open(path_attempts, mode="w") as f:
+            f.write(str(attempts + 1))
+        if attempts < spec["flaky"]:
+            os._exit(139)
+    
+    load(spec)
+    return {'FINISHED'}
+
+
+def main(argv) -> int:
+    ours = argv[:argv.index("--")] if "--" in argv else argv
+    script = ours[ours.index("--python") + 1]
+    files = [arg for before, arg in zip([None] + ours, ours) if not arg.startswith("-") and before != "--python"]
+    
+    fakebpy.load_addon()
+    bpy = sys.modules["bpy"]
+    bpy.ops.wm = types.SimpleNamespace(open_mainfile=open_mainfile)
+    if files:
+        open_mainfile(files[0])
+    else:
+        # the startup file: an empty scene
+        load({"objects": 0})
+    
+    # like blender, the script sees the whole command line
+    sys.argv = [sys.argv[0]] + argv
+    runpy.run_path(script, run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
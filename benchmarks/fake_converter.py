@@ -0,0 +1,41 @@
+"""
+Stand-in for OgreXMLConverter, so the exporter's converter pool (io_ogre/zconvert.py) runs without windows:
+    
+    python benchmarks/bench_export.py --only export --converter "python benchmarks/fake_converter.py --sleep 0.2"
+
+Takes `[options] [converter flags] <src> <dst>`, ignores the converter's own flags (-d3d, -q, ...) and
+"converts" by copying src to dst. How to misbehave: "--sleep" (seconds, eg. past the pool's timeout),
+"--fail" (exit 1 with a message on stderr, writing nothing), both only for sources containing "--match" if given.
+"""
+
+import sys
+import time
+import shutil
+import argparse
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Fake OgreXMLConverter")
+    parser.add_argument("--sleep", type=float, default=0.0, help="seconds to take per conversion")
+    parser.add_argument("--fail", action="store_true", help="fail the conversion")
+    parser.add_argument("--match", default="", help="only misbehave for sources containing this")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    # the real converter's flags
+    args, flags = parser.parse_known_args(argv)
+    
+    print("fake converter: %s -> %s" % (args.src, args.dst))
+    if args.match not in args.src:
+        shutil.copyfile(args.src, args.dst)
+        return 0
+    
+    time.sleep(args.sleep)
+    if args.fail:
+        sys.stderr.write("fake converter: failing %s, as asked\n" % args.src)
+        return 1
+    shutil.copyfile(args.src, args.dst)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,557 @@
+"""
+Lightweight stand-in for the parts of bpy, bmesh, mathutils and bpy_extras the exporter touches,
+so the export pipeline can be benchmarked on a plain python + numpy install, without blender.
+
+Scenes are parametric (see make_scene); the meshes come out triangulated already,
+so bmesh.ops.triangulate is a no-op here. Armatures are posed and shape keys set by frame_set,
+but to_mesh doesn't deform (it always gives the basis shape).
+"""
+
+import os
+import sys
+import types
+
+import numpy as np
+
+
+ADDON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "io_ogre")
+
+
+#
+# ## Mesh data (collections answering foreach_get and per item access) ##
+#
+
+
+class Item(object):
+    """One element of a Collection; attributes read from the collection's arrays"""
+    
+    __slots__ = ("collection", "index")
+    
+    def __init__(self, collection, index):
+        self.collection = collection
+        self.index = index
+    
+    def __getattr__(self, attr):
+        try:
+            a = self.collection.arrays[attr]
+        except KeyError:
+            raise AttributeError(attr)
+        value = a[self.index]
+        if a.dtype == object:
+            # variable length data, eg. a vertex's groups
+            return value
+        return value.tolist() if a.ndim > 1 else value.item()
+
+
+class Collection(object):
+    """bpy_prop_collection lookalike, backed by (n, width) numpy arrays per attribute"""
+    
+    def __init__(self, length, **arrays):
+        self.length = length
+        self.arrays = arrays
+    
+    def __len__(self):
+        return self.length
+    
+    def __getitem__(self, index):
+        if not -self.length <= index < self.length:
+            raise IndexError(index)
+        return Item(self, index % self.length)
+    
+    def __iter__(self):
+        return (Item(self, i) for i in range(self.length))
+    
+    def foreach_get(self, attr, out):
+        out[:] = self.arrays[attr].ravel()
+    
+    def copy(self):
+        return Collection(self.length, **{k: a.copy() for k, a in self.arrays.items()})
+
+
+class Layers(object):
+    """uv_layers / vertex_colors: only the active layer matters to the exporter"""
+    
+    def __init__(self, data=None):
+        self.active = None if data is None else types.SimpleNamespace(data=data)
+
+
+class Mesh(object):
+    """bpy.types.Mesh lookalike"""
+    
+    pointers = 0
+    
+    def __init__(self, name, vertices, loops, polygons, uvs=None, colours=None, materials=()):
+        self.name = name
+        self.vertices = vertices
+        self.loops = loops
+        self.polygons = polygons
+        self.uv_layers = Layers(uvs)
+        self.vertex_colors = Layers(colours)
+        self.materials = list(materials)
+        # a Key, see grid_shapes
+        self.shape_keys = None
+        Mesh.pointers += 1
+        self.pointer = Mesh.pointers
+    
+    def as_pointer(self) -> int:
+        return self.pointer
+    
+    def calc_tangents(self) -> None:
+        # the tangents are generated with the mesh
+        pass
+    
+    def copy(self, name=None):
+        uvs = self.uv_layers.active
+        colours = self.vertex_colors.active
+        mesh = Mesh(name or self.name,
+                    self.vertices.copy(), self.loops.copy(), self.polygons.copy(),
+                    uvs=None if uvs is None else uvs.data.copy(),
+                    colours=None if colours is None else colours.data.copy(),
+                    materials=self.materials)
+        mesh.shape_keys = self.shape_keys
+        return mesh
+
+
+def grid_weights(co, bones) -> np.ndarray:
+    """
+    Vertex group memberships (a list of group, weight per vertex) of bones spread evenly along x:
+    every vertex is in the groups of the 6 nearest bones, the far ones with tiny weights.
+    """
+    centres = np.linspace(-1.0, 1.0, bones)
+    spacing = 2.0 / max(1, bones - 1)
+    distance = np.abs(co[:, 0, None] - centres[None, :])
+    nearest = np.argsort(distance, axis=1)[:, :min(6, bones)]
+    weights = np.exp(-(np.take_along_axis(distance, nearest, axis=1) / spacing) ** 2 * 2.0)
+    groups = np.empty(len(co), dtype=object)
+    for v, (bone_row, weight_row) in enumerate(zip(nearest.tolist(), weights.tolist())):
+        groups[v] = [types.SimpleNamespace(group=b, weight=w) for b, w in zip(bone_row, weight_row)]
+    return groups
+
+
+def grid_mesh(name, tris, seed=0, materials=(), colours=False, bones=0) -> Mesh:
+    """
+    A wavy, bumpy, smooth grid with (at most) the given number of tris; the seed picks the waves and bumps.
+    With several materials, the tris are split into bands, one per material slot.
+    With colours, there's a vertex colour layer (a gradient over the grid).
+    With bones, the vertices are in vertex groups of that many bones, along x (see grid_weights).
+    """
+    tris = max(2, int(tris))
+    side = int(np.ceil(np.sqrt(tris / 2.0)))
+    rng = np.random.RandomState(seed)
+    
+    # vertices
+    x, y = np.meshgrid(np.linspace(-1.0, 1.0, side + 1), np.linspace(-1.0, 1.0, side + 1))
+    phase = rng.uniform(0.0, 2.0 * np.pi, 2)
+    z = 0.1 * np.sin(3.0 * x + phase[0]) * np.cos(3.0 * y + phase[1]) + rng.uniform(-0.2, 0.2, x.shape) / side
+    co = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1).astype(np.float32)
+    normal = np.zeros_like(co)
+    normal[:, 2] = 1.0
+    
+    # two tris per quad, cut down to the requested count
+    i, j = np.meshgrid(np.arange(side), np.arange(side))
+    v0 = (j * (side + 1) + i).ravel()
+    v1, v2, v3 = v0 + 1, v0 + side + 2, v0 + side + 1
+    tri_verts = np.stack([np.stack([v0, v1, v2], axis=1), np.stack([v0, v2, v3], axis=1)], axis=1)
+    tri_verts = tri_verts.reshape(-1, 3)[:tris].astype(np.int32)
+    n_polys = len(tri_verts)
+    n_loops = n_polys * 3
+    
+    loop_verts = tri_verts.ravel()
+    loop_start = np.arange(0, n_loops, 3, dtype=np.int32)
+    
+    tangent = np.zeros((n_loops, 3), dtype=np.float32)
+    tangent[:, 0] = 1.0
+    bitangent = np.zeros((n_loops, 3), dtype=np.float32)
+    bitangent[:, 1] = 1.0
+    uv = (co[loop_verts, :2] + 1.0) * 0.5
+    
+    vertices = Collection(len(co), co=co, normal=normal)
+    if bones:
+        vertices.arrays["groups"] = grid_weights(co, bones)
+    loops = Collection(n_loops, vertex_index=loop_verts, tangent=tangent, bitangent=bitangent)
+    polygons = Collection(n_polys,
+                          loop_start=loop_start,
+                          loop_total=np.full(n_polys, 3, dtype=np.int32),
+                          material_index=(np.arange(n_polys) * max(1, len(materials)) // n_polys).astype(np.int32),
+                          use_smooth=np.ones(n_polys, dtype=np.bool_),
+                          vertices=tri_verts,
+                          loop_indices=loop_start[:, None] + np.arange(3, dtype=np.int32))
+    
+    colour_layer = None
+    if colours:
+        rgb = np.stack([uv[:, 0], uv[:, 1], np.full(n_loops, 0.5)], axis=1)
+        colour_layer = Collection(n_loops, color=np.hstack([rgb, np.ones((n_loops, 1))]).astype(np.float32))
+    
+    return Mesh(name, vertices, loops, polygons,
+                uvs=Collection(n_loops, uv=uv), colours=colour_layer, materials=materials)
+
+
+#
+# ## Datablocks, objects, scene ##
+#
+
+
+class MeshData(list):
+    """bpy.data.meshes lookalike"""
+    
+    def remove(self, mesh) -> None:
+        for i, m in enumerate(self):
+            if m is mesh:
+                del self[i]
+                return
+        raise ReferenceError("Mesh not in bpy.data.meshes")
+
+
+data = types.SimpleNamespace(meshes=MeshData(), materials=list(), objects=list())
+
+
+class Input(object):
+    def __init__(self, default_value, links=()):
+        self.default_value = default_value
+        self.links = list(links)
+
+
+class KeyBlocks(list):
+    """Key.key_blocks: the values read at once, like the other collections"""
+    
+    def foreach_get(self, attr, out):
+        out[:] = [getattr(block, attr) for block in self]
+
+
+class Key(object):
+    """
+    bpy.types.Key lookalike (see grid_shapes), with an action: the shapes fade in and out one after another,
+    a triangle wave each, so the values are piecewise linear.
+    """
+    
+    def __init__(self, blocks, frames=48):
+        self.key_blocks = KeyBlocks(blocks)
+        self.reference_key = blocks[0]
+        self.use_relative = True
+        action = types.SimpleNamespace(name="Talk", frame_range=(1.0, float(frames)))
+        self.animation_data = types.SimpleNamespace(action=action)
+        self.frames = frames
+    
+    def set_frame(self, frame) -> None:
+        shapes = self.key_blocks[1:]
+        span = self.frames / max(1, len(shapes))
+        for s, block in enumerate(shapes):
+            block.value = float(max(0.0, 1.0 - abs(frame - (s + 0.5) * span) / span))
+
+
+def grid_shapes(co, shapes, seed=0) -> Key:
+    """
+    Shape keys of a grid mesh (a basis and that many shapes): every shape lifts a small disc of the grid
+    (a tenth of it across), like the shapes of a face rig move a mouth corner or a brow.
+    """
+    rng = np.random.RandomState(seed)
+    basis = types.SimpleNamespace(name="Basis", data=Collection(len(co), co=co), mute=False, value=0.0)
+    basis.relative_key = basis
+    blocks = [basis]
+    for s in range(shapes):
+        centre = rng.uniform(-0.8, 0.8, 2)
+        distance = np.linalg.norm(co[:, :2] - centre, axis=1)
+        lift = 0.05 * np.clip(1.0 - distance / 0.1, 0.0, None) ** 2
+        shape_co = co.copy()
+        shape_co[:, 2] += lift.astype(np.float32)
+        blocks.append(types.SimpleNamespace(name="Shape_%d" % s, data=Collection(len(co), co=shape_co),
+                                            relative_key=basis, mute=False, value=0.0))
+    return Key(blocks)
+
+
+class Material(object):
+    """A node material with a Principled BSDF, with or without an image texture"""
+    
+    def __init__(self, name, colour, image_path=None):
+        self.name = name
+        self.use_nodes = True
+        links = list()
+        if image_path is not None:
+            image = types.SimpleNamespace(filepath=image_path, is_dirty=False)
+            links.append(types.SimpleNamespace(from_node=types.SimpleNamespace(image=image)))
+        principled = types.SimpleNamespace(inputs={"Base Color": Input(list(colour), links)})
+        self.node_tree = types.SimpleNamespace(nodes={"Principled BSDF": principled})
+
+
+class Bone(object):
+    """bpy.types.Bone lookalike: rest matrix (armature space, rows) and hierarchy"""
+    
+    def __init__(self, name, matrix_local, parent=None):
+        self.name = name
+        self.matrix_local = matrix_local
+        self.parent = parent
+        self.children = list()
+        self.use_deform = True
+        if parent is not None:
+            parent.children.append(self)
+
+
+def chain_armature(name, bones) -> types.SimpleNamespace:
+    """bpy.types.Armature lookalike: a chain of bones along x, over the grid meshes (-1..1)"""
+    chain = list()
+    for b in range(bones):
+        matrix = np.identity(4)
+        # blender bones point along their y axis; these point along x
+        matrix[:3, :3] = [[0.0, 1.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]
+        matrix[0, 3] = -1.0 + 2.0 * b / max(1, bones - 1)
+        chain.append(Bone("Bone_%d" % b, matrix.tolist(), chain[-1] if chain else None))
+    return types.SimpleNamespace(name=name, bones=chain, pose_position='POSE')
+
+
+class Slots(list):
+    def values(self):
+        return list(self)
+
+
+class Object(object):
+    """bpy.types.Object lookalike"""
+    
+    def __init__(self, name, mesh, location=(0.0, 0.0, 0.0), modifiers=()):
+        self.name = name
+        self.type = "MESH"
+        self.data = mesh
+        self.modifiers = list(modifiers)
+        self.location = list(location)
+        self.rotation_quaternion = [1.0, 0.0, 0.0, 0.0]
+        self.scale = [1.0, 1.0, 1.0]
+        self.vertex_groups = list()
+        self.show_only_shape_key = False
+        self.active_shape_key_index = 0
+        self.animation_data = None
+        self.parent = None
+        # the armature deforming the mesh (see find_armature)
+        self.armature = None
+    
+    @property
+    def matrix_world(self) -> list:
+        """Location, rotation (quaternion) and scale as a 4x4 matrix (rows), like mathutils.Matrix"""
+        w, x, y, z = self.rotation_quaternion
+        rotation = np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                             [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                             [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]])
+        matrix = np.identity(4)
+        matrix[:3, :3] = rotation * np.asarray(self.scale)
+        matrix[:3, 3] = self.location
+        if self.parent is not None:
+            matrix = np.asarray(self.parent.matrix_world) @ matrix
+        return matrix.tolist()
+    
+    @property
+    def active_material(self):
+        return self.data.materials[0] if self.data.materials else None
+    
+    @property
+    def material_slots(self):
+        return Slots(types.SimpleNamespace(material=m) for m in self.data.materials)
+    
+    def find_armature(self):
+        return self.armature
+    
+    def to_mesh(self, depsgraph, apply_modifiers, calc_undeformed=False) -> Mesh:
+        # evaluated copy, owned by bpy.data until it's removed
+        mesh = self.data.copy()
+        data.meshes.append(mesh)
+        return mesh
+
+
+class ArmatureObject(Object):
+    """
+    An armature object (see chain_armature) with an action: the root slides along x, every other bone
+    swings about z (a triangle wave, so the motion is piecewise linear), the rest stay put.
+    """
+    
+    def __init__(self, name, armature, location=(0.0, 0.0, 0.0), frames=48):
+        super().__init__(name, armature, location)
+        self.type = "ARMATURE"
+        action = types.SimpleNamespace(name="Swing", frame_range=(1.0, float(frames)))
+        self.animation_data = types.SimpleNamespace(action=action)
+        self.pose = types.SimpleNamespace(bones=None)
+        self.set_frame(1)
+    
+    def set_frame(self, frame) -> None:
+        bones = self.data.bones
+        rest = [np.asarray(bone.matrix_local) for bone in bones]
+        posed = list()
+        for b, bone in enumerate(bones):
+            # the bone's own motion, in its rest frame
+            motion = np.identity(4)
+            if b % 2:
+                phase = (frame / 24.0) % 1.0
+                angle = 0.5 * (4.0 * abs(phase - 0.5) - 1.0)
+                motion[:2, :2] = [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+            if bone.parent is None:
+                matrix = rest[b] @ motion
+                matrix[0, 3] += 0.01 * frame
+            else:
+                p = bones.index(bone.parent)
+                matrix = posed[p] @ np.linalg.inv(rest[p]) @ rest[b] @ motion
+            posed.append(matrix)
+        # bpy keeps matrices column by column
+        matrices = np.array(posed, dtype=np.float32).reshape(-1, 4, 4).transpose(0, 2, 1)
+        self.pose.bones = Collection(len(bones), matrix=matrices)
+
+
+class Scene(object):
+    def __init__(self, objects):
+        self.objects = list(objects)
+        self.frame_current = 1
+        self.render = types.SimpleNamespace(fps=24, fps_base=1.0)
+        self.display = types.SimpleNamespace(shading=types.SimpleNamespace(background_color=[0.05, 0.05, 0.05]))
+    
+    def frame_set(self, frame, subframe=0.0) -> None:
+        self.frame_current = frame
+        for obj in self.objects:
+            if obj.type == "ARMATURE":
+                obj.set_frame(frame)
+            elif obj.data.shape_keys is not None:
+                obj.data.shape_keys.set_frame(frame)
+
+
+def make_scene(objects=10, tris=1000, duplicates=0.0, materials=1, slots=1, texture_dir=None, colours=False,
+               bones=0, shapes=0, seed=0):
+    """
+    Build a scene with the given number of objects of (about) tris tris each, and return a context for it.
+    A share of the objects (duplicates, 0..1) repeat earlier meshes: every other one as a linked
+    duplicate (same datablock), the rest as copies (same geometry, their own datablock).
+    Objects cycle through the materials, using slots of them each (in bands of tris);
+    with a texture_dir, every material gets an image texture there. colours adds vertex colours to the meshes.
+    With bones, every object is skinned to an armature of its own (a chain of that many bones, where it is).
+    With shapes, every mesh has that many shape keys (see grid_shapes), and an action for them.
+    """
+    data.meshes.clear()
+    data.materials.clear()
+    data.objects.clear()
+    rng = np.random.RandomState(seed)
+    
+    for m in range(max(1, materials)):
+        image_path = None
+        if texture_dir is not None:
+            image_path = os.path.join(texture_dir, "tex_%d.png" % m)
+            if not os.path.isfile(image_path):
+                with open(image_path, mode="wb") as fw:
+                    fw.write(rng.bytes(256 * 1024))
+        data.materials.append(Material("Material_%d" % m, list(rng.uniform(size=3)) + [1.0], image_path))
+    
+    n_unique = max(1, objects - int(round(objects * duplicates)))
+    for o in range(objects):
+        object_materials = [data.materials[(o + s) % len(data.materials)] for s in range(max(1, slots))]
+        if o < n_unique:
+            mesh = grid_mesh("Mesh_%d" % o, tris, seed=seed + o, materials=object_materials, colours=colours,
+                             bones=bones)
+            if shapes:
+                mesh.shape_keys = grid_shapes(mesh.vertices.arrays["co"], shapes, seed=seed + o)
+            data.meshes.append(mesh)
+        else:
+            original = data.objects[(o - n_unique) % n_unique]
+            if o % 2:
+                mesh = original.data
+            else:
+                mesh = original.data.copy("Mesh_%d" % o)
+                data.meshes.append(mesh)
+        data.objects.append(Object("Object_%d" % o, mesh, location=rng.uniform(-100.0, 100.0, 3).tolist()))
+    
+    armatures = list()
+    for obj in data.objects[:objects if bones else 0]:
+        armature = ArmatureObject("Armature_" + obj.name, chain_armature("Armature_" + obj.name, bones), obj.location)
+        armatures.append(armature)
+        obj.armature = armature
+        obj.modifiers.append(types.SimpleNamespace(type='ARMATURE', object=armature))
+        obj.vertex_groups = [types.SimpleNamespace(name="Bone_%d" % b, index=b) for b in range(bones)]
+    data.objects.extend(armatures)
+    
+    depsgraph = types.SimpleNamespace(update=lambda: None)
+    return types.SimpleNamespace(scene=Scene(data.objects), depsgraph=depsgraph, window_manager=None)
+
+
+#
+# ## bmesh, mathutils, bpy_extras ##
+#
+
+
+class BMesh(object):
+    def from_mesh(self, mesh) -> None:
+        pass
+    
+    def to_mesh(self, mesh) -> None:
+        pass
+    
+    def free(self) -> None:
+        pass
+    
+    @property
+    def faces(self):
+        return ()
+
+
+class ProgressReport(object):
+    def __init__(self, wm=None):
+        self.wm = wm
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+    
+    def enter_substeps(self, nbr, msg=""):
+        pass
+    
+    def step(self, msg="", nbr=1):
+        pass
+    
+    def leave_substeps(self, msg=""):
+        pass
+
+
+class ProgressReportSubstep(ProgressReport):
+    pass
+
+
+class Vector(tuple):
+    def __new__(cls, values=(0.0, 0.0, 0.0)):
+        return tuple.__new__(cls, values)
+
+
+class Matrix(tuple):
+    def __new__(cls, rows=((1.0, 0.0, 0.0, 0.0), (0.0, 1.0, 0.0, 0.0), (0.0, 0.0, 1.0, 0.0), (0.0, 0.0, 0.0, 1.0))):
+        return tuple.__new__(cls, (tuple(r) for r in rows))
+
+
+def module(name, **attrs):
+    m = types.ModuleType(name)
+    m.__dict__.update(attrs)
+    sys.modules[name] = m
+    return m
+
+
+def install() -> None:
+    """Register the fake modules in sys.modules (before io_ogre gets imported)"""
+    module("bpy",
+                 data=data,
+                 types=module("bpy.types", Mesh=Mesh, Object=Object, Depsgraph=object, Operator=object),
+                 path=module("bpy.path", abspath=os.path.abspath, basename=os.path.basename),
+                 ops=types.SimpleNamespace(object=types.SimpleNamespace(
+                     mode_set=types.SimpleNamespace(poll=lambda: False))),
+                 )
+    module("bmesh",
+           new=BMesh,
+           ops=types.SimpleNamespace(triangulate=lambda bm, faces=(): {}))
+    module("mathutils", Vector=Vector, Matrix=Matrix)
+    module("bpy_extras")
+    module("bpy_extras.wm_utils")
+    module("bpy_extras.wm_utils.progress_report",
+           ProgressReport=ProgressReport, ProgressReportSubstep=ProgressReportSubstep)
+
+
+def load_addon():
+    """
+    Install the fakes and import the io_ogre package from this checkout.
+    The package __init__ (operator and menu registration) is skipped, the exporter modules import as usual.
+    """
+    install()
+    if "io_ogre" not in sys.modules:
+        package = types.ModuleType("io_ogre")
+        package.__path__ = [ADDON_DIR]
+        package.__package__ = "io_ogre"
+        sys.modules["io_ogre"] = package
+    return sys.modules["io_ogre"]
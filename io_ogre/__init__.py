@@ -21,6 +21,7 @@ import bpy
 from bpy.props import (
         BoolProperty,
         FloatProperty,
+        IntProperty,
         StringProperty,
         EnumProperty
         )
@@ -76,6 +77,257 @@ class BOE_OT_scene_export(bpy.types.Operator, ExportHelper):
             default=True,
             )
     
+    binary_writer: EnumProperty(
+            name="Binary writer",
+            description="how the binary .mesh files are created",
+            items=(('NATIVE', "Native", "serialize .mesh files directly from the exporter"),
+                   ('CONVERTER', "OgreXMLConverter", "write .mesh.xml files and convert them with OgreXMLConverter.exe"),
+                   ),
+            default='NATIVE',
+            )
+    
+    mesh_version: EnumProperty(
+            name="Mesh version",
+            description="binary .mesh format version written by the native writer",
+            items=(('1.100', "v1.100", "Ogre 1.10 and newer"),
+                   ('1.8', "v1.8", "Ogre 1.8 and 1.9"),
+                   ),
+            default='1.100',
+            )
+    
+    keep_xml: BoolProperty(
+            name="Keep .mesh.xml",
+            description="also write .mesh.xml files next to the binaries (for debugging)",
+            default=False,
+            )
+    
+    converter_workers: IntProperty(
+            name="Converter workers",
+            description="OgreXMLConverter processes to run at once (0 uses one per CPU)",
+            min=0, max=64,
+            default=0,
+            )
+    
+    converter_timeout: FloatProperty(
+            name="Converter timeout",
+            description="seconds a single mesh conversion may take before it's killed (0 waits forever)",
+            min=0.0,
+            default=0.0,
+            )
+    
+    converter: StringProperty(
+            name="Converter command",
+            description="command line of the converter to run instead of the bundled OgreXMLConverter.exe "
+                        "(empty: the bundled one)",
+            default="",
+            )
+    
+    use_cache: BoolProperty(
+            name="Incremental export",
+            description="keep a manifest next to the .scene, and skip meshes, materials and textures that didn't change",
+            default=False,
+            )
+    
+    texture_workers: IntProperty(
+            name="Texture copy threads",
+            description="textures copied at once (0 picks a default from the CPU count)",
+            min=0, max=64,
+            default=0,
+            )
+    
+    weld_tolerance: FloatProperty(
+            name="Weld tolerance",
+            description="merge vertices whose attributes differ by less than this (0 welds exact matches only)",
+            min=0.0, max=1.0,
+            default=0.0,
+            precision=6,
+            )
+    
+    use_vectorized: BoolProperty(
+            name="Vectorized extraction",
+            description="pull mesh data in bulk with numpy, instead of loop by loop",
+            default=True,
+            )
+    
+    optimize_vertex_cache: BoolProperty(
+            name="Optimize vertex cache",
+            description="reorder tris for the GPU's post-transform cache, and vertices for fetch locality",
+            default=False,
+            )
+    
+    vertex_cache_size: IntProperty(
+            name="Vertex cache size",
+            description="post-transform cache entries the tri order is optimized for",
+            min=4, max=64,
+            default=16,
+            )
+    
+    split_large_meshes: BoolProperty(
+            name="Split large meshes",
+            description="meshes over 65535 vertices become several 16 bit indexed submeshes, instead of using 32 bit indices",
+            default=False,
+            )
+    
+    lod_levels: IntProperty(
+            name="LOD levels",
+            description="simplified levels of detail to generate per mesh (0 exports full detail only)",
+            min=0, max=8,
+            default=0,
+            )
+    
+    lod_mode: EnumProperty(
+            name="LOD reduction",
+            description="how far every level is simplified",
+            items=(('RATIO', "Ratio", "keep a fixed share of the tris of the level before"),
+                   ('SCREEN', "Screen space error", "simplify as far as the error stays below the pixel error at the level's distance"),
+                   ),
+            default='RATIO',
+            )
+    
+    lod_ratio: FloatProperty(
+            name="LOD ratio",
+            description="share of the tris every level keeps of the one before",
+            min=0.01, max=0.99,
+            default=0.5,
+            )
+    
+    lod_distance: FloatProperty(
+            name="LOD distance",
+            description="distance the first level switches in at; every next level at twice the distance",
+            min=0.0,
+            default=25.0,
+            )
+    
+    lod_pixel_error: FloatProperty(
+            name="LOD pixel error",
+            description="error (in pixels at 1080p, 60 degrees fov) a level may show at its distance",
+            min=0.01,
+            default=1.0,
+            )
+    
+    export_colours: BoolProperty(
+            name="Vertex colours",
+            description="write the active vertex colour layer (as RGBA bytes)",
+            default=False,
+            )
+    
+    pack_normals: BoolProperty(
+            name="Packed normals",
+            description="normals and tangents as signed normalized bytes, with the binormal folded into the tangent's w (native writer, mesh version 1.100)",
+            default=False,
+            )
+    
+    half_float_uvs: BoolProperty(
+            name="Half float UVs",
+            description="texture coordinates as 16 bit floats (native writer, mesh version 1.100)",
+            default=False,
+            )
+    
+    static_batching: BoolProperty(
+            name="Static batching",
+            description="merge static objects (no animation, no armature) per material and cell into batches with their transforms baked in, instead of a node per object",
+            default=False,
+            )
+    
+    batch_cell_size: FloatProperty(
+            name="Batch cell size",
+            description="size of the grid cells objects are batched in (by their centre)",
+            min=0.01,
+            default=50.0,
+            )
+    
+    batch_max_vertices: IntProperty(
+            name="Batch max vertices",
+            description="vertices a batch may have; bigger batches are cut, bigger objects keep their own node",
+            min=256, max=1000000,
+            default=65535,
+            )
+    
+    scene_chunks: EnumProperty(
+            name="Scene chunks",
+            description="split the nodes into a .scene per cell (by their world bounds), with an index of the cells' bounds to stream them by",
+            items=(('NONE', "None", "one .scene with every node"),
+                   ('GRID', "Grid", "a chunk per cell of a uniform grid"),
+                   ('OCTREE', "Octree", "split the scene's bounds until a cell has few enough nodes"),
+                   ),
+            default='NONE',
+            )
+    
+    chunk_cell_size: FloatProperty(
+            name="Chunk cell size",
+            description="size of the grid cells",
+            min=0.01,
+            default=100.0,
+            )
+    
+    chunk_max_nodes: IntProperty(
+            name="Chunk max nodes",
+            description="nodes an octree cell may have before it's split",
+            min=1,
+            default=256,
+            )
+    
+    instancing: BoolProperty(
+            name="Instancing",
+            description="objects sharing a mesh (and materials) often enough become one instance group with a transform table, instead of an entity each",
+            default=False,
+            )
+    
+    instance_min_count: IntProperty(
+            name="Instance min count",
+            description="objects a mesh needs to become an instance group",
+            min=2,
+            default=8,
+            )
+    
+    instance_technique: EnumProperty(
+            name="Instancing technique",
+            description="Ogre InstanceManager technique the runtime should create the groups with",
+            items=(('HWInstancingBasic', "HW basic", "hardware instancing, transforms in a vertex buffer"),
+                   ('HWInstancingVTF', "HW VTF", "hardware instancing, transforms in a vertex texture"),
+                   ('ShaderBased', "Shader based", "transforms as shader constants, no hardware instancing needed"),
+                   ),
+            default='HWInstancingBasic',
+            )
+    
+    keyframe_tolerance: FloatProperty(
+            name="Keyframe tolerance",
+            description="how far (in units, and in scale) animation keyframe reduction may move a bone from its sampled pose "
+                        "(or a shape key from its sampled value)",
+            min=0.0,
+            default=0.001,
+            )
+    
+    keyframe_angle: FloatProperty(
+            name="Keyframe angle",
+            description="how far (in degrees) animation keyframe reduction may turn a bone from its sampled pose",
+            min=0.0, max=45.0,
+            default=0.1,
+            )
+    
+    pose_threshold: FloatProperty(
+            name="Pose threshold",
+            description="how far (in units) a shape key has to move a vertex, for the vertex to be in its pose",
+            min=0.0,
+            default=0.0001,
+            )
+    
+    log_level: EnumProperty(
+            name="Log level",
+            description="how much the exporter reports to the console",
+            items=(('WARNING', "Warnings", "only problems"),
+                   ('INFO', "Info", "summaries: timings, memory, cache and texture reports"),
+                   ('DEBUG', "Debug", "everything, per object (slow on big scenes)"),
+                   ),
+            default='INFO',
+            )
+    
+    write_profile: BoolProperty(
+            name="Write profile",
+            description="write per phase timings and counters to a .profile.json next to the .scene (opens in chrome://tracing)",
+            default=False,
+            )
+    
     def execute(self, context):
         from . import ogre_export
         
@@ -1,7 +1,11 @@
 import os
-import subprocess
+import math
 import inspect
-import shutil
+import json
+import shlex
+import logging
+
+import numpy as np
 
 # from mathutils import Matrix, Vector, Color
 # from bpy_extras import io_utils, node_shader_utils
@@ -12,6 +16,20 @@ from bpy_extras.wm_utils.progress_report import (ProgressReport, ProgressReportS
 from . import ogre_types
 from . import zxml
 from . import zmat
+from . import zmesh
+from . import zgeom
+from . import zconvert
+from . import zprof
+from . import zcache
+from . import ztexture
+from . import zlod
+from . import zbatch
+from . import zchunk
+from . import zskel
+from . import zpose
+
+
+log = logging.getLogger(__name__)
 
 
 #
@@ -27,6 +45,326 @@ def name_convert(name) -> str:
         return name.replace(' ', '_')
 
 
+def mesh_outputs(path_mesh, BINARY, write_xml) -> list:
+    """Files written for a mesh"""
+    outputs = list()
+    if write_xml:
+        outputs.append(path_mesh + ".xml")
+    if BINARY:
+        outputs.append(path_mesh)
+    return outputs
+
+
+def vector_string(v) -> str:
+    """A vector as ogre's StringConverter parses it (x y z, space separated)"""
+    return " ".join("%f" % c for c in v)
+
+
+def count_written(*filepaths) -> None:
+    """Add the size of written files to the profiler's byte counter"""
+    zprof.count("bytes_written", sum(os.path.getsize(f) for f in filepaths))
+
+
+#
+# ## Xml writers (streamed, see zxml.XMLwriter) ##
+#
+
+
+def write_scene_xml(filepath, og_scene, path_material=None, nodes=None, environment=True) -> None:
+    """
+    Write the .scene, node by node; nodes picks the nodes to write (all of the scene's by default).
+    Without environment, the scene wide parts (instance groups, environment) are left out.
+    """
+    
+    if nodes is None:
+        nodes = og_scene.nodes
+    
+    with zxml.XMLwriter(filepath) as xw:
+        xw.open("scene", {
+                "export_time": og_scene.export_time,
+                "exported_by": og_scene.exported_by,
+                "formatVersion": og_scene.formatVersion,
+                "previous_export_time": og_scene.previous_export_time
+                })
+        
+        xw.open("nodes", {})
+        for node in nodes:
+            xw.open("node", {"name": node.name})
+            xw.leaf("position", node.posd)
+            xw.leaf("rotation", node.quad)
+            xw.leaf("scale", node.scaled)
+            xw.open("game", {})
+            xw.leaf("sensors", {})
+            xw.leaf("actuators", {})
+            xw.close()
+            xw.leaf("entity", node.ent_dict)
+            if node.bounds is not None:
+                # the mesh's bounds, for culling structures built without loading the mesh
+                lo, hi, radius = node.bounds
+                xw.open("userData", {})
+                xw.leaf("property", {"type": "str", "name": "meshBoundsMin", "data": vector_string(lo)})
+                xw.leaf("property", {"type": "str", "name": "meshBoundsMax", "data": vector_string(hi)})
+                xw.leaf("property", {"type": "float", "name": "meshBoundingRadius", "data": radius})
+                xw.close()
+            if node.aabb is not None:
+                xw.open("worldBounds", {} if node.radius is None else {"radius": node.radius})
+                xw.leaf("min", dict(zip("xyz", node.aabb[0].tolist())))
+                xw.leaf("max", dict(zip("xyz", node.aabb[1].tolist())))
+                xw.close()
+            xw.close()
+        
+        if environment:
+            for group in og_scene.instance_groups:
+                xw.open("instancegroup", {
+                        "name": group.name,
+                        "meshFile": group.meshfile,
+                        "count": group.count,
+                        "technique": group.technique,
+                        "transforms": group.transforms,
+                        # row major 3x4 float32 matrices, little endian
+                        "transformFormat": "float3x4"
+                        })
+                if group.aabb is not None:
+                    xw.leaf("min", dict(zip("xyz", group.aabb[0].tolist())))
+                    xw.leaf("max", dict(zip("xyz", group.aabb[1].tolist())))
+                xw.close()
+        
+        # NOTE: externals and environment stay inside <nodes>, like the graph based writer had them
+        if path_material is not None:
+            xw.open("externals", {})
+            xw.open("item", {"type": "material"})
+            xw.leaf("file", {"name": path_material})
+            xw.close()
+            xw.close()
+        
+        if not environment:
+            return
+        
+        xw.open("environment", {})
+        col = og_scene.colourAmbient
+        xw.leaf("colourAmbient", {"r": col[0], "g": col[1], "b": col[2]})
+        col = og_scene.colourBackground
+        xw.leaf("colourBackground", {"r": col[0], "g": col[1], "b": col[2]})
+        col = og_scene.colourDiffuse
+        xw.leaf("colourDiffuse", {"r": col[0], "g": col[1], "b": col[2]})
+        
+        # and the rest is closed by the writer
+
+
+def write_chunk_index(filepath, chunks, files, mode, cell_size=100.0, max_nodes=256) -> None:
+    """Write the index of a chunked scene: file, node count and bounds of every chunk (see zchunk)"""
+    
+    with zxml.XMLwriter(filepath) as xw:
+        if mode == "OCTREE":
+            xw.open("sceneindex", {"mode": mode, "maxNodes": max_nodes, "chunks": len(chunks)})
+        else:
+            xw.open("sceneindex", {"mode": mode, "cellSize": cell_size, "chunks": len(chunks)})
+        for chunk, path_chunk in zip(chunks, files):
+            xw.open("chunk", {"name": chunk.name, "file": os.path.basename(path_chunk), "nodes": len(chunk.nodes)})
+            xw.leaf("min", dict(zip("xyz", chunk.lo.tolist())))
+            xw.leaf("max", dict(zip("xyz", chunk.hi.tolist())))
+            xw.close()
+
+
+def write_geometry_xml(xw, name, geometry, vertex_format) -> None:
+    """Write a <sharedgeometry> or <geometry> block, with the elements of a (zmesh.VertexFormat) vertex format"""
+    xw.open(name, {"vertexcount": geometry.vertexcount})
+    xw.open("vertexbuffer", {
+            "binormals": not vertex_format.packed,
+            "colours_diffuse": vertex_format.colours,
+            "normals": True,
+            "positions": True,
+            "tangent_dimensions": 4 if vertex_format.packed else 3,
+            "tangents": True,
+            "texture_coords": 1
+            })
+    
+    # (xml element, keys, vertex format column) per vertex element
+    children = [("position", ("x", "y", "z"), "position"),
+                ("normal", ("x", "y", "z"), "normal")]
+    if vertex_format.colours:
+        children.append(("colour_diffuse", ("value", ), "colour"))
+    children.append(("texcoord", ("u", "v"), "texcoord"))
+    if vertex_format.packed:
+        children.append(("tangent", ("x", "y", "z", "w"), "tangent"))
+    else:
+        children.append(("tangent", ("x", "y", "z"), "tangent"))
+        children.append(("binormal", ("x", "y", "z"), "binormal"))
+    
+    # Vertices
+    columns = vertex_format.columns(geometry)
+    xw.nodes("vertex", [(element, keys) for element, keys, column in children],
+             zgeom.iter_rows([columns[column] for element, keys, column in children]))
+    xw.close()
+    xw.close()
+
+
+def write_bone_assignments_xml(xw, geometry) -> None:
+    """Write the <boneassignments> of a skinned geometry, an element per influence"""
+    xw.open("boneassignments", {})
+    xw.leaves("vertexboneassignment", ("vertexindex", "boneindex", "weight"),
+              zgeom.iter_rows(geometry.bone_assignments()))
+    xw.close()
+
+
+def write_poses_xml(xw, poses, pose_animations) -> None:
+    """Write the <poses> (a zpose.Pose list), and the <animations> of them"""
+    xw.open("poses", {})
+    for pose in poses:
+        xw.open("pose", {"target": "mesh" if pose.target == 0 else "submesh", "index": max(0, pose.target - 1),
+                         "name": pose.name})
+        xw.leaves("poseoffset", ("index", "x", "y", "z"),
+                  zgeom.iter_rows([pose.indices, pose.offsets[:, 0], pose.offsets[:, 1], pose.offsets[:, 2]]))
+        xw.close()
+    xw.close()
+    
+    if not pose_animations:
+        return
+    xw.open("animations", {})
+    for animation in pose_animations:
+        xw.open("animation", {"name": animation.name, "length": animation.length})
+        xw.open("tracks", {})
+        for target, keyframes in animation.tracks(poses):
+            xw.open("track", {"target": "mesh" if target == 0 else "submesh", "index": max(0, target - 1),
+                              "type": "pose"})
+            xw.open("keyframes", {})
+            for time, refs in keyframes:
+                xw.open("keyframe", {"time": time})
+                xw.leaves("poseref", ("poseindex", "influence"), refs)
+                xw.close()
+            xw.close()
+            xw.close()
+        xw.close()
+        xw.close()
+    xw.close()
+
+
+def write_mesh_xml(filepath, og_mesh, geometry, submeshes, lod_values=[], lod_strategy="distance_sphere",
+                   vertex_format=None, poses=[]) -> None:
+    """
+    Write a .mesh.xml, streaming vertices and faces from the geometry arrays.
+    geometry is the shared geometry (or None), submeshes a list of zgeom.Submesh (see Mesh.build_submeshes).
+    lod_values are the usage distances of the generated LOD levels in every submesh's lods.
+    vertex_format is a zmesh.VertexFormat; the xml only has floats, so it's written unquantized.
+    poses are the zpose.Pose list of those geometries (see Mesh.build_poses), animated by og_mesh.pose_animations.
+    """
+    
+    if vertex_format is None:
+        vertex_format = zmesh.VertexFormat(colours=og_mesh.has_colours)
+    vertex_format = zmesh.VertexFormat(vertex_format.packed, vertex_format.half_uvs, vertex_format.colours,
+                                       quantized=False)
+    
+    with zxml.XMLwriter(filepath) as xw:
+        # Roots
+        xw.open("mesh", {})
+        if geometry is not None:
+            write_geometry_xml(xw, "sharedgeometry", geometry, vertex_format)
+        
+        xw.open("submeshes", {})
+        for submesh in submeshes:
+            xw.open("submesh", {
+                    "material": submesh.material,
+                    "operationtype": "triangle_list",
+                    "use32bitindexes": str(submesh.use32bitindexes(geometry)),
+                    "usesharedvertices": "true" if submesh.geometry is None else "false"
+                    })
+            xw.open("faces", {"count": len(submesh.indices)})
+            
+            # Tris
+            xw.leaves("face", ("v1", "v2", "v3"), submesh.iter_faces())
+            xw.close()
+            
+            if submesh.geometry is not None:
+                write_geometry_xml(xw, "geometry", submesh.geometry, vertex_format)
+                if submesh.geometry.bone_weights is not None:
+                    write_bone_assignments_xml(xw, submesh.geometry)
+            xw.close()
+        xw.close()
+        
+        if og_mesh.skeleton is not None:
+            xw.leaf("skeletonlink", {"name": og_mesh.skeleton.filename})
+            if geometry is not None:
+                write_bone_assignments_xml(xw, geometry)
+        
+        if lod_values:
+            xw.open("levelofdetail", {"strategy": lod_strategy, "numlevels": len(lod_values) + 1, "manual": "false"})
+            for level, value in enumerate(lod_values):
+                xw.open("lodgenerated", {"value": value})
+                for index, submesh in enumerate(submeshes):
+                    faces = submesh.lods[level]
+                    xw.open("lodfacelist", {"submeshindex": index, "numfaces": len(faces)})
+                    xw.leaves("face", ("v1", "v2", "v3"), zgeom.iter_tris(faces))
+                    xw.close()
+                xw.close()
+            xw.close()
+        
+        xw.open("submeshnames", {})
+        for index, submesh in enumerate(submeshes):
+            xw.leaf("submesh", {"index": index, "name": submesh.material})
+        xw.close()
+        
+        if poses:
+            write_poses_xml(xw, poses, og_mesh.pose_animations)
+        
+        if og_mesh.bounds is not None:
+            # not read by the converter (it computes its own), but by tools that only need the bounds
+            lo, hi, radius = og_mesh.bounds
+            xw.open("bounds", {"radius": radius})
+            xw.leaf("min", dict(zip("xyz", lo.tolist())))
+            xw.leaf("max", dict(zip("xyz", hi.tolist())))
+            xw.close()
+
+
+def write_skeleton_xml(filepath, og_skeleton) -> None:
+    """Write a .skeleton.xml: the bones' rest pose relative to their parents, and the hierarchy"""
+    angles, axes = zskel.angle_axis(og_skeleton.rotations)
+    
+    with zxml.XMLwriter(filepath) as xw:
+        xw.open("skeleton", {"blendmode": "average"})
+        
+        xw.open("bones", {})
+        for bone in og_skeleton.bones:
+            handle = bone.handle
+            xw.open("bone", {"id": handle, "name": bone.name})
+            xw.leaf("position", dict(zip("xyz", og_skeleton.positions[handle].tolist())))
+            xw.open("rotation", {"angle": float(angles[handle])})
+            xw.leaf("axis", dict(zip("xyz", axes[handle].tolist())))
+            xw.close()
+            xw.leaf("scale", dict(zip("xyz", og_skeleton.scales[handle].tolist())))
+            xw.close()
+        xw.close()
+        
+        xw.open("bonehierarchy", {})
+        for bone in og_skeleton.bones:
+            if bone.parent is not None:
+                xw.leaf("boneparent", {"bone": bone.name, "parent": og_skeleton.bones[bone.parent].name})
+        xw.close()
+        
+        if og_skeleton.animations:
+            xw.open("animations", {})
+            for animation in og_skeleton.animations:
+                xw.open("animation", {"name": animation.name, "length": animation.length})
+                xw.open("tracks", {})
+                for track in animation.tracks:
+                    angles, axes = zskel.angle_axis(track.rotates)
+                    xw.open("track", {"bone": og_skeleton.bones[track.handle].name})
+                    xw.open("keyframes", {})
+                    for time, translate, angle, axis, scale in zgeom.iter_rows([track.times, track.translates,
+                                                                                  angles, axes, track.scales]):
+                        xw.open("keyframe", {"time": time})
+                        xw.leaf("translate", dict(zip("xyz", translate)))
+                        xw.open("rotate", {"angle": angle})
+                        xw.leaf("axis", dict(zip("xyz", axis)))
+                        xw.close()
+                        xw.leaf("scale", dict(zip("xyz", scale)))
+                        xw.close()
+                    xw.close()
+                    xw.close()
+                xw.close()
+                xw.close()
+            xw.close()
+
+
 #
 # ## Save ##
 #
@@ -39,7 +377,42 @@ def save(context,
          export_animation,
          export_physics,
          export_materials,
-         do_binary
+         do_binary,
+         weld_tolerance=0.0,
+         use_vectorized=True,
+         binary_writer='NATIVE',
+         mesh_version='1.100',
+         keep_xml=False,
+         converter_workers=0,
+         converter_timeout=0.0,
+         converter="",
+         use_cache=False,
+         texture_workers=0,
+         log_level='INFO',
+         write_profile=False,
+         optimize_vertex_cache=False,
+         vertex_cache_size=16,
+         split_large_meshes=False,
+         lod_levels=0,
+         lod_mode='RATIO',
+         lod_ratio=0.5,
+         lod_distance=25.0,
+         lod_pixel_error=1.0,
+         export_colours=False,
+         pack_normals=False,
+         half_float_uvs=False,
+         static_batching=False,
+         batch_cell_size=50.0,
+         batch_max_vertices=65535,
+         scene_chunks='NONE',
+         chunk_cell_size=100.0,
+         chunk_max_nodes=256,
+         instancing=False,
+         instance_min_count=8,
+         instance_technique='HWInstancingBasic',
+         keyframe_tolerance=0.001,
+         keyframe_angle=0.1,
+         pose_threshold=0.0001
          ) -> set:
     """
     The main function called from __init__.py to save the scene
@@ -48,15 +421,62 @@ def save(context,
     import time
     time_start = time.time()
     
-    write_loop(context, filepath,
-               ARMATURE=export_armature,
-               ANIMATION=export_animation,
-               PHYSICS=export_physics,
-               MATERIALS=export_materials,
-               BINARY=do_binary
-               )
+    zprof.setup_logging(log_level)
     
-    print("BOE finished: %.4f sec" % (time.time() - time_start))
+    with zprof.Profiler() as profiler:
+        with zprof.span("export"):
+            mem_report = write_loop(context, filepath,
+                                    ARMATURE=export_armature,
+                                    ANIMATION=export_animation,
+                                    PHYSICS=export_physics,
+                                    MATERIALS=export_materials,
+                                    BINARY=do_binary,
+                                    WELD_TOLERANCE=weld_tolerance,
+                                    VECTORIZED=use_vectorized,
+                                    BINARY_WRITER=binary_writer,
+                                    MESH_VERSION=mesh_version,
+                                    KEEP_XML=keep_xml,
+                                    CONVERTER_WORKERS=converter_workers,
+                                    CONVERTER_TIMEOUT=converter_timeout,
+                                    CONVERTER=converter,
+                                    USE_CACHE=use_cache,
+                                    TEXTURE_WORKERS=texture_workers,
+                                    VERTEX_CACHE=optimize_vertex_cache,
+                                    VERTEX_CACHE_SIZE=vertex_cache_size,
+                                    SPLIT_LARGE=split_large_meshes,
+                                    LOD_LEVELS=lod_levels,
+                                    LOD_MODE=lod_mode,
+                                    LOD_RATIO=lod_ratio,
+                                    LOD_DISTANCE=lod_distance,
+                                    LOD_PIXEL_ERROR=lod_pixel_error,
+                                    COLOURS=export_colours,
+                                    PACK_NORMALS=pack_normals,
+                                    HALF_UVS=half_float_uvs,
+                                    STATIC_BATCH=static_batching,
+                                    BATCH_CELL_SIZE=batch_cell_size,
+                                    BATCH_MAX_VERTICES=batch_max_vertices,
+                                    SCENE_CHUNKS=scene_chunks,
+                                    CHUNK_CELL_SIZE=chunk_cell_size,
+                                    CHUNK_MAX_NODES=chunk_max_nodes,
+                                    INSTANCING=instancing,
+                                    INSTANCE_MIN_COUNT=instance_min_count,
+                                    INSTANCE_TECHNIQUE=instance_technique,
+                                    KEYFRAME_TOLERANCE=keyframe_tolerance,
+                                    KEYFRAME_ANGLE=keyframe_angle,
+                                    POSE_THRESHOLD=pose_threshold
+                                    )
+    
+    log.info("finished: %.4f sec", time.time() - time_start)
+    for line in profiler.lines():
+        log.info("profile: %s", line)
+    for line in mem_report.lines():
+        log.info("memory: %s", line)
+    
+    if write_profile:
+        # json report, that chrome://tracing (or Perfetto) opens as a trace, too
+        path_profile = os.path.splitext(filepath)[0] + ".profile.json"
+        profiler.write_json(path_profile, memory=mem_report.stages)
+        log.info("profile written to %s", path_profile)
     
     # Return finished state; if we had errors, it would yield a traceback anyway.
     return {'FINISHED'}
@@ -72,12 +492,48 @@ def write_loop(context, filepath,
                ANIMATION,
                PHYSICS,
                MATERIALS,
-               BINARY
-               ) -> None:
+               BINARY,
+               WELD_TOLERANCE=0.0,
+               VECTORIZED=True,
+               BINARY_WRITER='NATIVE',
+               MESH_VERSION='1.100',
+               KEEP_XML=False,
+               CONVERTER_WORKERS=0,
+               CONVERTER_TIMEOUT=0.0,
+               CONVERTER="",
+               USE_CACHE=False,
+               TEXTURE_WORKERS=0,
+               VERTEX_CACHE=False,
+               VERTEX_CACHE_SIZE=16,
+               SPLIT_LARGE=False,
+               LOD_LEVELS=0,
+               LOD_MODE='RATIO',
+               LOD_RATIO=0.5,
+               LOD_DISTANCE=25.0,
+               LOD_PIXEL_ERROR=1.0,
+               COLOURS=False,
+               PACK_NORMALS=False,
+               HALF_UVS=False,
+               STATIC_BATCH=False,
+               BATCH_CELL_SIZE=50.0,
+               BATCH_MAX_VERTICES=65535,
+               SCENE_CHUNKS='NONE',
+               CHUNK_CELL_SIZE=100.0,
+               CHUNK_MAX_NODES=256,
+               INSTANCING=False,
+               INSTANCE_MIN_COUNT=8,
+               INSTANCE_TECHNIQUE='HWInstancingBasic',
+               KEYFRAME_TOLERANCE=0.001,
+               KEYFRAME_ANGLE=0.1,
+               POSE_THRESHOLD=zpose.OFFSET_THRESHOLD
+               ) -> zprof.MemoryReport:
     """
     Func for looping write calls + setting up env for writing
+    Returns the memory used per stage.
     """
     
+    mem_report = zprof.MemoryReport()
+    
     with ProgressReport(context.window_manager) as progress:
         base_name, ext = os.path.splitext(filepath)
         # base_name = name_convert(base_name) << this 'ere probably causes problems with windows.
@@ -87,17 +543,47 @@ def write_loop(context, filepath,
         bpy_depsgraph = context.depsgraph
         bpy_scene = context.scene
         
+        # the xml is only needed by the converter, or for debugging
+        write_xml = (not BINARY) or (BINARY_WRITER == 'CONVERTER') or KEEP_XML
+        
+        # incremental export: the manifest of the last export (with these options) tells what's still good
+        cache = None
+        if USE_CACHE:
+            cache = zcache.ExportCache(base_name + ".boecache.json", {
+                                       "ARMATURE": ARMATURE,
+                                       "ANIMATION": ANIMATION,
+                                       "BINARY": BINARY,
+                                       "WELD_TOLERANCE": WELD_TOLERANCE,
+                                       "VECTORIZED": VECTORIZED,
+                                       "BINARY_WRITER": BINARY_WRITER,
+                                       "MESH_VERSION": MESH_VERSION,
+                                       "KEEP_XML": KEEP_XML,
+                                       "VERTEX_CACHE": VERTEX_CACHE and VERTEX_CACHE_SIZE,
+                                       "SPLIT_LARGE": SPLIT_LARGE,
+                                       "LOD": LOD_LEVELS and (LOD_LEVELS, LOD_MODE, LOD_RATIO,
+                                                              LOD_DISTANCE, LOD_PIXEL_ERROR),
+                                       "COLOURS": COLOURS,
+                                       "PACK_NORMALS": PACK_NORMALS,
+                                       "HALF_UVS": HALF_UVS,
+                                       "STATIC_BATCH": STATIC_BATCH and (BATCH_CELL_SIZE, BATCH_MAX_VERTICES)
+                                       })
+            cache.load()
+        
         # Dirty (!) fix for the 'object with/ mesh' problem
         tmp_bo = list()
         bpy_objects = bpy_scene.objects
-        for tmp_obj in bpy_objects:
-            print(str(type(tmp_obj.data)))
-            print(type(tmp_obj.data))
-            if (str(type(tmp_obj.data)) == "<class 'bpy_types.Mesh'>"):
-                tmp_bo.append(tmp_obj)
-            tmp_obj = None
+        # checked once, so the loop pays nothing for disabled debug output
+        debug = log.isEnabledFor(logging.DEBUG)
+        with zprof.span("filter"):
+            for tmp_obj in bpy_objects:
+                if debug:
+                    log.debug("object %s: %s", tmp_obj.name, type(tmp_obj.data))
+                if isinstance(tmp_obj.data, bpy.types.Mesh):
+                    tmp_bo.append(tmp_obj)
+                tmp_obj = None
         bpy_objects = tmp_bo
         tmp_bo = None
+        zprof.count("objects", len(bpy_objects))
         
         if not len(bpy_objects):
             raise Exception("There is nothing to export.")
@@ -117,144 +603,322 @@ def write_loop(context, filepath,
         og_scene = ogre_types.Scene(bpy_scene)
         og_meshes = dict()
         og_materials = dict()
-        # og_armatures = dict()
+        # path_skeleton -> Skeleton, one per armature deforming the exported meshes (and the armature)
+        og_skeletons = dict()
+        skeleton_armatures = dict()
+        # (shape keys, Mesh) of the meshes exported with poses, for their pose animations
+        shape_meshes = list()
         
         path_scene = ""
         path_mesh = ""
         
-        bpy_exported_meshes = dict()
+        # duplicate guards: (datablock pointer, material name) and geometry fingerprint -> path_mesh
+        shared_meshes = dict()
+        fingerprint_meshes = dict()
+        # path_mesh -> Mesh (None if the cached files are still good)
         og_exported_meshes = dict()
+        # path_mesh -> fingerprint, for the cache
+        mesh_hashes = dict()
+        
+        # static objects are merged into batches (with their transforms baked in), instead of getting nodes
+        batcher = zbatch.StaticBatcher(BATCH_CELL_SIZE, BATCH_MAX_VERTICES) if STATIC_BATCH else None
+        # path_mesh -> Mesh of the batched objects whose files were cached (batching needs the geometry)
+        batch_sources = dict()
+        # path_mesh -> local AABB (min, max) and bounding radius, for the nodes' (world) bounds
+        mesh_bounds = dict()
+        # path_mesh -> [(node, world matrix)], the candidates for instance groups
+        instance_nodes = dict()
+        
+        # the armature deforming every object, if skeletons are exported
+        obj_armatures = {obj.name: obj.find_armature() if ARMATURE else None for obj in bpy_objects}
+        armatures = list({armature.name: armature for armature in obj_armatures.values()
+                          if armature is not None}.values())
         
         # progress: number of objects to export
         progress.enter_substeps(len(bpy_objects))
+        mem_report.stage("collect")
         
-        # iterate through our objects
-        for obj in bpy_objects:
-            # !! "dependancies"
-            mesh_name = str(obj.data.name)
-            
-            material = obj.active_material
-            if material is None:
+        # armatures evaluate in their rest pose, the bind pose of the skeletons;
+        # with poses, shape keys in their basis, the shape the poses are offsets from
+        with ogre_types.rest_pose(armatures, bpy_depsgraph), \
+                ogre_types.basis_shapes(bpy_objects if ANIMATION else [], bpy_depsgraph):
+            # iterate through our objects
+            for obj in bpy_objects:
+                # !! "dependancies"
+                mesh_name = str(obj.data.name)
+                
+                # every material the object references; there's a submesh per material
+                slot_materials = ogre_types.slot_materials(obj)
+                materials = [m for m in slot_materials if m is not None]
+                if not len(materials):
+                    raise ReferenceError("Material not found. Do your objects have materials, that use nodes?")
+                
+                # the mesh depends on the materials of all slots (in slot order)
+                material_key = "\n".join(m.name if m is not None else "" for m in slot_materials)
+                
+                # !! calculate paths
+                # basically adding the parts of full_path together
+                path_scene = full_path[0] + full_path[1] + full_path[2] + full_path[3]
+                path_mesh = full_path[0] + full_path[1] + full_path[2] + "_" + mesh_name + ".mesh"
+                path_material = full_path[0] + full_path[1] + full_path[2] + ".material"
+                
+                # !! Skeleton
+                skeleton = None
+                armature = obj_armatures[obj.name]
+                if armature is not None:
+                    path_skeleton = full_path[0] + full_path[1] + full_path[2] + "_" + armature.name + ".skeleton"
+                    skeleton = og_skeletons.get(path_skeleton)
+                    if skeleton is None:
+                        with zprof.span("skeleton", armature=armature.name):
+                            skeleton = og_skeletons[path_skeleton] = ogre_types.Skeleton(armature, obj)
+                        skeleton.filename = os.path.basename(path_skeleton)
+                        skeleton_armatures[path_skeleton] = armature
+                    elif not skeleton.same_space(armature, obj):
+                        log.warning("%s: placed unlike the other meshes of %s, its skin won't line up with %s",
+                                    obj.name, armature.name, skeleton.filename)
+                    # the weights live in the mesh datablock: skinned meshes only share it, not equal geometry
+                    material_key += "\n" + skeleton.filename + "\n" + obj.data.name
+                
+                # the shape keys too (and the fingerprint doesn't cover them)
+                posed = ANIMATION and obj.data.shape_keys is not None
+                if posed:
+                    material_key += "\n" + obj.data.name
+                
+                # !! Mesh
+                # MESH EXPORT GUARD
+                found = False
+                batched = batcher is not None and ogre_types.is_static(obj)
+                
+                # every object is evaluated (at most) once; the same temp mesh serves the guard and the extraction
+                tmp_mesh = None
                 try:
-                    material = obj.material_slots.values()[0].material
-                except ReferenceError("Material not found. Do your objects have materials, that use nodes?") as e:
-                    raise e
-            
-            material_name = material.name
-            # skeleton_name =
-            
-            # !! calculate paths
-            # basically adding the parts of full_path together
-            path_scene = full_path[0] + full_path[1] + full_path[2] + full_path[3]
-            path_mesh = full_path[0] + full_path[1] + full_path[2] + "_" + mesh_name + ".mesh"
-            path_material = full_path[0] + full_path[1] + full_path[2] + ".material"
-            # path_armature = full_path[0] + full_path[1] + full_path[2] + "_" + skeleton_name + ".skeleton"
-            
-            # !! Mesh
-            # MESH EXPORT GUARD
-            tmp_mesh = obj.to_mesh(bpy_depsgraph, True)
-            cur_mesh = None
-            
-            # for each mesh in the exported meshes (and materials)
-            for key_path_mesh in bpy_exported_meshes:
-                # we get the (already done) mesh data and material name (unique ID)
-                cmp_mesh, cmp_mat = bpy_exported_meshes[key_path_mesh]
-                # if we find that both match the current object's (dupli obj)
-                if (cmp_mesh.unit_test_compare(mesh=tmp_mesh) == "Same") and (cmp_mat == material_name):
-                    # then we redirect to said (already exported) mesh data
-                    path_mesh = key_path_mesh
-                    cur_mesh = og_exported_meshes[key_path_mesh]
-                    # modify mesh_name here to avoid problems with nodes in .scene
-                    junk, mesh_name = os.path.split(path_mesh)
-            
-            # if we DIDN'T find a siutable (duplicate) datablock
-            if cur_mesh is None:
-                # we put the current contender into the 'exported' container (along with its material)
-                bpy_exported_meshes[path_mesh] = tmp_mesh, material_name
-                # then get it's data. we need data.
-                og_exported_meshes[path_mesh] = cur_mesh = ogre_types.Mesh(obj, bpy_depsgraph, ARMATURE, ANIMATION)
+                    # shared datablock without modifiers: it evaluates to the same mesh, no geometry work needed
+                    shared_key = (obj.data.as_pointer(), material_key)
+                    if not len(obj.modifiers) and shared_key in shared_meshes:
+                        path_mesh = shared_meshes[shared_key]
+                        found = True
+                    else:
+                        # otherwise look the evaluated geometry (and material) up in the fingerprint index
+                        with zprof.span("evaluate", object=obj.name):
+                            tmp_mesh = obj.to_mesh(bpy_depsgraph, True)
+                        with zprof.span("fingerprint"):
+                            fingerprint = ogre_types.mesh_fingerprint(tmp_mesh, material_key)
+                        if fingerprint in fingerprint_meshes:
+                            # then we redirect to said (already exported) mesh data
+                            path_mesh = fingerprint_meshes[fingerprint]
+                            found = True
+                    
+                    # if we DIDN'T find a siutable (duplicate) datablock
+                    if not found:
+                        # we index the current contender (along with its material)
+                        fingerprint_meshes[fingerprint] = path_mesh
+                        mesh_hashes[path_mesh] = fingerprint
+                        
+                        # the fingerprint doesn't cover the weights, skinned meshes are always written
+                        if (cache is not None and not batched and skeleton is None and not posed and
+                                cache.fresh(mesh_outputs(path_mesh, BINARY, write_xml), fingerprint)):
+                            # unchanged since the last export, the files on disk are still good
+                            og_exported_meshes[path_mesh] = None
+                        else:
+                            # then get it's data. we need data.
+                            with zprof.span("extract", mesh=mesh_name):
+                                og_mesh = ogre_types.Mesh(obj, bpy_depsgraph, ARMATURE, ANIMATION,
+                                                          WELD_TOLERANCE=WELD_TOLERANCE,
+                                                          VECTORIZED=VECTORIZED,
+                                                          COLOURS=COLOURS,
+                                                          bpymesh=tmp_mesh,
+                                                          skeleton=skeleton,
+                                                          POSE_THRESHOLD=POSE_THRESHOLD)
+                            og_exported_meshes[path_mesh] = og_mesh
+                            if og_mesh.skin_stats is not None:
+                                log.info("%s: %d bone influences (%d culled under %.2f), %d vertices clamped to %d, "
+                                         "%d unweighted", mesh_name, og_mesh.skin_stats["influences"],
+                                         og_mesh.skin_stats["culled"], zskel.WEIGHT_THRESHOLD,
+                                         og_mesh.skin_stats["clamped"], zskel.MAX_INFLUENCES,
+                                         og_mesh.skin_stats["unweighted"])
+                            if og_mesh.shape_keys is not None:
+                                shape_meshes.append((obj.data.shape_keys, og_mesh))
+                                log.info("%s: %d poses, %d vertex offsets over %g (of %d dense)", mesh_name,
+                                         len(og_mesh.shape_keys), og_mesh.shape_keys.offsetcount, POSE_THRESHOLD,
+                                         len(og_mesh.shape_keys) * len(obj.data.vertices))
+                            elif posed:
+                                log.warning("%s: shape keys left out, they don't match the evaluated mesh "
+                                            "(modifiers adding or removing vertices?), or aren't relative",
+                                            mesh_name)
+                            
+                            if VERTEX_CACHE:
+                                with zprof.span("optimize", mesh=mesh_name):
+                                    stats = og_exported_meshes[path_mesh].optimize_vertex_cache(VERTEX_CACHE_SIZE)
+                                log.info("%s: ACMR %.3f -> %.3f, ATVR %.3f -> %.3f", mesh_name,
+                                         stats["acmr_before"], stats["acmr_after"],
+                                         stats["atvr_before"], stats["atvr_after"])
+                    
+                    cur_mesh = og_exported_meshes[path_mesh]
+                    if tmp_mesh is not None and path_mesh not in mesh_bounds:
+                        mesh_bounds[path_mesh] = ogre_types.mesh_bounds(tmp_mesh)
+                    
+                    if batched and cur_mesh is None:
+                        # cached for another object, but batching needs the geometry: from the temp mesh we have
+                        if path_mesh not in batch_sources:
+                            with zprof.span("extract", mesh=mesh_name):
+                                batch_sources[path_mesh] = ogre_types.Mesh(obj, bpy_depsgraph,
+                                                                           WELD_TOLERANCE=WELD_TOLERANCE,
+                                                                           VECTORIZED=VECTORIZED,
+                                                                           COLOURS=COLOURS,
+                                                                           bpymesh=tmp_mesh)
+                        cur_mesh = batch_sources[path_mesh]
+                finally:
+                    # don't leave temp meshes behind as orphans
+                    if tmp_mesh is not None:
+                        ogre_types.free_mesh(tmp_mesh)
+                
+                if not len(obj.modifiers):
+                    shared_meshes.setdefault(shared_key, path_mesh)
+                
                 # modify mesh_name here to avoid problems with nodes in .scene
                 junk, mesh_name = os.path.split(path_mesh)
-            
-            # !! Material
-            if MATERIALS:
-                # materials only guard against one material twice as they have different logic than meshes.
-                # which is kinda bs.
-                if material_name not in og_materials.keys():
-                    og_materials[material_name] = ogre_types.Material(material)
-            
-            # !! put collected stuff into lists for writing
-            
-            cur_node = ogre_types.Node(obj, meshfile=mesh_name, PHYSICS=PHYSICS)
-            
-            og_meshes[path_mesh] = cur_mesh
-            og_scene.add_node(cur_node)
-            
-            # progress: step per each object
-            progress.step()
+                
+                # !! Material
+                if MATERIALS:
+                    # materials only guard against one material twice as they have different logic than meshes.
+                    # which is kinda bs.
+                    for material in materials:
+                        if material.name not in og_materials.keys():
+                            og_materials[material.name] = ogre_types.Material(material)
+                
+                # !! put collected stuff into lists for writing
+                
+                if batched and cur_mesh.geometry.vertexcount <= BATCH_MAX_VERTICES:
+                    batcher.add(cur_mesh, zbatch.world_matrix(obj))
+                    progress.step()
+                    continue
+                
+                cur_node = ogre_types.Node(obj, meshfile=mesh_name, PHYSICS=PHYSICS)
+                matrix = zbatch.world_matrix(obj)
+                cur_node.set_bounds(mesh_bounds[path_mesh], matrix)
+                
+                og_meshes[path_mesh] = cur_mesh
+                og_scene.add_node(cur_node)
+                # an instance group has no skeleton (or poses), skinned objects stay entities
+                if INSTANCING and skeleton is None and not posed:
+                    instance_nodes.setdefault(path_mesh, list()).append((cur_node, matrix))
+                
+                # progress: step per each object
+                progress.step()
         
         # progress: first batch done (collection of data)
         progress.leave_substeps()
         
-        #
-        # ## create files, serialize xml, ect ##
-        #
+        # ## skeletal and pose animation ##
         
-        # initialize the xml-builder for scene
-        xn_scene = zxml.XMLnode()
-        # and the serializer
-        seri = zxml.XMLserializer()
+        if ANIMATION and (og_skeletons or shape_meshes):
+            # one sweep over the frames for all armatures and shape keys, then keyframe reduction per track
+            skeletons = [(skeleton_armatures[path], og_skeleton) for path, og_skeleton in og_skeletons.items()]
+            stats = ogre_types.sample_animations(bpy_scene, skeletons, KEYFRAME_TOLERANCE, math.radians(KEYFRAME_ANGLE),
+                                                 shape_meshes)
+            zprof.count("keyframes_dropped", stats["sampled"] - stats["kept"])
+            log.info("animation: %d actions, %d keyframes sampled, %d kept, %d dropped (%.1f%%), "
+                     "%d tracks (%d static bones and shapes left out)", stats["animations"], stats["sampled"],
+                     stats["kept"], stats["sampled"] - stats["kept"],
+                     100.0 * (stats["sampled"] - stats["kept"]) / max(1, stats["sampled"]),
+                     stats["tracks"], stats["static"])
         
-        # ## .scene ##
+        # ## instance groups ##
         
-        xn_scene.append("scene", {
-                        "export_time": og_scene.export_time,
-                        "exported_by": og_scene.exported_by,
-                        "formatVersion": og_scene.formatVersion,
-                        "previous_export_time": og_scene.previous_export_time
-                        })
+        if INSTANCING:
+            # a mesh (with its materials) used often enough: one group with a transform table, instead of entities
+            instanced = set()
+            for path_mesh, entries in instance_nodes.items():
+                if len(entries) < INSTANCE_MIN_COUNT:
+                    continue
+                junk, mesh_file = os.path.split(path_mesh)
+                og_scene.add_instance_group(ogre_types.InstanceGroup(os.path.splitext(mesh_file)[0], mesh_file,
+                                                                     [node for node, matrix in entries],
+                                                                     [matrix for node, matrix in entries],
+                                                                     technique=INSTANCE_TECHNIQUE))
+                instanced.update(id(node) for node, matrix in entries)
+            if instanced:
+                og_scene.nodes = [node for node in og_scene.nodes if id(node) not in instanced]
+            log.info("instancing: %d objects in %d instance groups, %d entities left",
+                     len(instanced), len(og_scene.instance_groups), len(og_scene.nodes))
         
-        xn_scene.add("nodes", {})
-        first = True
-        for node in og_scene.nodes:
-            if first:
-                xn_scene.add("node", {"name": node.name})
-                first = False
-            else:
-                xn_scene.append("node", {"name": node.name})
+        # ## static batches ##
+        
+        if batcher is not None and batcher.objects:
+            with zprof.span("batch"):
+                batches = batcher.batches()
             
-            xn_scene.add("position", node.posd)
-            xn_scene.append("rotation", node.quad)
-            xn_scene.append("scale", node.scaled)
-            xn_scene.append("game", {})
-            xn_scene.add("sensors", {})
-            xn_scene.append("actuators", {})
-            xn_scene.pointer_up()
-            xn_scene.append("entity", node.ent_dict)
-            xn_scene.pointer_up()
-        
-        xn_scene.pointer_up()
+            # batches of the same material and cell are numbered
+            numbers = dict()
+            for material, cell, geometry in batches:
+                number = numbers[(material, cell)] = numbers.get((material, cell), -1) + 1
+                batch_name = "batch_%s_%d_%d_%d_%d" % ((name_convert(material), ) + cell + (number, ))
+                path_mesh = full_path[0] + full_path[1] + full_path[2] + "_" + batch_name + ".mesh"
+                
+                fingerprint = zgeom.fingerprint([geometry.positions, geometry.normals, geometry.uvs, geometry.tangents,
+                                                 geometry.binormals, geometry.colours, geometry.indices], extra=material)
+                mesh_hashes[path_mesh] = fingerprint
+                if cache is not None and cache.fresh(mesh_outputs(path_mesh, BINARY, write_xml), fingerprint):
+                    og_meshes[path_mesh] = None
+                else:
+                    og_mesh = ogre_types.Mesh.from_geometry(batch_name, geometry, [(material, 0, geometry.facecount)],
+                                                            batcher.has_colours)
+                    if VERTEX_CACHE:
+                        with zprof.span("optimize", mesh=batch_name):
+                            og_mesh.optimize_vertex_cache(VERTEX_CACHE_SIZE)
+                    og_meshes[path_mesh] = og_mesh
+                
+                batch_node = ogre_types.Node.world(batch_name, os.path.basename(path_mesh), PHYSICS=PHYSICS)
+                batch_node.set_bounds(zgeom.extents(geometry.positions), np.identity(4))
+                og_scene.add_node(batch_node)
+            
+            zprof.count("draw_calls_saved", batcher.draw_calls - len(batches))
+            log.info("static batching: %d objects, %d draw calls -> %d batches (%.1fx fewer)",
+                     batcher.objects, batcher.draw_calls, len(batches), batcher.draw_calls / max(1, len(batches)))
         
-        if MATERIALS:
-            xn_scene.add("externals", {})
-            xn_scene.add("item", {"type": "material"})
-            xn_scene.add("file", {"name": path_material})
-            xn_scene.pointer_up()
-            xn_scene.pointer_up()
-            xn_scene.pointer_up()
-        
-        xn_scene.add("environment", {})
-        col = og_scene.colourAmbient
-        xn_scene.add("colourAmbient", {"r": col[0], "g": col[1], "b": col[2]})
-        col = og_scene.colourBackground
-        xn_scene.append("colourBackground", {"r": col[0], "g": col[1], "b": col[2]})
-        col = og_scene.colourDiffuse
-        xn_scene.append("colourDiffuse", {"r": col[0], "g": col[1], "b": col[2]})
+        mem_report.end(meshes=len(og_exported_meshes), mesh_datablocks=len(bpy.data.meshes))
+        
+        #
+        # ## create files, serialize xml, ect ##
+        #
+        
+        # ## .scene ##
         
-        seri.write_file(path_scene, graph=xn_scene.graph)
+        mem_report.stage("scene")
+        for group in og_scene.instance_groups:
+            # the transform table, as the runtime uploads it
+            # next to the group's mesh: the name already carries the scene prefix
+            path_instances = os.path.join(os.path.dirname(full_path[0]), group.name + ".instances")
+            group.matrices.astype("<f4").tofile(path_instances)
+            group.transforms = os.path.basename(path_instances)
+            count_written(path_instances)
+        
+        if SCENE_CHUNKS == 'NONE':
+            with zprof.span("xml", file=path_scene):
+                write_scene_xml(path_scene, og_scene, path_material if MATERIALS else None)
+            count_written(path_scene)
+        else:
+            # a .scene per cell with its nodes, an index with the cells' bounds, and the .scene keeps the rest
+            with zprof.span("chunk"):
+                chunks = zchunk.chunk_nodes(og_scene.nodes, SCENE_CHUNKS, CHUNK_CELL_SIZE, CHUNK_MAX_NODES)
+            path_chunks = [full_path[0] + full_path[1] + full_path[2] + "_chunk_" + chunk.name + full_path[3]
+                           for chunk in chunks]
+            for chunk, path_chunk in zip(chunks, path_chunks):
+                with zprof.span("xml", file=path_chunk):
+                    write_scene_xml(path_chunk, og_scene, path_material if MATERIALS else None,
+                                    nodes=chunk.nodes, environment=False)
+            path_index = full_path[0] + full_path[1] + full_path[2] + ".chunks.xml"
+            with zprof.span("xml", file=path_index):
+                write_chunk_index(path_index, chunks, path_chunks, SCENE_CHUNKS, CHUNK_CELL_SIZE, CHUNK_MAX_NODES)
+            with zprof.span("xml", file=path_scene):
+                write_scene_xml(path_scene, og_scene, path_material if MATERIALS else None, nodes=[])
+            count_written(path_scene, path_index, *path_chunks)
+            log.info("scene: %d nodes in %d chunks, %d nodes in the biggest", len(og_scene.nodes), len(chunks),
+                     max(len(chunk.nodes) for chunk in chunks) if chunks else 0)
         
         # ## .material ##
         
+        mem_report.stage("materials")
         if MATERIALS:
             
             # progress: cycle thru materials
@@ -262,6 +926,7 @@ def write_loop(context, filepath,
             
             mn_mat = zmat.MATnode()
             seri_mat = zmat.MATserializer()
+            stager = ztexture.TextureStager(workers=TEXTURE_WORKERS, cache=cache)
             
             mn_mat.bracket("material", "_missing_material_")
             mn_mat.entry("receive_shadows", "off")
@@ -302,7 +967,8 @@ def write_loop(context, filepath,
                     src = bpy.path.abspath(path_img)
                     dst = os.path.join(os.path.dirname(path_material), tmp)
                     if src != dst:
-                        shutil.copyfile(src, dst)
+                        # copied later, all at once
+                        stager.add(src, dst)
                     
                     mn_mat.bracket("texture_unit", "")
                     for et in og_material.tu_dict:
@@ -317,12 +983,75 @@ def write_loop(context, filepath,
             # progress: done with mats
             progress.leave_substeps()
             
-            seri_mat.write_file(path_material, mn_mat.graph)
+            # ## textures ##
+            
+            with zprof.span("textures"):
+                tex_report = stager.run()
+            zprof.count("bytes_copied", tex_report["bytes_copied"])
+            log.info("textures: %d copied (%.1f MB), %d skipped (%.1f MB), %d duplicate references, "
+                     "%d left out (file name taken)",
+                     tex_report["copied"], tex_report["bytes_copied"] / 1048576.0,
+                     tex_report["skipped"], tex_report["bytes_skipped"] / 1048576.0,
+                     tex_report["duplicates"], len(tex_report["conflicts"]))
+            if tex_report["failed"]:
+                # same as a failing copy used to do
+                raise tex_report["failed"][0].error
+            
+            # the .material only gets written if what goes into it changed
+            with zprof.span("material"):
+                mat_hash = zcache.text_hash(seri_mat.serialize(mn_mat.graph))
+            if cache is None or not cache.fresh([path_material], mat_hash):
+                with zprof.span("serialize", file=path_material):
+                    seri_mat.write_file(path_material, mn_mat.graph)
+                count_written(path_material)
+                if cache is not None:
+                    cache.record([path_material], mat_hash)
         
         # ## .xml.mesh, .mesh ##
         
+        mem_report.stage("meshes")
+        
+        seri_mesh = zmesh.MESHserializer(version=MESH_VERSION)
+        lod_levels = zlod.lod_levels(LOD_LEVELS, LOD_MODE, LOD_RATIO, LOD_DISTANCE, LOD_PIXEL_ERROR)
+        
+        # packed types only exist in the native binaries, and only from 1.100 on; otherwise the layout stays
+        quantized = BINARY and BINARY_WRITER == 'NATIVE' and MESH_VERSION != '1.8'
+        if (PACK_NORMALS or HALF_UVS) and BINARY and not quantized:
+            log.warning("packed normals and half float uvs need the native writer and mesh version 1.100, "
+                        "writing floats")
+        
+        # converter processes run in a bounded pool, next to the xml generation
+        oxt_pool = None
+        if BINARY and BINARY_WRITER == 'CONVERTER':
+            if CONVERTER:
+                # anything taking the converter's arguments (eg. benchmarks/fake_converter.py)
+                oxt_cmd = shlex.split(CONVERTER)
+            else:
+                # get current path
+                fn = inspect.getframeinfo(inspect.currentframe()).filename
+                path = os.path.dirname(os.path.abspath(fn))
+                oxt_cmd = [os.path.join(path, "ogrexmltools", "OgreXMLConverter.exe")]
+            # construct command (the pool appends the xml and mesh paths)
+            oxt_cmd += ["-d3d", "-q"]
+            oxt_pool = zconvert.ConverterPool(oxt_cmd, workers=CONVERTER_WORKERS, timeout=CONVERTER_TIMEOUT)
+        
+        # ## .skeleton ##
+        
+        seri_skel = zskel.SKELETONserializer()
+        for path_skeleton, og_skeleton in og_skeletons.items():
+            if write_xml:
+                with zprof.span("xml", file=path_skeleton + ".xml"):
+                    write_skeleton_xml(path_skeleton + ".xml", og_skeleton)
+                count_written(path_skeleton + ".xml")
+            if BINARY and BINARY_WRITER == 'NATIVE':
+                with zprof.span("serialize", file=path_skeleton):
+                    seri_skel.write_file(path_skeleton, og_skeleton)
+                count_written(path_skeleton)
+            elif BINARY:
+                oxt_pool.submit(path_skeleton + ".xml", path_skeleton)
+        
         # progress: go for meshes
-        if BINARY:
+        if BINARY and write_xml:
             # binary takes two steps
             progress.enter_substeps(len(og_meshes) * 2)
         else:
@@ -332,82 +1061,109 @@ def write_loop(context, filepath,
         for path_mesh in og_meshes:
             og_mesh = og_meshes[path_mesh]
             
-            # initialize xml-builder
-            xn_mesh = zxml.XMLnode()
+            if og_mesh is None:
+                # cached, nothing to write
+                progress.step()
+                if BINARY and write_xml:
+                    progress.step()
+                continue
             
-            # Roots
-            xn_mesh.append("mesh", {})
-            xn_mesh.add("sharedgeometry", {"vertexcount": og_mesh.vertexcount})
-            xn_mesh.add("vertexbuffer", og_mesh.attr_dict)
+            # 16 bit indices where they fit, 32 bit (or split submeshes) where they don't
+            geometry, submeshes = og_mesh.build_submeshes(SPLIT=SPLIT_LARGE)
+            if geometry is None:
+                log.info("%s: split into %d submeshes for 16 bit indices", os.path.basename(path_mesh), len(submeshes))
+            poses = og_mesh.build_poses(geometry, submeshes)
             
-            # Vertices
-            first = True
-            for vert in og_mesh.vertexlist:
-                if first:
-                    xn_mesh.add("vertex", {})
-                    first = False
-                else:
-                    xn_mesh.append("vertex", {})
-                xn_mesh.add("position", vert.posd)
-                xn_mesh.append("normal", vert.nord)
-                xn_mesh.append("texcoord", vert.uvd)
-                xn_mesh.append("tangent", vert.tand)
-                xn_mesh.append("binormal", vert.bind)
-                xn_mesh.pointer_up()
-            xn_mesh.pointer_up()
-            xn_mesh.pointer_up()
-            xn_mesh.append("submeshes", {})
-            xn_mesh.add("submesh", {
-                        "material": og_mesh.submesh_material,
-                        "operationtype": "triangle_list",
-                        "use32bitindexes": "False",
-                        "usesharedvertices": "true"
-                        })
-            xn_mesh.add("faces", {"count": len(og_mesh.submesh_list)})
+            # what the vertices cost, compared to the plain float layout (with the same elements)
+            vertex_format = zmesh.VertexFormat(PACK_NORMALS, HALF_UVS, og_mesh.has_colours, quantized)
+            vertex_size = vertex_format.vertex_size(MESH_VERSION)
+            full_size = zmesh.VertexFormat(colours=og_mesh.has_colours).vertex_size(MESH_VERSION)
+            vertexcount = sum(g.vertexcount for g in [geometry] + [s.geometry for s in submeshes] if g is not None)
+            zprof.count("vertex_bytes_saved", (full_size - vertex_size) * vertexcount)
+            log.info("%s: %d bytes per vertex (floats: %d), %.1f KB saved", os.path.basename(path_mesh),
+                     vertex_size, full_size, (full_size - vertex_size) * vertexcount / 1024.0)
             
-            # Tris
-            first = True
-            for tri in og_mesh.submesh_list:
-                if first:
-                    xn_mesh.add("face", {"v1": tri[0], "v2": tri[1], "v3": tri[2]})
-                    first = False
-                else:
-                    xn_mesh.append("face", {"v1": tri[0], "v2": tri[1], "v3": tri[2]})
-            xn_mesh.pointer_up()
-            xn_mesh.pointer_up()
-            xn_mesh.pointer_up()
-            xn_mesh.append("submeshnames", {})
-            xn_mesh.add("submesh", {"index": 0, "name": og_mesh.submesh_material})
-            xn_mesh.pointer_up()
-            seri.write_file(path_mesh + ".xml", graph=xn_mesh.graph)
+            # LOD levels: index buffers only, over the vertices the full detail level already has
+            lod_values = list()
+            if LOD_LEVELS:
+                with zprof.span("lod", file=path_mesh):
+                    lod_values = zlod.generate_lods(geometry, submeshes, lod_levels)
+                tris = [sum(len(s.indices) for s in submeshes)]
+                tris += [sum(len(s.lods[level]) for s in submeshes) for level in range(len(lod_values))]
+                log.info("%s: LOD tris %s", os.path.basename(path_mesh), " -> ".join(map(str, tris)))
             
-            # progress: done with a mesh
-            progress.step()
+            if write_xml:
+                # stream the xml to the file, straight from the geometry arrays
+                with zprof.span("xml", file=path_mesh + ".xml"):
+                    write_mesh_xml(path_mesh + ".xml", og_mesh, geometry, submeshes,
+                                   lod_values, zmesh.LOD_STRATEGIES[MESH_VERSION], vertex_format, poses)
+                count_written(path_mesh + ".xml")
+                
+                # progress: done with a mesh
+                progress.step()
             
             # ## .mesh ##
-            # Binary creation:
-            if BINARY:
-                # get current path
-                fn = inspect.getframeinfo(inspect.currentframe()).filename
-                path = os.path.dirname(os.path.abspath(fn))
-                # construct command
-                oxt_cmd = path + "/ogrexmltools/OgreXMLConverter.exe -d3d -q " + path_mesh + ".xml " + path_mesh
-                # print("XML_Converter cmd: " + oxt_cmd)
+            # Binary creation, without the round-trip thru xml:
+            if BINARY and BINARY_WRITER == 'NATIVE':
+                with zprof.span("serialize", file=path_mesh):
+                    seri_mesh.write_file(path_mesh, geometry, submeshes=submeshes, lod_values=lod_values,
+                                         vertex_format=vertex_format, mesh_bounds=og_mesh.bounds,
+                                         skeleton_name=og_mesh.skeleton.filename if og_mesh.skeleton else None,
+                                         poses=poses, pose_animations=og_mesh.pose_animations)
+                count_written(path_mesh)
                 
-                # execute command
-                oxt_proc = subprocess.Popen(oxt_cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                # progress: done with a mesh's binary
+                progress.step()
                 
-                # print converter output
-                out, err = oxt_proc.communicate()
-                out = out.decode()
-                err = err.decode()
-                print(out)
-                print(err)
+                if cache is not None:
+                    cache.record(mesh_outputs(path_mesh, BINARY, write_xml), mesh_hashes[path_mesh])
+            
+            # Binary creation, thru OgreXMLConverter:
+            elif BINARY:
+                # queue the conversion; it runs while we build the next mesh's xml
+                oxt_pool.submit(path_mesh + ".xml", path_mesh)
+            
+            # xml only
+            elif cache is not None:
+                cache.record(mesh_outputs(path_mesh, BINARY, write_xml), mesh_hashes[path_mesh])
+        
+        if oxt_pool is not None:
+            # wait for the remaining conversions
+            for result in oxt_pool.results():
+                # skeletons go thru the pool too, but aren't counted in the progress (or cached)
+                if result.dst not in mesh_hashes:
+                    if result.ok:
+                        count_written(result.dst)
+                    continue
                 
                 # progress: done with a mesh's binary
                 progress.step()
+                
+                if result.ok:
+                    count_written(result.dst)
+                    # only what converted fine goes into the cache
+                    if cache is not None:
+                        cache.record(mesh_outputs(result.dst, BINARY, write_xml), mesh_hashes[result.dst])
+            oxt_pool.close()
+            
+            # keep the converter output per mesh, instead of printing it
+            oxt_report = oxt_pool.report()
+            with open(full_path[0] + ".convert.json", mode="w", encoding="UTF-8") as fw:
+                json.dump(oxt_report, fw, indent=1)
+            
+            if oxt_report["failed"]:
+                log.warning("%d of %d mesh conversions failed, see %s",
+                            oxt_report["failed"], oxt_report["jobs"], full_path[0] + ".convert.json")
         
         # progress: done with meshes
         progress.leave_substeps()
+        mem_report.end(mesh_datablocks=len(bpy.data.meshes))
+        
+        if cache is not None:
+            # entries of outputs we didn't see this time are stale, they don't get saved
+            cache.save()
+            log.info("cache: %d up to date, %d regenerated", cache.hits, cache.misses)
         
         # ## END OF WRITE_LOOP ##
+    
+    return mem_report
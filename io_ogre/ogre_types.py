@@ -1,7 +1,17 @@
+import contextlib
+import functools
+
+import numpy as np
+
 import bpy
 import bmesh
 from mathutils import Vector, Matrix
 
+from . import zgeom
+from . import zpose
+from . import zprof
+from . import zskel
+
 
 #
 # ## utils ##
@@ -12,6 +22,103 @@ def cc(l) -> list:
     return [l[0], l[2], -l[1]]
 
 
+def free_mesh(bpymesh) -> None:
+    """Remove a temp mesh made by obj.to_mesh, so it doesn't stay behind as an orphan datablock"""
+    bpy.data.meshes.remove(bpymesh)
+
+
+def slot_materials(obj) -> list:
+    """The material of every material slot of an object (None for empty slots)"""
+    return [slot.material for slot in obj.material_slots]
+
+
+def is_static(obj) -> bool:
+    """
+    Whether the object stays put: no animation (its own or a parent's), no armature deforming it,
+    and no shape keys (poses) to change its shape
+    """
+    if getattr(obj.data, "shape_keys", None) is not None:
+        return False
+    while obj is not None:
+        if obj.animation_data is not None and obj.animation_data.action is not None:
+            return False
+        if any(modifier.type == 'ARMATURE' for modifier in obj.modifiers):
+            return False
+        obj = obj.parent
+    return True
+
+
+@contextlib.contextmanager
+def rest_pose(armatures, depsgraph):
+    """Evaluate with the armatures in their rest pose (the bind pose skeletons are written in), then put them back"""
+    before = [(armature.data, armature.data.pose_position) for armature in armatures]
+    for data, position in before:
+        data.pose_position = 'REST'
+    if before:
+        depsgraph.update()
+    try:
+        yield
+    finally:
+        for data, position in before:
+            data.pose_position = position
+        if before:
+            depsgraph.update()
+
+
+@contextlib.contextmanager
+def basis_shapes(objects, depsgraph):
+    """Evaluate the objects with shape keys in their basis shape (the poses are offsets from it), then put them back"""
+    before = [(obj, obj.show_only_shape_key, obj.active_shape_key_index) for obj in objects
+              if getattr(obj.data, "shape_keys", None) is not None]
+    for obj, only, index in before:
+        obj.show_only_shape_key = True
+        obj.active_shape_key_index = 0
+    if before:
+        depsgraph.update()
+    try:
+        yield
+    finally:
+        for obj, only, index in before:
+            obj.show_only_shape_key = only
+            obj.active_shape_key_index = index
+        if before:
+            depsgraph.update()
+
+
+def mesh_bounds(bpymesh) -> tuple:
+    """AABB (min, max) and bounding radius of an (evaluated) mesh's vertices, in ogre axes (see zgeom.extents)"""
+    co = np.empty(len(bpymesh.vertices) * 3, dtype=np.float32)
+    bpymesh.vertices.foreach_get("co", co)
+    return zgeom.extents(zgeom.swap_axes(co.reshape(-1, 3)))
+
+
+def mesh_fingerprint(bpymesh, material_key) -> str:
+    """Content hash of an (evaluated) mesh's geometry and its materials, for duplicate detection"""
+    
+    def pull(collection, attr, count, width, dtype=np.float32):
+        a = np.empty(count * width, dtype=dtype)
+        collection.foreach_get(attr, a)
+        return a
+    
+    n_loops = len(bpymesh.loops)
+    n_polys = len(bpymesh.polygons)
+    
+    arrays = [
+        pull(bpymesh.vertices, "co", len(bpymesh.vertices), 3),
+        pull(bpymesh.loops, "vertex_index", n_loops, 1, np.int32),
+        pull(bpymesh.polygons, "loop_total", n_polys, 1, np.int32),
+        pull(bpymesh.polygons, "material_index", n_polys, 1, np.int32),
+        pull(bpymesh.polygons, "use_smooth", n_polys, 1, np.bool_),
+    ]
+    if bpymesh.uv_layers.active is not None:
+        arrays.append(pull(bpymesh.uv_layers.active.data, "uv", n_loops, 2))
+    if bpymesh.vertex_colors.active is not None and n_loops:
+        width = len(bpymesh.vertex_colors.active.data[0].color)
+        arrays.append(pull(bpymesh.vertex_colors.active.data, "color", n_loops, width))
+    
+    return zgeom.fingerprint(arrays, extra=material_key)
+
+
 #
 # ## .mesh ##
 #
@@ -28,7 +135,7 @@ class Vertex(object):
                  tangent=[0, 0, 0],
                  binormal=[0, 0, 0],
                  rgba=[0, 0, 0],
-                 boneweights=None,
+                 source=None,
                  index=0
                  ):
         self.posd = dict()
@@ -48,7 +155,8 @@ class Vertex(object):
         
         self.rgbad["r"], self.rgbad["g"], self.rgbad["b"], self.rgbad["a"] = rgba
         
-        self.boneweights = boneweights
+        # the blender vertex, for skinned meshes (its bone weights are gathered per blender vertex)
+        self.source = source
         
         self.index = index
     
@@ -69,6 +177,27 @@ class Vertex(object):
             if self.bind[i] != o.bind[i]:
                 return False
         return True
+    
+    def key(self, tolerance=0.0, colours=False) -> tuple:
+        """Hashable welding key, over the same attributes as __eq__ (and the colour, if it's exported)"""
+        # same order as __eq__: position, normal, uv, tangent, binormal
+        values = (self.posd["x"], self.posd["y"], self.posd["z"],
+                  self.nord["x"], self.nord["y"], self.nord["z"],
+                  self.uvd["u"], self.uvd["v"],
+                  self.tand["x"], self.tand["y"], self.tand["z"],
+                  self.bind["x"], self.bind["y"], self.bind["z"])
+        if colours:
+            values += (self.rgbad["r"], self.rgbad["g"], self.rgbad["b"], self.rgbad["a"])
+        if tolerance > 0.0:
+            # quantize, so vertices within the tolerance land on the same key
+            values = tuple(round(v / tolerance) for v in values)
+        else:
+            # exact mode: floats hash consistently with ==, so this welds like __eq__ did
+            values = tuple(float(v) for v in values)
+        if self.source is not None:
+            # different blender vertices may have different weights, they never weld
+            values += (self.source, )
+        return values
 
 
 class Mesh(object):
@@ -79,15 +208,32 @@ class Mesh(object):
                  obj: bpy.types.Object,
                  depsgraph: bpy.types.Depsgraph,
                  ARMATURE=False,
-                 ANIMATION=False
+                 ANIMATION=False,
+                 WELD_TOLERANCE=0.0,
+                 VECTORIZED=False,
+                 COLOURS=False,
+                 bpymesh=None,
+                 skeleton=None,
+                 POSE_THRESHOLD=zpose.OFFSET_THRESHOLD
                  ):
-        """Constructor that pulls geometry data from bpy"""
+        """
+        Constructor that pulls geometry data from bpy.
+        With ARMATURE and a skeleton (see Skeleton), the vertices get its bones' weights.
+        With ANIMATION, the shape keys become poses: the offsets over POSE_THRESHOLD (see zpose.ShapeKeys).
+        The mesh should be evaluated in its basis shape then (see basis_shapes).
+        """
         
         # ## ORIG CONSTRUCTOR ##
         
         self.vertexlist = list()
+        # welding index: Vertex.key() -> index in vertexlist
+        self.vertexmap = dict()
+        self.weld_tolerance = WELD_TOLERANCE
+        # whether the vertex colours are kept (and welded by); set once we see the mesh
+        self.has_colours = False
         self.submesh_list = list()
-        self.submesh_material = ""
+        # (material name, first tri, end tri) per submesh, over the geometry's indices
+        self.submesh_ranges = list()
         
         self.vertexcount = 0
         
@@ -103,16 +249,268 @@ class Mesh(object):
         
         # ## END ##
         
+        # welded vertex/index arrays, filled by either extraction path
+        self.geometry = None
+        # AABB (min, max) and bounding radius, so the writers and the runtime needn't scan the vertices again
+        self.bounds = None
+        # the Skeleton the vertices are skinned to, and what gathering the weights dropped (see zskel.gather_weights)
+        self.skeleton = skeleton if ARMATURE else None
+        self.skin_stats = None
+        # the shape keys, sparse (a zpose.ShapeKeys), and the zpose.PoseAnimation list (see sample_animations)
+        self.shape_keys = None
+        self.pose_animations = list()
+        
         self.name = obj.data.name
-        # obj to mesh
+        # obj to mesh, unless the caller already evaluated it (then the caller frees it, too)
         # to_mesh(depsgraph, apply_modifiers, calc_undeformed=False) -> Mesh
-        bpymesh = obj.to_mesh(depsgraph, True)
+        owned = bpymesh is None
+        if owned:
+            with zprof.span("evaluate", object=obj.name):
+                bpymesh = obj.to_mesh(depsgraph, True)
+        
+        try:
+            self.has_colours = COLOURS and bpymesh.vertex_colors.active is not None
+            self.attr_dict["colours_diffuse"] = self.has_colours
+            
+            with zprof.span("triangulate"):
+                # triangulate
+                self.bmesh_triangulate(bpymesh)
+                # update normals, tangents, bitangents
+                bpymesh.calc_tangents()
+            
+            if ANIMATION:
+                with zprof.span("shapes"):
+                    self.shape_keys = self.pull_shape_keys(obj, bpymesh, POSE_THRESHOLD)
+            
+            # weights and offsets are per blender vertex
+            sources = self.skeleton is not None or self.shape_keys is not None
+            if VECTORIZED:
+                # bulk extraction with foreach_get, welded by zgeom
+                self.geometry = self.pull_geometry(bpymesh, sources)
+                self.vertexcount = self.geometry.vertexcount
+            else:
+                # collect mesh vertices to ogre_types.Vertex
+                self.pull_vertices(obj, bpymesh, sources)
+                self.geometry = zgeom.Geometry.from_vertices(self.vertexlist, self.submesh_list)
+                # the welding index is only needed while pulling
+                self.vertexmap = dict()
+            
+            if self.skeleton is not None:
+                with zprof.span("skin"):
+                    bone_indices, bone_weights, self.skin_stats = self.pull_skin(obj, bpymesh, self.skeleton)
+                    self.geometry.skin(bone_indices, bone_weights)
+            
+            # both paths keep the tris in polygon order
+            tri_slots = np.empty(len(bpymesh.polygons), dtype=np.int32)
+            bpymesh.polygons.foreach_get("material_index", tri_slots)
+        finally:
+            # free the temp mesh, if it's ours
+            if owned:
+                free_mesh(bpymesh)
+        
+        zprof.count("vertices_in", self.geometry.facecount * 3)
+        zprof.count("vertices_out", self.geometry.vertexcount)
+        zprof.count("faces", self.geometry.facecount)
+        
+        self.bounds = zgeom.extents(self.geometry.positions)
+        
+        # we go back to our object
+        
+        # and get them materials! one submesh per material, tris bucketed by material index
+        self.pull_sm_materials(obj, tri_slots)
+    
+    @classmethod
+    def from_geometry(cls, name, geometry, submesh_ranges, has_colours=False):
+        """A mesh of geometry built elsewhere (eg. a static batch, see zbatch), without a blender object"""
+        mesh = cls.__new__(cls)
+        mesh.vertexlist = list()
+        mesh.vertexmap = dict()
+        mesh.weld_tolerance = 0.0
+        mesh.has_colours = has_colours
+        mesh.submesh_list = list()
+        mesh.submesh_ranges = list(submesh_ranges)
+        mesh.vertexcount = geometry.vertexcount
+        mesh.attr_dict = {
+            "binormals": True,
+            "colours_diffuse": has_colours,
+            "normals": True,
+            "positions": True,
+            "tangent_dimensions": 3,
+            "tangents": True,
+            "texture_coords": 1,
+        }
+        mesh.geometry = geometry
+        mesh.bounds = zgeom.extents(geometry.positions)
+        mesh.skeleton = None
+        mesh.skin_stats = None
+        mesh.shape_keys = None
+        mesh.pose_animations = list()
+        mesh.name = name
+        return mesh
+    
+    def build_submeshes(self, SPLIT=False) -> tuple:
+        """
+        The shared geometry and the zgeom.Submesh list to write.
+        With SPLIT, a mesh too big for 16 bit indices is cut into submeshes with their own vertices instead,
+        (and no shared geometry).
+        """
+        geometry = self.geometry
+        if SPLIT and zgeom.needs_32bit(geometry.vertexcount):
+            submeshes = list()
+            for material, start, end in self.submesh_ranges:
+                for split_start, split_end in zgeom.split_indices(geometry.indices[start:end]):
+                    piece = geometry.subset(start + split_start, start + split_end)
+                    submeshes.append(zgeom.Submesh(material, piece.indices, geometry=piece))
+            return None, submeshes
+        return geometry, [zgeom.Submesh(material, geometry.indices[start:end])
+                          for material, start, end in self.submesh_ranges]
+    
+    def build_poses(self, shared, submeshes) -> list:
+        """The zpose.Pose list of the geometries build_submeshes made: per shape, a pose per vertex data it moves"""
+        if self.shape_keys is None:
+            return list()
+        poses = list()
+        if shared is not None:
+            poses.extend(self.shape_keys.poses(shared, 0))
+        for index, submesh in enumerate(submeshes):
+            if submesh.geometry is not None:
+                poses.extend(self.shape_keys.poses(submesh.geometry, index + 1))
+        return poses
+    
+    def optimize_vertex_cache(self, cache_size=16) -> dict:
+        """Reorder tris and vertices for the GPU vertex caches; returns ACMR/ATVR before and after"""
+        # tris only move within their submesh
+        ranges = [(start, end) for material, start, end in self.submesh_ranges]
+        stats, order = self.geometry.optimize_vertex_cache(cache_size, ranges)
+        
+        if self.vertexlist:
+            # keep the per loop path's lists in the new order too
+            self.vertexlist = [self.vertexlist[i] for i in order.tolist()]
+            for index, vertex in enumerate(self.vertexlist):
+                vertex.index = index
+            self.submesh_list = self.geometry.indices.tolist()
+        return stats
+    
+    def pull_geometry(self, bpymesh, SOURCES=False) -> zgeom.Geometry:
+        """
+        Pull all loop attributes at once with foreach_get, and weld them as arrays.
+        SOURCES keeps the blender vertex of every vertex (geometry.sources), for the bone weights and poses.
+        """
+        
+        n_verts = len(bpymesh.vertices)
+        n_loops = len(bpymesh.loops)
+        n_polys = len(bpymesh.polygons)
+        
+        # confirm that what we have are tris (all of them)
+        loop_total = np.empty(n_polys, dtype=np.int32)
+        bpymesh.polygons.foreach_get("loop_total", loop_total)
+        if np.any(loop_total != 3):
+            raise ValueError("Polygon not a tri!")
+        
+        loop_start = np.empty(n_polys, dtype=np.int32)
+        bpymesh.polygons.foreach_get("loop_start", loop_start)
+        # loops of every tri, in tri order
+        tri_loops = (loop_start[:, None] + np.arange(3, dtype=np.int32)).ravel()
+        
+        loop_verts = np.empty(n_loops, dtype=np.int32)
+        bpymesh.loops.foreach_get("vertex_index", loop_verts)
+        tri_verts = loop_verts[tri_loops]
         
-        # collect mesh vertices to ogre_types.Vertex
-        # triangulate
-        self.bmesh_triangulate(bpymesh)
-        # update normals, tangents, bitangents
-        bpymesh.calc_tangents()
+        # per vertex data: swap the axes once per vertex, not once per loop
+        co = np.empty(n_verts * 3, dtype=np.float32)
+        bpymesh.vertices.foreach_get("co", co)
+        co = zgeom.swap_axes(co.reshape(-1, 3))
+        
+        normal = np.empty(n_verts * 3, dtype=np.float32)
+        bpymesh.vertices.foreach_get("normal", normal)
+        normal = zgeom.swap_axes(normal.reshape(-1, 3))
+        
+        # per loop data
+        tangent = np.empty(n_loops * 3, dtype=np.float32)
+        bpymesh.loops.foreach_get("tangent", tangent)
+        tangent = zgeom.swap_axes(tangent.reshape(-1, 3))
+        
+        bitangent = np.empty(n_loops * 3, dtype=np.float32)
+        bpymesh.loops.foreach_get("bitangent", bitangent)
+        bitangent = zgeom.swap_axes(bitangent.reshape(-1, 3))
+        
+        uv = None
+        if bpymesh.uv_layers.active is not None:
+            uv = np.empty(n_loops * 2, dtype=np.float32)
+            bpymesh.uv_layers.active.data.foreach_get("uv", uv)
+            uv = uv.reshape(-1, 2)[tri_loops]
+        
+        rgba = None
+        if self.has_colours:
+            bpy_color = bpymesh.vertex_colors.active.data
+            width = len(bpy_color[0].color) if n_loops else 4
+            rgba = np.ones((n_loops, 4), dtype=np.float32)
+            color = np.empty(n_loops * width, dtype=np.float32)
+            bpy_color.foreach_get("color", color)
+            # alpha stays 1, like the per loop path
+            rgba[:, :3] = color.reshape(-1, width)[:, :3]
+            rgba = rgba[tri_loops]
+        
+        return zgeom.Geometry.from_loops(co[tri_verts],
+                                         normal[tri_verts],
+                                         uvs=uv,
+                                         tangents=tangent[tri_loops],
+                                         binormals=bitangent[tri_loops],
+                                         colours=rgba,
+                                         tolerance=self.weld_tolerance,
+                                         sources=tri_verts if SOURCES else None
+                                         )
+    
+    def pull_skin(self, obj, bpymesh, skeleton) -> tuple:
+        """
+        Bone handles and weights per blender vertex, fixed width (see zskel.gather_weights).
+        The vertex groups are read once per vertex, however many loops (and welded vertices) use it.
+        """
+        # vertex group -> bone handle (-1: no deforming bone of that name)
+        group_bones = [skeleton.deform_handle(group.name) for group in obj.vertex_groups]
+        
+        vertex_ids = list()
+        group_ids = list()
+        weights = list()
+        for vertex in bpymesh.vertices:
+            index = vertex.index
+            for element in vertex.groups:
+                vertex_ids.append(index)
+                group_ids.append(element.group)
+                weights.append(element.weight)
+        
+        return zskel.gather_weights(vertex_ids, group_ids, weights, len(bpymesh.vertices), group_bones)
+    
+    def pull_shape_keys(self, obj, bpymesh, threshold=zpose.OFFSET_THRESHOLD):
+        """
+        The relative shape keys of the object (but the basis, and the muted ones) as sparse offsets
+        (see zpose.ShapeKeys), their coordinates read with foreach_get, a key at a time.
+        None if it has none, or they don't fit the evaluated mesh (modifiers adding or removing vertices).
+        """
+        key = obj.data.shape_keys
+        if key is None or not key.use_relative or len(key.key_blocks) < 2:
+            return None
+        n_verts = len(bpymesh.vertices)
+        if len(key.reference_key.data) != n_verts:
+            return None
+        
+        blocks = list(key.key_blocks)
+        indices = {block.name: index for index, block in enumerate(blocks)}
+        coords = np.empty((len(blocks), n_verts, 3), dtype=np.float32)
+        for index, block in enumerate(blocks):
+            block.data.foreach_get("co", coords[index].reshape(-1))
+        relative = [indices.get(block.relative_key.name, 0) for block in blocks]
+        
+        # the basis isn't a pose, it's the mesh
+        shapes = [index for index, block in enumerate(blocks) if index > 0 and not block.mute]
+        return zpose.ShapeKeys.from_coords([blocks[index].name for index in shapes], shapes, coords, relative,
+                                           threshold)
+    
+    def pull_vertices(self, obj, bpymesh, SOURCES=False) -> None:
+        """
+        Pull loop attributes one by one into ogre_types.Vertex, welding as we go.
+        SOURCES keeps the blender vertex of every Vertex, for the bone weights (see pull_skin) and poses.
+        """
         
         bpy_uvdata = bpymesh.uv_layers.active.data
         
@@ -149,41 +547,41 @@ class Mesh(object):
                     rgba = [1, 1, 1, 1]
                 # TODO: better rgba
                 
-                # get the bone / vertexgroup influences
-                # TODO: confirm this works
-                bw = []
-                if ARMATURE:
-                    for group in bpymesh.vertices[vert_ref].groups:
-                        if group.weight > 0.01:
-                            vg = obj.vertex_groups[group.group]
-                            bw[vg.name] = group.weight
+                # the bone influences and shape offsets are per blender vertex (pull_skin, pull_shape_keys)
+                source = vert_ref if SOURCES else None
                 
                 # create vertex
-                vert = Vertex(vc, vn, uv=uv, tangent=vt, binormal=vb, rgba=rgba, boneweights=bw)
+                vert = Vertex(vc, vn, uv=uv, tangent=vt, binormal=vb, rgba=rgba, source=source)
                 
                 # add the Vertex to our list in the Mesh, and to the tri
                 tri.append(self.add_vertex(vert))
             
             # for every poly (tri) add a tri to our submesh list
             self.add_sm_tri(tri)
+    
+    def pull_sm_materials(self, obj, tri_slots) -> None:
+        """Group the tris by material (one pass, bucketed), into one submesh range per material"""
+        # get the material names, per slot
+        names = [obj.name]
+        materials = slot_materials(obj)
+        if len(materials) > 0:
+            names = [m.name if m is not None else "_missing_material_" for m in materials]
         
-        # we go back to our object
+        # slots sharing a material share the submesh
+        submesh_of = dict()
+        slot_submesh = np.array([submesh_of.setdefault(name, len(submesh_of)) for name in names], dtype=np.int64)
+        # out of range indices use the last slot
+        tri_submesh = slot_submesh[np.clip(tri_slots, 0, len(names) - 1)]
         
-        # and get that material!
-        self.pull_sm_material(obj)
+        order, counts = zgeom.bucket_tris(tri_submesh, len(submesh_of))
+        self.geometry.indices = self.geometry.indices[order]
+        if self.submesh_list:
+            self.submesh_list = self.geometry.indices.tolist()
         
-        if ANIMATION:
-            # TODO: export poses
-            # ... and anims
-            pass
-            
-    def pull_sm_material(self, obj) -> None:
-        # get the material name
-        material = obj.name
-        if len(obj.data.materials) > 0:
-            material = obj.data.materials[0].name
-        # and set it as the material of the mesh.
-        self.submesh_material = material
+        # and set them as the submeshes of the mesh (materials no tri uses are left out)
+        end = np.cumsum(counts).tolist()
+        start = [0] + end[:-1]
+        self.submesh_ranges = [(name, start[i], end[i]) for name, i in submesh_of.items() if counts[i]]
     
     def add_sm_tri(self, tri):
         # let's see if it's really a tri
@@ -193,15 +591,18 @@ class Mesh(object):
             # if so, then add it to our list
             self.submesh_list.append(tri)
     
-    # TODO: REVIEW
     def add_vertex(self, vertex) -> int:
-        if vertex in self.vertexlist:
-            return self.vertexlist[self.vertexlist.index(vertex)].index
+        # look the vertex up in the welding index, instead of scanning the list
+        key = vertex.key(self.weld_tolerance, self.has_colours)
+        index = self.vertexmap.get(key)
+        if index is not None:
+            return index
         else:
             # assign the vertex an index first come first served
             vertex.index = len(self.vertexlist)
-            # and add it to the list
+            # and add it to the list (and the index)
             self.vertexlist.append(vertex)
+            self.vertexmap[key] = vertex.index
             # return the index so we can build tris
             self.vertexcount += 1
             return vertex.index
@@ -239,8 +640,22 @@ class Node(object):
         scale = obj.scale
         scale = [scale[0], scale[2], scale[1]]
         
+        self.setup(name, pos, quad, scale, meshfile, PHYSICS)
+    
+    @classmethod
+    def world(cls, name, meshfile, PHYSICS=False):
+        """A node with the identity transform, for geometry that's already in world space (static batches)"""
+        node = cls.__new__(cls)
+        node.setup(name, [0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0], [1.0, 1.0, 1.0], meshfile, PHYSICS)
+        return node
+    
+    def setup(self, name, pos, quad, scale, meshfile, PHYSICS=False) -> None:
         # Name
         self.name = name
+        # mesh AABB (min, max) and bounding radius, and the world space AABB and radius (if the exporter knows them)
+        self.bounds = None
+        self.aabb = None
+        self.radius = None
         
         # Stuff ne *need* to know
         self.posd = dict()
@@ -276,6 +691,14 @@ class Node(object):
             # obj.collision
             self.set_physics_properties()
     
+    def set_bounds(self, bounds, matrix) -> None:
+        """The mesh's bounds (see zgeom.extents), and the world bounds they get under the node's 4x4 world matrix"""
+        lo, hi, radius = bounds
+        self.bounds = bounds
+        self.aabb = zgeom.transform_bounds(lo, hi, matrix)
+        # around the node's position, like ogre scales the mesh's sphere
+        self.radius = radius * zgeom.max_scale(matrix)
+    
     def set_physics_properties(self,
                                physics_type="STATIC",
                                aniso_friction=False,
@@ -312,6 +735,29 @@ class Node(object):
         self.ent_dict["velocity_min"] = velocity_min
 
 
+class InstanceGroup(object):
+    """Objects sharing a mesh (and materials) as one entry: the mesh, and a world transform per instance"""
+    
+    def __init__(self, name, meshfile, nodes, matrices, technique="HWInstancingBasic"):
+        self.name = name
+        self.meshfile = meshfile
+        # 3x4 world matrices (ogre axes), one per instance; the layout instance buffers use
+        self.matrices = np.asarray(matrices, dtype=np.float32)[:, :3, :]
+        # Ogre InstanceManager technique the runtime should use
+        self.technique = technique
+        # world space AABB of all instances
+        bounds = [node.aabb for node in nodes if node.aabb is not None]
+        self.aabb = None
+        if bounds:
+            self.aabb = (np.min([lo for lo, hi in bounds], axis=0), np.max([hi for lo, hi in bounds], axis=0))
+        # file of the transform table, once written
+        self.transforms = None
+    
+    @property
+    def count(self) -> int:
+        return len(self.matrices)
+
+
 class Scene(object):
     """Stores information about the scene, for the .scene"""
     
@@ -325,6 +771,7 @@ class Scene(object):
         # bgc = [0.05, 0.05, 0.05]
         
         self.nodes = list()
+        self.instance_groups = list()
         self.materials = list()
         
         # ALL OF THESE
@@ -339,6 +786,9 @@ class Scene(object):
     def add_node(self, Node) -> None:
         self.nodes.append(Node)
     
+    def add_instance_group(self, InstanceGroup) -> None:
+        self.instance_groups.append(InstanceGroup)
+    
     def add_material(self, Material) -> None:
         self.materials.append(Material)
     
@@ -443,18 +893,159 @@ class Material(object):
 
 
 class Bone(object):
-    """A Bone. It spook."""
+    """A bone of a .skeleton: its name, handle, and its parent's handle (None for roots)"""
     
-    def __init__(self, name, parentbone):
+    def __init__(self, name, handle, parent=None, deform=True):
         self.name = name
-    
-    # TODO: bone id
+        self.handle = handle
+        self.parent = parent
+        # whether vertices may be weighted to it
+        self.deform = deform
 
 
 class Skeleton(object):
-    """A Skeleton. It spook even more."""
+    """
+    Stores the bones of an armature for a .skeleton, in handle order: roots first, then breadth first,
+    so every parent comes before its children.
+    The rest pose is kept relative to the parents, in ogre axes; the roots are relative to the mesh object
+    the skeleton is exported with (an entity's skeleton lives in its mesh's space).
+    """
+    
+    def __init__(self, armature: bpy.types.Object, obj: bpy.types.Object):
+        self.name = armature.name
+        # the .skeleton file name the meshes link to; set by the exporter
+        self.filename = None
+        
+        bpy_bones = [bone for bone in armature.data.bones if bone.parent is None]
+        i = 0
+        while i < len(bpy_bones):
+            bpy_bones.extend(bpy_bones[i].children)
+            i += 1
+        handles = {bone.name: handle for handle, bone in enumerate(bpy_bones)}
+        
+        self.bones = [Bone(bone.name, handles[bone.name],
+                           handles[bone.parent.name] if bone.parent is not None else None,
+                           bone.use_deform)
+                      for bone in bpy_bones]
+        self.handles = handles
+        # the index of every bone in the armature (and its pose), per handle
+        indices = {bone.name: index for index, bone in enumerate(armature.data.bones)}
+        self.sources = np.array([indices[bone.name] for bone in bpy_bones], dtype=np.int64)
+        self.parents = np.array([-1 if bone.parent is None else bone.parent for bone in self.bones], dtype=np.int64)
+        
+        # armature space rest matrices
+        rest = np.array([np.array(bone.matrix_local, dtype=np.float64).reshape(4, 4) for bone in bpy_bones])
+        self.space = self.object_space(armature, obj)
+        local = zskel.local_matrices(rest.reshape(-1, 4, 4), self.parents, self.space)
+        
+        # (n, 4, 4) rest transforms relative to the parent, in ogre axes
+        self.rest = zgeom.swap_matrices(local)
+        self.positions, self.rotations, self.scales = zskel.decompose(self.rest)
+        
+        # zskel.Animation list, see sample_animations
+        self.animations = list()
+    
+    @staticmethod
+    def object_space(armature, obj) -> np.ndarray:
+        """Armature space -> the object's (mesh) space"""
+        arm_world = np.array(armature.matrix_world, dtype=np.float64).reshape(4, 4)
+        obj_world = np.array(obj.matrix_world, dtype=np.float64).reshape(4, 4)
+        return np.linalg.inv(obj_world) @ arm_world
+    
+    def same_space(self, armature, obj, tolerance=1e-5) -> bool:
+        """Whether another object deformed by the armature has the roots where this skeleton has them"""
+        return np.allclose(self.object_space(armature, obj), self.space, atol=tolerance)
     
-    def __init__(self, arg):
-        self.arg = arg
+    def deform_handle(self, name) -> int:
+        """Handle of the deforming bone of that name, -1 if there's none"""
+        handle = self.handles.get(name, -1)
+        if handle >= 0 and not self.bones[handle].deform:
+            return -1
+        return handle
     
-    # TODO: verify
+    def pose(self, armature) -> np.ndarray:
+        """The armature's current pose: (n, 4, 4) armature space bone matrices, in handle order"""
+        matrices = np.empty(len(armature.pose.bones) * 16, dtype=np.float32)
+        armature.pose.bones.foreach_get("matrix", matrices)
+        # matrices come out column by column
+        return matrices.reshape(-1, 4, 4).transpose(0, 2, 1)[self.sources]
+
+
+def action_frames(owner) -> tuple:
+    """The action of an armature (or shape key set) and its (first, last) frame, or None if it has none"""
+    if owner.animation_data is None or owner.animation_data.action is None:
+        return None
+    action = owner.animation_data.action
+    start, end = action.frame_range
+    return action, (int(round(start)), int(round(end)))
+
+
+def shape_values(key, blocks) -> np.ndarray:
+    """The current values of the given shape keys, read at once"""
+    values = np.empty(len(key.key_blocks), dtype=np.float32)
+    key.key_blocks.foreach_get("value", values)
+    return values[blocks]
+
+
+def sample_animations(scene, skeletons, tolerance=0.001, angle=0.002, meshes=()) -> dict:
+    """
+    Add the action of every (armature, Skeleton) as a zskel.Animation to the skeleton, and the action of
+    every (shape keys, Mesh) as a zpose.PoseAnimation to the mesh.
+    Everything is sampled in one sweep over the frames: a frame_set per frame (not per armature or bone),
+    every pose (and all shape key values) read at once per armature (mesh). The keyframes are reduced
+    within tolerance and angle (see zskel.reduce_track, zpose.PoseAnimation.from_samples).
+    Returns keyframe counts: sampled, kept, and tracks dropped as static (bones, and shapes).
+    """
+    fps = scene.render.fps / scene.render.fps_base
+    
+    # (action, first frame, samples, read the current frame, skeleton or mesh) per animated armature and mesh
+    entries = list()
+    for armature, skeleton in skeletons:
+        found = action_frames(armature)
+        if found is not None:
+            action, (start, end) = found
+            samples = np.empty((end - start + 1, len(skeleton.bones), 4, 4), dtype=np.float64)
+            entries.append((action, start, samples, functools.partial(skeleton.pose, armature), skeleton))
+    for key, og_mesh in meshes:
+        found = action_frames(key)
+        if found is not None:
+            action, (start, end) = found
+            samples = np.empty((end - start + 1, len(og_mesh.shape_keys)), dtype=np.float32)
+            entries.append((action, start, samples,
+                            functools.partial(shape_values, key, og_mesh.shape_keys.blocks), og_mesh))
+    
+    stats = {"animations": len(entries), "sampled": 0, "kept": 0, "tracks": 0, "static": 0}
+    if not entries:
+        return stats
+    
+    frame = scene.frame_current
+    first = min(start for action, start, samples, read, owner in entries)
+    last = max(start + len(samples) - 1 for action, start, samples, read, owner in entries)
+    try:
+        with zprof.span("sample", frames=last - first + 1):
+            for f in range(first, last + 1):
+                scene.frame_set(f)
+                for action, start, samples, read, owner in entries:
+                    if start <= f < start + len(samples):
+                        samples[f - start] = read()
+    finally:
+        scene.frame_set(frame)
+    
+    for action, start, samples, read, owner in entries:
+        times = np.arange(len(samples)) / fps
+        with zprof.span("reduce", action=action.name):
+            if isinstance(owner, Skeleton):
+                keys = zskel.pose_keys(samples, owner.parents, owner.space,
+                                       owner.positions, owner.rotations, owner.scales)
+                animation = zskel.Animation.from_samples(action.name, times, *keys, tolerance, angle)
+                owner.animations.append(animation)
+                tracks = len(animation.tracks)
+            else:
+                animation = zpose.PoseAnimation.from_samples(action.name, times, samples, tolerance)
+                owner.pose_animations.append(animation)
+                tracks = int(animation.active.sum())
+        stats["sampled"] += animation.sampled
+        stats["kept"] += animation.kept
+        stats["tracks"] += tracks
+        stats["static"] += animation.static
+    return stats
@@ -0,0 +1,119 @@
+import numpy as np
+
+from . import zgeom
+
+
+#
+# ## Transforms (blender world matrices, in ogre axes) ##
+#
+
+
+def world_matrix(obj) -> np.ndarray:
+    """The object's world matrix (4x4), working on ogre axes"""
+    return zgeom.swap_matrices(np.array(obj.matrix_world, dtype=np.float64).reshape(4, 4))
+
+
+def normalized(a) -> np.ndarray:
+    length = np.linalg.norm(a, axis=1, keepdims=True)
+    return a / np.where(length > 0.0, length, 1.0)
+
+
+#
+# ## StaticBatcher class (merges static objects per material and spatial cell) ##
+#
+
+
+class StaticBatcher(object):
+    """
+    Collects the submeshes of static objects, and merges them into batches: one per material and cell
+    (of a cell_size grid, by the object's world space centre), with the world transforms baked in.
+    A batch that would get more than max_vertices vertices is cut into several.
+    """
+    
+    def __init__(self, cell_size=50.0, max_vertices=zgeom.MAX_16BIT_VERTICES):
+        self.cell_size = cell_size
+        self.max_vertices = max_vertices
+        # (material, cell) -> [(geometry, start, end, matrix)]
+        self.pieces = dict()
+        self.objects = 0
+        # what the objects would have cost as entities: a draw call per submesh
+        self.draw_calls = 0
+        self.has_colours = False
+    
+    def cell(self, geometry, matrix) -> tuple:
+        if not geometry.vertexcount:
+            return (0, 0, 0)
+        centre = (geometry.positions.min(axis=0) + geometry.positions.max(axis=0)) * 0.5
+        centre = matrix[:3, :3] @ centre + matrix[:3, 3]
+        return tuple(int(c) for c in np.floor(centre / self.cell_size))
+    
+    def add(self, og_mesh, matrix) -> None:
+        """An object: its mesh (ogre_types.Mesh) and world matrix (see world_matrix)"""
+        cell = self.cell(og_mesh.geometry, matrix)
+        for material, start, end in og_mesh.submesh_ranges:
+            self.pieces.setdefault((material, cell), list()).append((og_mesh.geometry, start, end, matrix))
+            self.draw_calls += 1
+        self.objects += 1
+        self.has_colours = self.has_colours or og_mesh.has_colours
+    
+    def batches(self) -> list:
+        """(material, cell, geometry) per batch, in material and cell order"""
+        batches = list()
+        for (material, cell), pieces in sorted(self.pieces.items()):
+            # the vertices every piece uses, and its tris indexing those
+            used = list()
+            for geometry, start, end, matrix in pieces:
+                vertices, local = np.unique(geometry.indices[start:end].ravel(), return_inverse=True)
+                used.append((geometry, vertices, local.reshape(-1, 3), matrix))
+            
+            # greedy: pieces go into the current batch, until it would get too big
+            group = list()
+            count = 0
+            for piece in used:
+                if group and count + len(piece[1]) > self.max_vertices:
+                    batches.append((material, cell, self.merge(group)))
+                    group = list()
+                    count = 0
+                group.append(piece)
+                count += len(piece[1])
+            if group:
+                batches.append((material, cell, self.merge(group)))
+        return batches
+    
+    @staticmethod
+    def merge(pieces) -> zgeom.Geometry:
+        """One geometry of all pieces, every piece's vertices moved by its matrix (all at once)"""
+        counts = np.array([len(vertices) for geometry, vertices, local, matrix in pieces], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        
+        def gather(attr):
+            return np.concatenate([getattr(geometry, attr)[vertices] for geometry, vertices, local, matrix in pieces])
+        
+        # per vertex: the matrix of its piece
+        matrices = np.stack([matrix for geometry, vertices, local, matrix in pieces])
+        piece_of = np.repeat(np.arange(len(pieces)), counts)
+        linear = matrices[:, :3, :3]
+        # normals go with the inverse transpose, so non-uniform scales keep them perpendicular
+        normal_matrices = np.transpose(np.linalg.inv(linear), (0, 2, 1))
+        
+        positions = np.einsum("nij,nj->ni", linear[piece_of], gather("positions")) + matrices[piece_of, :3, 3]
+        normals = normalized(np.einsum("nij,nj->ni", normal_matrices[piece_of], gather("normals")))
+        tangents = normalized(np.einsum("nij,nj->ni", linear[piece_of], gather("tangents")))
+        binormals = normalized(np.einsum("nij,nj->ni", linear[piece_of], gather("binormals")))
+        
+        indices = list()
+        for (geometry, vertices, local, matrix), offset in zip(pieces, offsets):
+            tris = local + offset
+            if np.linalg.det(matrix[:3, :3]) < 0.0:
+                # mirrored: the winding flips too
+                tris = tris[:, [0, 2, 1]]
+            indices.append(tris)
+        
+        return zgeom.Geometry(positions,
+                              normals,
+                              uvs=gather("uvs"),
+                              tangents=tangents,
+                              binormals=binormals,
+                              colours=gather("colours"),
+                              indices=np.concatenate(indices) if indices else None
+                              )
@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+
+
+#
+# ## Hash utils ##
+#
+
+
+def text_hash(text) -> str:
+    return hashlib.blake2b(text.encode("UTF-8"), digest_size=20).hexdigest()
+
+
+def file_hash(filepath, chunk=1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(filepath, mode="rb") as fr:
+        for block in iter(lambda: fr.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_signature(filepath) -> list:
+    """Cheap change detection: size and modification time"""
+    st = os.stat(filepath)
+    return [st.st_size, st.st_mtime_ns]
+
+
+#
+# ## ExportCache class (manifest of the last export, for incremental exports) ##
+#
+
+
+class ExportCache(object):
+    """
+    JSON manifest next to the .scene, mapping every output file to the content hash of its inputs.
+    Outputs whose inputs didn't change (and that still exist) don't have to be generated again.
+    """
+    
+    version = 1
+    
+    def __init__(self, filepath, options):
+        self.filepath = filepath
+        self.root = os.path.dirname(os.path.abspath(filepath))
+        # the outputs depend on the options too; if those change, nothing in the cache holds
+        self.options = text_hash(json.dumps(options, sort_keys=True, default=str))
+        
+        self.entries = dict()
+        # outputs seen during this export; the others are stale
+        self.touched = set()
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def key(self, output) -> str:
+        # relative to the manifest, so the export folder can be moved around
+        return os.path.relpath(os.path.abspath(output), self.root).replace(os.sep, "/")
+    
+    def path(self, key) -> str:
+        return os.path.join(self.root, key)
+    
+    def load(self) -> None:
+        """Read the manifest, dropping everything that doesn't hold anymore"""
+        self.entries = dict()
+        try:
+            with open(self.filepath, mode="r", encoding="UTF-8") as fr:
+                manifest = json.load(fr)
+        except (OSError, ValueError):
+            return
+        
+        if manifest.get("version") != self.version or manifest.get("options") != self.options:
+            return
+        
+        # evict the entries whose output got deleted
+        for key, entry in manifest.get("entries", {}).items():
+            if os.path.isfile(self.path(key)):
+                self.entries[key] = entry
+    
+    def save(self) -> None:
+        """Write the manifest, with only the outputs of this export"""
+        entries = {key: self.entries[key] for key in sorted(self.touched) if key in self.entries}
+        with open(self.filepath, mode="w", encoding="UTF-8") as fw:
+            json.dump({"version": self.version, "options": self.options, "entries": entries}, fw, indent=1)
+    
+    def fresh(self, outputs, content_hash) -> bool:
+        """True if all outputs exist and were made from inputs with this hash"""
+        keys = [self.key(output) for output in outputs]
+        self.touched.update(keys)
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None or entry.get("hash") != content_hash or not os.path.isfile(self.path(key)):
+                # these get generated again; until they're recorded, they're unknown
+                for key in keys:
+                    self.entries.pop(key, None)
+                self.misses += 1
+                return False
+        self.hits += 1
+        return True
+    
+    def record(self, outputs, content_hash) -> None:
+        """Remember the outputs as made from inputs with this hash"""
+        for output in outputs:
+            key = self.key(output)
+            self.touched.add(key)
+            self.entries[key] = {"hash": content_hash}
+    
+    def texture_fresh(self, src, dst) -> bool:
+        """True if dst is a copy of src as it is now; src is only hashed if its size or mtime changed"""
+        key = self.key(dst)
+        self.touched.add(key)
+        entry = self.entries.get(key)
+        if entry is None or not os.path.isfile(dst):
+            self.entries.pop(key, None)
+            self.misses += 1
+            return False
+        
+        signature = file_signature(src)
+        if entry.get("signature") != signature:
+            # touched, but maybe not changed
+            if entry.get("hash") != file_hash(src):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return False
+            entry["signature"] = signature
+        self.hits += 1
+        return True
+    
+    def record_texture(self, src, dst, content_hash=None) -> None:
+        """Remember dst as a copy of src; pass the content hash if it's already known"""
+        key = self.key(dst)
+        self.touched.add(key)
+        if content_hash is None:
+            content_hash = file_hash(src)
+        self.entries[key] = {"hash": content_hash, "signature": file_signature(src)}
@@ -0,0 +1,91 @@
+import numpy as np
+
+
+#
+# ## Partitioning (node centres into cells) ##
+#
+
+
+def partition_grid(centres, cell_size) -> dict:
+    """Uniform grid: (i, j, k) cell -> indices of the centres in it"""
+    cells = np.floor(np.asarray(centres, dtype=np.float64) / cell_size).astype(np.int64)
+    keys, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1])
+    return {tuple(key.tolist()): group for key, group in zip(keys, groups)}
+
+
+def partition_octree(centres, max_nodes=256, max_depth=8) -> dict:
+    """
+    Octree over the centres' bounds, split until a cell has at most max_nodes centres (or max_depth is hit).
+    Leaf path (a digit 0..7 per level, "" for the root) -> indices of the centres in it.
+    """
+    centres = np.asarray(centres, dtype=np.float64)
+    leaves = dict()
+    if not len(centres):
+        return leaves
+    
+    # (path, indices, cell min, cell max)
+    todo = [("", np.arange(len(centres)), centres.min(axis=0), centres.max(axis=0))]
+    while todo:
+        path, indices, lo, hi = todo.pop()
+        if len(indices) <= max_nodes or len(path) >= max_depth or not np.any(hi > lo):
+            leaves[path] = indices
+            continue
+        mid = (lo + hi) * 0.5
+        # octant per centre: a bit per axis
+        above = centres[indices] > mid
+        octant = above[:, 0] * 1 + above[:, 1] * 2 + above[:, 2] * 4
+        for o in range(8):
+            sub = indices[octant == o]
+            if len(sub):
+                bits = np.array([o & 1, o & 2, o & 4], dtype=bool)
+                todo.append((path + str(o), sub, np.where(bits, mid, lo), np.where(bits, hi, mid)))
+    return leaves
+
+
+#
+# ## Chunk class (the nodes of a cell, and their bounds) ##
+#
+
+
+class Chunk(object):
+    """Nodes of one cell; the bounds are those of the nodes' AABBs (they may reach out of the cell)"""
+    
+    def __init__(self, name, nodes, lo, hi):
+        self.name = name
+        self.nodes = nodes
+        self.lo = lo
+        self.hi = hi
+
+
+def node_bounds(nodes) -> tuple:
+    """(min, max) arrays of the nodes' world AABBs; a node without one is a point at its position"""
+    lo = np.empty((len(nodes), 3), dtype=np.float64)
+    hi = np.empty((len(nodes), 3), dtype=np.float64)
+    for i, node in enumerate(nodes):
+        if node.aabb is not None:
+            lo[i], hi[i] = node.aabb
+        else:
+            lo[i] = hi[i] = (node.posd["x"], node.posd["y"], node.posd["z"])
+    return lo, hi
+
+
+def chunk_nodes(nodes, mode="GRID", cell_size=100.0, max_nodes=256) -> list:
+    """Bucket the nodes into chunks by the centres of their world AABBs, on a uniform GRID or an OCTREE"""
+    if not len(nodes):
+        return list()
+    lo, hi = node_bounds(nodes)
+    centres = (lo + hi) * 0.5
+    
+    chunks = list()
+    if mode == "OCTREE":
+        for path, indices in sorted(partition_octree(centres, max_nodes).items()):
+            chunks.append(("o" + path, indices))
+    else:
+        for key, indices in sorted(partition_grid(centres, cell_size).items()):
+            chunks.append(("%d_%d_%d" % key, indices))
+    
+    return [Chunk(name, [nodes[i] for i in indices.tolist()], lo[indices].min(axis=0), hi[indices].max(axis=0))
+            for name, indices in chunks]
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import zprof
+
+
+#
+# ## ConversionResult class (what one converter run left behind) ##
+#
+
+
+class ConversionResult(object):
+    """Outcome of one external conversion job"""
+    
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.seconds = 0.0
+        self.timed_out = False
+        self.error = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out and self.returncode == 0
+    
+    def as_dict(self) -> dict:
+        return {
+            "src": self.src,
+            "dst": self.dst,
+            "ok": self.ok,
+            "returncode": self.returncode,
+            "timed_out": self.timed_out,
+            "error": self.error,
+            "seconds": self.seconds,
+            "stdout": self.stdout,
+            "stderr": self.stderr,
+        }
+
+
+#
+# ## ConverterPool class (runs converter processes concurrently) ##
+#
+
+
+class ConverterPool(object):
+    """
+    Bounded pool of external converter processes (OgreXMLConverter and alike).
+    Jobs are submitted as soon as their input is written, so the caller can keep
+    producing the next input while earlier ones convert.
+    """
+    
+    def __init__(self, command, workers=0, timeout=0.0):
+        # command: argument list, the job's src and dst paths get appended to it
+        self.command = list(command)
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.timeout = timeout if timeout > 0.0 else None
+        
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.jobs = list()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def run(self, result) -> ConversionResult:
+        """Run one conversion (on a pool thread) and fill in its result"""
+        time_start = time.time()
+        try:
+            with zprof.span("convert", file=result.dst):
+                proc = subprocess.run(self.command + [result.src, result.dst],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE,
+                                      timeout=self.timeout
+                                      )
+            result.returncode = proc.returncode
+            result.stdout = proc.stdout.decode(errors="replace")
+            result.stderr = proc.stderr.decode(errors="replace")
+        except subprocess.TimeoutExpired as e:
+            # subprocess.run kills the process before raising
+            result.timed_out = True
+            result.stdout = (e.stdout or b"").decode(errors="replace")
+            result.stderr = (e.stderr or b"").decode(errors="replace")
+        except OSError as e:
+            result.error = str(e)
+        result.seconds = time.time() - time_start
+        return result
+    
+    def submit(self, src, dst) -> None:
+        """Queue the conversion of src into dst"""
+        self.jobs.append(self.executor.submit(self.run, ConversionResult(src, dst)))
+    
+    def results(self):
+        """Yield results in submission order, waiting for the ones that are still running"""
+        for job in self.jobs:
+            yield job.result()
+    
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+    
+    def report(self) -> dict:
+        """Structured report over all jobs (waits for them to finish)"""
+        results = [r.as_dict() for r in self.results()]
+        failed = [r for r in results if not r["ok"]]
+        return {
+            "workers": self.workers,
+            "timeout": self.timeout,
+            "jobs": len(results),
+            "failed": len(failed),
+            "seconds": sum(r["seconds"] for r in results),
+            "results": results,
+        }
@@ -0,0 +1,498 @@
+import hashlib
+
+import numpy as np
+
+from . import zprof
+
+
+#
+# ## Array utils (bpy-free, so they can be used and tested without blender) ##
+#
+
+
+def swap_axes(a) -> np.ndarray:
+    """Array version of ogre_types.cc: blender (x, y, z) -> ogre (x, z, -y)"""
+    a = np.asarray(a)
+    out = np.empty(a.shape, dtype=a.dtype)
+    out[:, 0] = a[:, 0]
+    out[:, 1] = a[:, 2]
+    out[:, 2] = -a[:, 1]
+    return out
+
+
+# blender (x, y, z) -> ogre (x, z, -y), as a 4x4 matrix
+SWAP = np.array([[1.0, 0.0, 0.0, 0.0],
+                 [0.0, 0.0, 1.0, 0.0],
+                 [0.0, -1.0, 0.0, 0.0],
+                 [0.0, 0.0, 0.0, 1.0]])
+
+
+def swap_matrices(matrices) -> np.ndarray:
+    """Matrix version of swap_axes: 4x4 (or (n, 4, 4)) transforms working on ogre axes"""
+    # the swap is a rotation: its inverse is its transpose
+    return SWAP @ np.asarray(matrices, dtype=np.float64) @ SWAP.T
+
+
+def bounds(positions) -> tuple:
+    """AABB (min, max) of a position array, as float64 arrays (zeros if there are no positions)"""
+    if not len(positions):
+        return np.zeros(3), np.zeros(3)
+    return positions.min(axis=0).astype(np.float64), positions.max(axis=0).astype(np.float64)
+
+
+def extents(positions) -> tuple:
+    """
+    AABB (min, max) and bounding radius of a position array, in one pass over it.
+    The radius is measured from the origin, like ogre's mesh bounding sphere.
+    """
+    lo, hi = bounds(positions)
+    if not len(positions):
+        return lo, hi, 0.0
+    return lo, hi, float(np.sqrt(np.einsum("ij,ij->i", positions, positions, dtype=np.float64).max()))
+
+
+def max_scale(matrix) -> float:
+    """The largest axis scale of a 4x4 matrix: how much a radius grows under it"""
+    return float(np.linalg.norm(np.asarray(matrix)[:3, :3], axis=0).max())
+
+
+def transform_bounds(lo, hi, matrix) -> tuple:
+    """AABB of an AABB's 8 corners moved by a 4x4 matrix"""
+    lo = np.asarray(lo, dtype=np.float64)
+    hi = np.asarray(hi, dtype=np.float64)
+    corners = np.array([[x, y, z] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+    corners = corners @ matrix[:3, :3].T + matrix[:3, 3]
+    return corners.min(axis=0), corners.max(axis=0)
+
+
+def weld(columns, tolerance=0.0) -> tuple:
+    """
+    Weld rows that are equal over all columns.
+    Returns the first row of every unique vertex (in first-come order, like Mesh.add_vertex)
+    and the index of the welded vertex for every input row.
+    """
+    data = np.hstack([np.asarray(c, dtype=np.float64).reshape(len(c), -1) for c in columns])
+    
+    if tolerance > 0.0:
+        # quantize, so rows within the tolerance land on the same key
+        keys = np.round(data / tolerance).astype(np.int64)
+    else:
+        # fold -0.0 into 0.0, so the keys compare like the floats do
+        keys = data + 0.0
+    keys = np.ascontiguousarray(keys)
+    
+    # view every row as one opaque (structured) element, so np.unique compares whole rows
+    row = np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))
+    _, first, inverse = np.unique(keys.view(row).ravel(), return_index=True, return_inverse=True)
+    
+    # np.unique sorts by key; renumber the vertices in order of first appearance
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    
+    return first[order], rank[inverse.ravel()]
+
+
+def fingerprint(arrays, extra="") -> str:
+    """Content hash over a list of arrays (dtype, shape and data), plus an extra string"""
+    h = hashlib.blake2b(digest_size=20)
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(("%s%s" % (a.dtype.str, a.shape)).encode())
+        h.update(memoryview(a.reshape(-1).view(np.uint8)))
+    h.update(extra.encode("UTF-8"))
+    return h.hexdigest()
+
+
+#
+# ## Vertex cache (triangle and vertex order, see Sander et al. "Fast Triangle Reordering") ##
+#
+
+
+def cache_stats(indices, vertexcount, cache_size=16) -> tuple:
+    """
+    Simulate a FIFO post-transform cache over a tri index buffer.
+    Returns (ACMR, ATVR): cache misses per tri, and per vertex (1.0 is the best there is).
+    """
+    flat = np.asarray(indices).ravel().tolist()
+    if not flat or not vertexcount:
+        return 0.0, 0.0
+    
+    # vertex -> time it entered the cache; it's still there while time - entered < cache_size
+    entered = dict()
+    time = 0
+    for v in flat:
+        t = entered.get(v)
+        if t is None or time - t >= cache_size:
+            entered[v] = time
+            time += 1
+    return time / (len(flat) / 3.0), time / float(vertexcount)
+
+
+def tipsify(indices, vertexcount, cache_size=16) -> np.ndarray:
+    """
+    Reorder tris for vertex cache locality (Tipsify): fan around a vertex, then move on
+    to the best vertex still in the cache. Returns the new tri order.
+    """
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    n_tris = len(indices)
+    if not n_tris:
+        return np.zeros(0, dtype=np.int64)
+    
+    # vertex -> tris using it (CSR)
+    flat = indices.ravel()
+    uses = np.bincount(flat, minlength=vertexcount)
+    offsets = np.zeros(vertexcount + 1, dtype=np.int64)
+    np.cumsum(uses, out=offsets[1:])
+    adjacency = (np.argsort(flat, kind="stable") // 3).tolist()
+    offsets = offsets.tolist()
+    tris = indices.tolist()
+    
+    # plain lists: this loop is per tri, and numpy scalar access is slow
+    live = uses.tolist()
+    stamp = [0] * vertexcount
+    emitted = [False] * n_tris
+    dead_end = list()
+    order = list()
+    
+    time = cache_size + 1
+    cursor = 0
+    fan = int(flat[0])
+    
+    while fan >= 0:
+        candidates = list()
+        for t in adjacency[offsets[fan]:offsets[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            order.append(t)
+            for v in tris[t]:
+                candidates.append(v)
+                dead_end.append(v)
+                live[v] -= 1
+                if time - stamp[v] > cache_size:
+                    stamp[v] = time
+                    time += 1
+        
+        # next fanning vertex: the oldest candidate that stays in the cache while its tris are emitted
+        fan = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time - stamp[v] + 2 * live[v] <= cache_size:
+                    priority = time - stamp[v]
+                if priority > best:
+                    best = priority
+                    fan = v
+        
+        if fan < 0:
+            # dead end: something recently used with tris left, or the next one in input order
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fan = v
+                    break
+            else:
+                while cursor < vertexcount:
+                    if live[cursor] > 0:
+                        fan = cursor
+                        break
+                    cursor += 1
+    
+    return np.asarray(order, dtype=np.int64)
+
+
+def bucket_tris(tri_groups, n_groups) -> tuple:
+    """
+    Stable (counting) sort of tris by group, eg. submesh.
+    Returns the tri order, and the number of tris per group.
+    """
+    tri_groups = np.asarray(tri_groups, dtype=np.int64)
+    counts = np.bincount(tri_groups, minlength=n_groups)
+    return np.argsort(tri_groups, kind="stable"), counts
+
+
+def fetch_order(indices, vertexcount) -> np.ndarray:
+    """Vertex order by first use in the index buffer (unused vertices last), for fetch locality"""
+    flat = np.asarray(indices, dtype=np.int64).ravel()
+    used, first = np.unique(flat, return_index=True)
+    order = used[np.argsort(first, kind="stable")]
+    unused = np.setdiff1d(np.arange(vertexcount, dtype=np.int64), used, assume_unique=True)
+    return np.concatenate([order, unused])
+
+
+#
+# ## Index width (16 or 32 bit) ##
+#
+
+
+# the most vertices 16 bit indices can address
+MAX_16BIT_VERTICES = 0xFFFF
+
+
+def needs_32bit(vertexcount) -> bool:
+    return vertexcount > MAX_16BIT_VERTICES
+
+
+def iter_rows(columns, chunk=4096):
+    """Yield a tuple of python value lists per row of the (equally long) column arrays"""
+    # converted chunk by chunk, so there's never a python copy of the whole arrays
+    n = len(columns[0]) if len(columns) else 0
+    for i in range(0, n, chunk):
+        yield from zip(*(c[i:i + chunk].tolist() for c in columns))
+
+
+def iter_tris(indices, chunk=4096):
+    """Yield [v1, v2, v3] lists of python ints per tri of an (n, 3) index array"""
+    for i in range(0, len(indices), chunk):
+        yield from indices[i:i + chunk].tolist()
+
+
+def split_indices(indices, max_vertices=MAX_16BIT_VERTICES) -> list:
+    """
+    Cut a tri index buffer into consecutive runs of tris that use at most max_vertices distinct vertices.
+    Returns (start, end) tri ranges.
+    """
+    indices = np.asarray(indices).reshape(-1, 3)
+    n = len(indices)
+    ranges = list()
+    start = 0
+    while start < n:
+        # a window of tris that (most likely) holds more than max_vertices vertices; grown if it doesn't
+        window = max_vertices
+        while True:
+            end = min(n, start + window)
+            flat = indices[start:end].ravel()
+            _, first = np.unique(flat, return_index=True)
+            new = np.zeros(len(flat), dtype=np.int64)
+            new[first] = 1
+            # distinct vertices used up to (and with) every tri
+            distinct = np.cumsum(new)[2::3]
+            fits = int(np.searchsorted(distinct, max_vertices, side="right"))
+            if fits < end - start or end == n:
+                break
+            window *= 2
+        ranges.append((start, start + fits))
+        start += fits
+    return ranges
+
+
+#
+# ## Geometry class (welded vertex and index arrays) ##
+#
+
+
+class Geometry(object):
+    """Welded vertex attributes and triangle indices of a mesh, as arrays"""
+    
+    def __init__(self,
+                 positions,
+                 normals,
+                 uvs=None,
+                 tangents=None,
+                 binormals=None,
+                 colours=None,
+                 indices=None,
+                 sources=None
+                 ):
+        n = len(positions)
+        
+        self.positions = np.asarray(positions, dtype=np.float32).reshape(n, 3)
+        self.normals = np.asarray(normals, dtype=np.float32).reshape(n, 3)
+        self.uvs = self.column(uvs, n, 2)
+        self.tangents = self.column(tangents, n, 3)
+        self.binormals = self.column(binormals, n, 3)
+        self.colours = self.column(colours, n, 4, fill=1.0)
+        
+        if indices is None:
+            indices = np.zeros((0, 3), dtype=np.uint32)
+        self.indices = np.asarray(indices, dtype=np.uint32).reshape(-1, 3)
+        
+        # skinned meshes: the blender vertex of every vertex, and its (n, 4) bone handles and weights
+        self.sources = None if sources is None else np.asarray(sources, dtype=np.int64).reshape(n)
+        self.bone_indices = None
+        self.bone_weights = None
+    
+    @staticmethod
+    def column(a, n, width, fill=0.0) -> np.ndarray:
+        if a is None:
+            return np.full((n, width), fill, dtype=np.float32)
+        return np.asarray(a, dtype=np.float32).reshape(n, width)
+    
+    @property
+    def vertexcount(self) -> int:
+        return len(self.positions)
+    
+    @property
+    def facecount(self) -> int:
+        return len(self.indices)
+    
+    def tangent_signs(self) -> np.ndarray:
+        """Handedness per vertex: 1 if the binormal is cross(normal, tangent), -1 if it's the opposite"""
+        dot = (np.cross(self.normals, self.tangents) * self.binormals).sum(axis=1)
+        return np.where(dot < 0.0, -1.0, 1.0).astype(np.float32)
+    
+    def skin(self, bone_indices, bone_weights) -> None:
+        """Take the bone handles and weights of every vertex from per blender vertex arrays"""
+        self.bone_indices = bone_indices[self.sources]
+        self.bone_weights = bone_weights[self.sources]
+    
+    def bone_assignments(self) -> tuple:
+        """(vertex, bone, weight) arrays of the influences that count (weight > 0), in vertex order"""
+        vertex, slot = np.nonzero(self.bone_weights > 0.0)
+        return vertex, self.bone_indices[vertex, slot], self.bone_weights[vertex, slot]
+    
+    def reorder_vertices(self, order) -> None:
+        """Put the vertices in the given order (old index per new index), and remap the indices"""
+        order = np.asarray(order, dtype=np.int64)
+        remap = np.empty(len(order), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        
+        self.positions = self.positions[order]
+        self.normals = self.normals[order]
+        self.uvs = self.uvs[order]
+        self.tangents = self.tangents[order]
+        self.binormals = self.binormals[order]
+        self.colours = self.colours[order]
+        self.indices = remap[self.indices].astype(np.uint32)
+        if self.sources is not None:
+            self.sources = self.sources[order]
+        if self.bone_weights is not None:
+            self.bone_indices = self.bone_indices[order]
+            self.bone_weights = self.bone_weights[order]
+    
+    def optimize_vertex_cache(self, cache_size=16, ranges=None) -> tuple:
+        """
+        Reorder the tris for the post-transform cache, then the vertices for fetch locality.
+        With (start, end) tri ranges (submeshes), tris are only reordered within their range.
+        Returns ACMR and ATVR before and after (dict), and the vertex order (old index per new index).
+        """
+        acmr, atvr = cache_stats(self.indices, self.vertexcount, cache_size)
+        
+        if ranges is None:
+            ranges = [(0, self.facecount)]
+        tri_order = [start + tipsify(self.indices[start:end], self.vertexcount, cache_size)
+                     for start, end in ranges]
+        self.indices = self.indices[np.concatenate(tri_order) if tri_order else np.zeros(0, dtype=np.int64)]
+        order = fetch_order(self.indices, self.vertexcount)
+        self.reorder_vertices(order)
+        
+        stats = {"acmr_before": acmr, "atvr_before": atvr}
+        stats["acmr_after"], stats["atvr_after"] = cache_stats(self.indices, self.vertexcount, cache_size)
+        return stats, order
+    
+    def subset(self, start, end):
+        """Geometry of the tris start..end, with only the vertices they use (in the current order)"""
+        used, inverse = np.unique(self.indices[start:end].ravel(), return_inverse=True)
+        geometry = Geometry(self.positions[used],
+                            self.normals[used],
+                            uvs=self.uvs[used],
+                            tangents=self.tangents[used],
+                            binormals=self.binormals[used],
+                            colours=self.colours[used],
+                            indices=inverse.reshape(-1, 3),
+                            sources=None if self.sources is None else self.sources[used]
+                            )
+        if self.bone_weights is not None:
+            geometry.bone_indices = self.bone_indices[used]
+            geometry.bone_weights = self.bone_weights[used]
+        return geometry
+    
+    @classmethod
+    def from_loops(cls,
+                   positions,
+                   normals,
+                   uvs=None,
+                   tangents=None,
+                   binormals=None,
+                   colours=None,
+                   tolerance=0.0,
+                   sources=None
+                   ):
+        """
+        Build welded geometry from per-loop attribute arrays.
+        Every three consecutive loops make a tri; colours only take part in welding if given.
+        sources (the blender vertex per loop) keeps loops of different vertices apart, for skinning.
+        """
+        n = len(positions)
+        if n % 3:
+            raise ValueError("Loop count is not a multiple of 3, is the mesh triangulated?")
+        
+        uvs = cls.column(uvs, n, 2)
+        tangents = cls.column(tangents, n, 3)
+        binormals = cls.column(binormals, n, 3)
+        columns = [positions, normals, uvs, tangents, binormals]
+        if colours is not None:
+            columns.append(colours)
+        colours = cls.column(colours, n, 4, fill=1.0)
+        if sources is not None:
+            # exact, whatever the tolerance
+            sources = np.asarray(sources, dtype=np.int64)
+            columns.append(sources * max(tolerance, 1.0))
+        
+        with zprof.span("weld"):
+            first, remap = weld(columns, tolerance)
+        
+        return cls(np.asarray(positions)[first],
+                   np.asarray(normals)[first],
+                   uvs=uvs[first],
+                   tangents=tangents[first],
+                   binormals=binormals[first],
+                   colours=colours[first],
+                   indices=remap.reshape(-1, 3),
+                   sources=None if sources is None else sources[first]
+                   )
+    
+    @classmethod
+    def from_vertices(cls, vertexlist, tris):
+        """Pack a list of ogre_types.Vertex (and tri index lists) into arrays; sources come along if set"""
+        
+        def pack(attr, keys):
+            return [[getattr(v, attr)[k] for k in keys] for v in vertexlist]
+        
+        xyz = ("x", "y", "z")
+        return cls(pack("posd", xyz),
+                   pack("nord", xyz),
+                   uvs=pack("uvd", ("u", "v")),
+                   tangents=pack("tand", xyz),
+                   binormals=pack("bind", xyz),
+                   colours=pack("rgbad", ("r", "g", "b", "a")),
+                   indices=tris,
+                   sources=[v.source for v in vertexlist] if vertexlist and vertexlist[0].source is not None else None
+                   )
+    
+    def iter_vertices(self, chunk=4096):
+        """Yield (position, normal, uv, tangent, binormal) lists of python floats per vertex"""
+        return iter_rows((self.positions, self.normals, self.uvs, self.tangents, self.binormals), chunk)
+    
+    def iter_faces(self, chunk=4096):
+        """Yield [v1, v2, v3] lists of python ints per tri"""
+        for i in range(0, self.facecount, chunk):
+            yield from self.indices[i:i + chunk].tolist()
+
+
+#
+# ## Submesh class (a material, and the tris using it) ##
+#
+
+
+class Submesh(object):
+    """Tris of one material; they index the mesh's shared geometry, unless the submesh has its own"""
+    
+    def __init__(self, material, indices, geometry=None):
+        self.material = material
+        self.indices = np.asarray(indices, dtype=np.uint32).reshape(-1, 3)
+        # dedicated vertices (usesharedvertices false), or None
+        self.geometry = geometry
+        # index array per LOD level (see zlod.generate_lods), over the same vertices
+        self.lods = list()
+    
+    def use32bitindexes(self, shared=None) -> bool:
+        """Whether the indices need 32 bits, given the geometry they index"""
+        geometry = self.geometry if self.geometry is not None else shared
+        return needs_32bit(geometry.vertexcount)
+    
+    def iter_faces(self, chunk=4096):
+        """Yield [v1, v2, v3] lists of python ints per tri"""
+        return iter_tris(self.indices, chunk)
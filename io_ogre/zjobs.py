@@ -0,0 +1,694 @@
+"""
+Headless batch export: a job list (files x scenes x option sets) run by background blender workers.
+
+    python io_ogre/zjobs.py jobs.json --blender /path/to/blender --workers 8 --retries 2 --json summary.json
+
+The job list:
+    
+    {
+        "files": ["levels/*.blend"],
+        "scenes": ["Scene"],
+        "options": {"default": {}, "lod": {"lod_levels": 3}},
+        "output": "build/{options}/{file}/{scene}.scene"
+    }
+
+files are globs (relative to the job list), scenes default to each file's active scene, options are
+named sets of ogre_export.save keyword arguments, and output is formatted with the file's base name,
+the scene and the option set name. Explicit jobs can be listed under "jobs", too.
+
+Every job runs in a blender process of its own (`blender --background <file> --python zjobs.py -- --worker
+<job>`), so a crash takes down one job, not the batch; crashed and timed out jobs are retried.
+Anything that can stand in for blender's command line can replace it (see benchmarks/fake_blender.py).
+
+With --warm, every worker is a long-lived blender instead (`-- --serve`), taking export requests as json
+lines on stdin and answering on stdout (see serve): blender starts and the addon registers once per worker,
+and a file's jobs all go to the worker that loaded it, so it's loaded once.
+
+This module doesn't import bpy (or the rest of the addon) until it runs as a worker, inside blender.
+"""
+
+import os
+import sys
+import glob
+import json
+import queue
+import shlex
+import time
+import types
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+log = logging.getLogger("io_ogre.zjobs")
+
+
+# save() arguments without defaults, what a job gets unless its options say otherwise
+DEFAULT_OPTIONS = {
+    "export_armature": False,
+    "export_animation": False,
+    "export_physics": False,
+    "export_materials": True,
+    "do_binary": True,
+}
+
+# lines of a failed job's output kept in the summary
+LOG_TAIL = 20
+
+# a warm worker's replies, among whatever else blender and the exporter print to stdout
+REPLY = "BOE-REPLY "
+
+
+#
+# ## Job class (one file, scene and option set) ##
+#
+
+
+class Job(object):
+    """One export: a .blend, a scene in it (None for the active one), save() options and the .scene to write"""
+    
+    def __init__(self, blend, scene, options, output, options_name="default"):
+        self.blend = blend
+        self.scene = scene
+        self.options = dict(options)
+        self.output = output
+        self.options_name = options_name
+    
+    @property
+    def name(self) -> str:
+        return "%s:%s:%s" % (os.path.basename(self.blend), self.scene or "<active>", self.options_name)
+    
+    def as_dict(self) -> dict:
+        return {
+            "blend": self.blend,
+            "scene": self.scene,
+            "options": self.options,
+            "options_name": self.options_name,
+            "output": self.output,
+        }
+
+
+def expand_jobs(spec, base_dir=".") -> list:
+    """The jobs of a job list (see the module doc): every file x scene x option set, then the explicit ones"""
+    jobs = list()
+    
+    files = list()
+    for pattern in spec.get("files", []):
+        matches = sorted(glob.glob(os.path.join(base_dir, pattern)))
+        if not matches:
+            log.warning("no files match %s", pattern)
+        files.extend(matches)
+    scenes = spec.get("scenes") or [None]
+    option_sets = spec.get("options") or {"default": {}}
+    output = spec.get("output", "{file}/{scene}.scene")
+    
+    for blend in files:
+        file_name = os.path.splitext(os.path.basename(blend))[0]
+        for scene in scenes:
+            for options_name, options in sorted(option_sets.items()):
+                path = output.format(file=file_name, scene=scene or "scene", options=options_name)
+                jobs.append(Job(os.path.abspath(blend), scene, options,
+                                os.path.abspath(os.path.join(base_dir, path)), options_name))
+    
+    for entry in spec.get("jobs", []):
+        jobs.append(Job(os.path.abspath(os.path.join(base_dir, entry["blend"])),
+                        entry.get("scene"),
+                        entry.get("options", {}),
+                        os.path.abspath(os.path.join(base_dir, entry["output"])),
+                        entry.get("options_name", "default")))
+    return jobs
+
+
+def load_jobs(filepath) -> list:
+    with open(filepath) as f:
+        spec = json.load(f)
+    return expand_jobs(spec, os.path.dirname(os.path.abspath(filepath)))
+
+
+#
+# ## JobResult class (what the attempts at a job came to) ##
+#
+
+
+class JobResult(object):
+    """Outcome of a job, over all its attempts"""
+    
+    def __init__(self, job):
+        self.job = job
+        self.attempts = 0
+        self.crashes = 0
+        self.returncode = None
+        self.timed_out = False
+        # wall time of all attempts, and the export's own time (as the worker measured it)
+        self.seconds = 0.0
+        self.export_seconds = None
+        # waiting for a worker, and loading the file (warm workers only)
+        self.queue_seconds = None
+        self.load_seconds = None
+        self.error = None
+        self.output = ""
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.export_seconds is not None
+    
+    def as_dict(self) -> dict:
+        return {
+            "job": self.job.name,
+            "blend": self.job.blend,
+            "scene": self.job.scene,
+            "options": self.job.options_name,
+            "output": self.job.output,
+            "ok": self.ok,
+            "attempts": self.attempts,
+            "crashes": self.crashes,
+            "returncode": self.returncode,
+            "timed_out": self.timed_out,
+            "seconds": self.seconds,
+            "export_seconds": self.export_seconds,
+            "queue_seconds": self.queue_seconds,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+            "log_tail": "\n".join(self.output.splitlines()[-LOG_TAIL:]) if not self.ok else "",
+        }
+
+
+#
+# ## JobRunner class (blender worker processes, with retries) ##
+#
+
+
+class JobRunner(object):
+    """
+    Runs jobs in up to workers blender processes at a time, a fresh process per attempt.
+    An attempt that crashes (no result from the worker) or times out is retried, up to retries times;
+    an export that fails with an error is not, the next attempt would fail the same way.
+    """
+    
+    def __init__(self, blender=("blender", ), workers=0, timeout=0.0, retries=2, log_dir=None):
+        # blender: argument list, the worker's arguments get appended to it
+        self.blender = list(blender)
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.timeout = timeout if timeout > 0.0 else None
+        self.retries = retries
+        self.log_dir = log_dir
+        self.work_dir = None
+        self.time_start = None
+        # blender starts (and the seconds until ready), where known; otherwise a start per attempt
+        self.startups = None
+        self.startup_seconds = None
+    
+    def command(self, job, job_path) -> list:
+        return self.blender + [
+                "--background", job.blend,
+                "--factory-startup",
+                "--python", os.path.abspath(__file__),
+                "--", "--worker", job_path]
+    
+    def attempt(self, result, job_path, result_path) -> bool:
+        """Run the job once; False if the worker died before it could report"""
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        result.attempts += 1
+        time_start = time.time()
+        try:
+            proc = subprocess.run(self.command(result.job, job_path),
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT,
+                                  timeout=self.timeout
+                                  )
+            result.returncode = proc.returncode
+            result.timed_out = False
+            result.output = proc.stdout.decode(errors="replace")
+        except subprocess.TimeoutExpired as e:
+            # subprocess.run kills the process before raising
+            result.timed_out = True
+            result.output = (e.stdout or b"").decode(errors="replace")
+        except OSError as e:
+            # blender itself can't be started: no point in retrying
+            result.error = str(e)
+            return True
+        finally:
+            result.seconds += time.time() - time_start
+        
+        if not os.path.exists(result_path):
+            result.crashes += 1
+            result.error = "timed out" if result.timed_out else "worker exited with %s" % result.returncode
+            return False
+        
+        try:
+            with open(result_path) as f:
+                report = json.load(f)
+            error, ok, seconds = report["error"], report["ok"], report["seconds"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # cut off (or garbled) on the way out: as good as no result
+            result.crashes += 1
+            result.error = "unreadable result (%s), worker exited with %s" % (e, result.returncode)
+            return False
+        result.error = error
+        result.export_seconds = seconds if ok else None
+        return True
+    
+    def run_job(self, index, job) -> JobResult:
+        result = JobResult(job)
+        job_path = os.path.join(self.work_dir, "job_%d.json" % index)
+        result_path = os.path.join(self.work_dir, "job_%d.result.json" % index)
+        with open(job_path, mode="w") as f:
+            json.dump(dict(job.as_dict(), result=result_path), f)
+        os.makedirs(os.path.dirname(job.output), exist_ok=True)
+        result.queue_seconds = time.time() - self.time_start
+        
+        while not self.attempt(result, job_path, result_path) and result.attempts <= self.retries:
+            log.warning("%s: %s, retrying (%d/%d)", job.name, result.error, result.attempts, self.retries)
+        
+        self.finish(index, result)
+        return result
+    
+    def finish(self, index, result) -> None:
+        """Log how a job went, and keep its output"""
+        job = result.job
+        if result.ok:
+            log.info("%s: done in %.2f sec", job.name, result.seconds)
+        else:
+            log.error("%s: failed after %d attempt(s): %s", job.name, result.attempts,
+                      result.error.strip().splitlines()[-1] if result.error else "no result")
+        
+        if self.log_dir is not None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(os.path.join(self.log_dir, "job_%d.log" % index), mode="w") as f:
+                f.write(result.output)
+    
+    def run(self, jobs) -> list:
+        """Run all jobs; results in job order"""
+        self.time_start = time.time()
+        with tempfile.TemporaryDirectory(prefix="boe_jobs_") as work_dir:
+            self.work_dir = work_dir
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(self.run_job, range(len(jobs)), jobs))
+            self.work_dir = None
+        return results
+
+
+#
+# ## WarmWorker class (a long-lived blender, serving requests) ##
+#
+
+
+class WarmWorker(object):
+    """A blender process running serve, and a thread reading its output (so replies can be waited for)"""
+    
+    def __init__(self, command):
+        self.command = command
+        self.proc = None
+        self.lines = None
+        # what it printed besides the replies, since the last request
+        self.output = list()
+        # whether the last receive gave up waiting (rather than the process dying)
+        self.timed_out = False
+        # whether the last receive got a reply it couldn't parse
+        self.garbled = False
+    
+    @staticmethod
+    def read(stream, lines) -> None:
+        for line in stream:
+            lines.put(line)
+        # the process is gone
+        lines.put(None)
+    
+    def start(self, timeout=None) -> bool:
+        """Start the process and wait until it's ready; False if it died (or hung) on the way"""
+        self.proc = subprocess.Popen(self.command,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT,
+                                     universal_newlines=True,
+                                     errors="replace",
+                                     bufsize=1
+                                     )
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read, args=(self.proc.stdout, self.lines), daemon=True).start()
+        self.output = list()
+        ready = self.receive(timeout)
+        return ready is not None and ready.get("ready", False)
+    
+    def receive(self, timeout=None):
+        """The next reply, collecting the other output on the way; None if the process died, timed out or garbled it"""
+        deadline = None if timeout is None else time.time() + timeout
+        self.timed_out = False
+        self.garbled = False
+        while True:
+            try:
+                line = self.lines.get(timeout=None if deadline is None else max(0.0, deadline - time.time()))
+            except queue.Empty:
+                self.timed_out = True
+                return None
+            if line is None:
+                return None
+            if line.startswith(REPLY):
+                try:
+                    return json.loads(line[len(REPLY):])
+                except ValueError:
+                    # cut off or mixed up with other output: the worker isn't to be trusted any more
+                    self.garbled = True
+                    self.output.append(line)
+                    return None
+            self.output.append(line)
+    
+    def request(self, job, timeout=None):
+        """Send a job, and wait for its reply (see receive)"""
+        self.output = list()
+        try:
+            self.proc.stdin.write(json.dumps(job.as_dict()) + "\n")
+            self.proc.stdin.flush()
+        except OSError:
+            # the pipe broke: it's gone already
+            return None
+        return self.receive(timeout)
+    
+    def kill(self):
+        """Stop it the hard way; returns its exit code"""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        returncode = self.proc.wait()
+        self.proc = None
+        return returncode
+    
+    def stop(self) -> None:
+        """Ask it to quit, if it's running"""
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.write(json.dumps({"quit": True}) + "\n")
+            self.proc.stdin.close()
+            self.proc.wait(timeout=30.0)
+            self.proc = None
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+#
+# ## WarmRunner class (jobs on long-lived workers) ##
+#
+
+
+class WarmRunner(JobRunner):
+    """
+    Runs jobs on up to workers warm workers (see serve), a file's jobs all on one of them.
+    A worker that crashes or times out is restarted, and the job retried, like JobRunner does.
+    """
+    
+    def __init__(self, blender=("blender", ), workers=0, timeout=0.0, retries=2, log_dir=None):
+        JobRunner.__init__(self, blender, workers, timeout, retries, log_dir)
+        self.startups = 0
+        self.startup_seconds = 0.0
+        self.lock = threading.Lock()
+    
+    def command(self) -> list:
+        return self.blender + [
+                "--background",
+                "--factory-startup",
+                "--python", os.path.abspath(__file__),
+                "--", "--serve"]
+    
+    def start(self, worker) -> bool:
+        time_start = time.time()
+        ready = worker.start(self.timeout)
+        with self.lock:
+            self.startups += 1
+            self.startup_seconds += time.time() - time_start
+        return ready
+    
+    def attempt_on(self, worker, result) -> bool:
+        """Run the job once, starting the worker if needed; False if it died (or hung) before replying"""
+        result.attempts += 1
+        time_start = time.time()
+        try:
+            reply = None
+            if worker.proc is not None or self.start(worker):
+                reply = worker.request(result.job, self.timeout)
+        except OSError as e:
+            # blender itself can't be started: no point in retrying
+            result.error = str(e)
+            return True
+        finally:
+            result.seconds += time.time() - time_start
+        result.output = "".join(worker.output)
+        
+        if reply is None:
+            result.crashes += 1
+            result.timed_out = worker.timed_out
+            garbled = worker.garbled
+            result.returncode = worker.kill()
+            if garbled:
+                result.error = "unreadable reply, worker killed"
+            else:
+                result.error = "timed out" if result.timed_out else "worker exited with %s" % result.returncode
+            return False
+        
+        result.timed_out = False
+        result.error = reply["error"]
+        result.export_seconds = reply["export_seconds"] if reply["ok"] else None
+        result.load_seconds = reply["load_seconds"]
+        return True
+    
+    def serve_files(self, files, results) -> None:
+        """A worker's loop: take a file's jobs off the queue, until there are none left"""
+        worker = WarmWorker(self.command())
+        try:
+            while True:
+                try:
+                    indices = files.get_nowait()
+                except queue.Empty:
+                    return
+                for index in indices:
+                    result = results[index]
+                    os.makedirs(os.path.dirname(result.job.output), exist_ok=True)
+                    result.queue_seconds = time.time() - self.time_start
+                    while not self.attempt_on(worker, result) and result.attempts <= self.retries:
+                        log.warning("%s: %s, retrying (%d/%d)", result.job.name, result.error,
+                                    result.attempts, self.retries)
+                    self.finish(index, result)
+        finally:
+            worker.stop()
+    
+    def run(self, jobs) -> list:
+        """Run all jobs; results in job order"""
+        self.time_start = time.time()
+        results = [JobResult(job) for job in jobs]
+        
+        # a file's jobs stay together, so the worker that loaded the file does them all
+        indices = dict()
+        for index, job in enumerate(jobs):
+            indices.setdefault(job.blend, list()).append(index)
+        files = queue.Queue()
+        for file_indices in indices.values():
+            files.put(file_indices)
+        
+        workers = min(self.workers, len(indices))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for job in [executor.submit(self.serve_files, files, results) for i in range(workers)]:
+                job.result()
+        return results
+
+
+#
+# ## Summary ##
+#
+
+
+def summary(results, wall_seconds, workers, startups=None, startup_seconds=None) -> dict:
+    """
+    Aggregate timings and failures over all jobs.
+    startups are the blender starts (and startup_seconds their time) if the runner knows them,
+    otherwise every attempt counts as one.
+    """
+    jobs = [r.as_dict() for r in results]
+    done = [r for r in jobs if r["ok"]]
+    job_seconds = sum(r["seconds"] for r in jobs)
+    queued = [r["queue_seconds"] for r in jobs if r["queue_seconds"] is not None]
+    return {
+        "workers": workers,
+        "jobs": len(jobs),
+        "ok": len(done),
+        "failed": len(jobs) - len(done),
+        "retried": sum(1 for r in jobs if r["attempts"] > 1),
+        "crashes": sum(r["crashes"] for r in jobs),
+        "wall_seconds": wall_seconds,
+        "job_seconds": job_seconds,
+        "export_seconds": sum(r["export_seconds"] for r in done),
+        # how long jobs waited for a worker, against how long they took
+        "queue_seconds_mean": sum(queued) / len(queued) if queued else None,
+        "queue_seconds_max": max(queued) if queued else None,
+        "load_seconds": sum(r["load_seconds"] or 0.0 for r in jobs),
+        "startups": startups if startups is not None else sum(r["attempts"] for r in jobs),
+        "startup_seconds": startup_seconds,
+        # how much the workers got out of running side by side
+        "parallelism": job_seconds / wall_seconds if wall_seconds > 0.0 else None,
+        "slowest": [r["job"] for r in sorted(jobs, key=lambda r: r["seconds"], reverse=True)[:5]],
+        "results": jobs,
+    }
+
+
+def summary_lines(report) -> list:
+    lines = ["%d jobs on %d workers: %d ok, %d failed, %d retried (%d crashes)" % (
+             report["jobs"], report["workers"], report["ok"], report["failed"], report["retried"], report["crashes"]),
+             "%.2f sec wall, %.2f sec in jobs (%.1fx), %.2f sec exporting" % (
+             report["wall_seconds"], report["job_seconds"], report["parallelism"] or 0.0, report["export_seconds"])]
+    if report["queue_seconds_mean"] is not None:
+        lines.append("queue latency %.2f sec mean, %.2f sec max; export %.3f sec mean per job" % (
+                     report["queue_seconds_mean"], report["queue_seconds_max"],
+                     report["export_seconds"] / max(1, report["ok"])))
+    lines.append("%d blender starts%s, %.2f sec loading files" % (
+                 report["startups"],
+                 "" if report["startup_seconds"] is None else " (%.2f sec)" % report["startup_seconds"],
+                 report["load_seconds"]))
+    for r in report["results"]:
+        if not r["ok"]:
+            lines.append("FAILED %s after %d attempt(s): %s" % (r["job"], r["attempts"], r["error"]))
+    return lines
+
+
+#
+# ## Worker (inside blender) ##
+#
+
+
+def scene_context(bpy, scene_name):
+    """What ogre_export.save needs of a context, for the named scene (the active one by default)"""
+    context = bpy.context
+    if scene_name is None or scene_name == context.scene.name:
+        return context
+    # no window to switch scenes in, in the background: the scene's own depsgraph will do
+    scene = bpy.data.scenes[scene_name]
+    depsgraph = scene.view_layers[0].depsgraph
+    depsgraph.update()
+    return types.SimpleNamespace(scene=scene, depsgraph=depsgraph, window_manager=context.window_manager)
+
+
+def exporter():
+    """The addon's ogre_export, from this checkout (next to this file)"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    from io_ogre import ogre_export
+    return ogre_export
+
+
+def export(job) -> float:
+    """Export a job (see Job.as_dict) from the loaded file; returns the seconds it took"""
+    import bpy
+    ogre_export = exporter()
+    time_start = time.time()
+    options = dict(DEFAULT_OPTIONS, **job["options"])
+    ogre_export.save(scene_context(bpy, job["scene"]), job["output"], **options)
+    return time.time() - time_start
+
+
+def worker(job_path) -> int:
+    """Export one job and report to its result file; the exit code only says whether reporting worked"""
+    with open(job_path) as f:
+        job = json.load(f)
+    
+    report = {"ok": False, "seconds": None, "error": None}
+    try:
+        report["seconds"] = export(job)
+        report["ok"] = True
+    except Exception:
+        report["error"] = traceback.format_exc()
+        print(report["error"], file=sys.stderr)
+    
+    with open(job["result"], mode="w") as f:
+        json.dump(report, f)
+    return 0
+
+
+def reply(message) -> None:
+    sys.stdout.write(REPLY + json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def serve() -> int:
+    """
+    Warm worker: a request per line on stdin (a job, see Job.as_dict; {"quit": true} or the end of stdin stops it),
+    a reply line per request on stdout (prefixed with REPLY, as blender and the exporter print there too).
+    The addon stays imported, and a file stays loaded for the requests after it that are on the same file.
+    """
+    import bpy
+    exporter()
+    loaded = None
+    reply({"ready": True})
+    
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if request.get("quit"):
+            break
+        report = {"ok": False, "error": None, "received": time.time(), "load_seconds": 0.0, "export_seconds": None}
+        try:
+            if request["blend"] != loaded:
+                time_start = time.time()
+                loaded = None
+                bpy.ops.wm.open_mainfile(filepath=request["blend"])
+                loaded = request["blend"]
+                report["load_seconds"] = time.time() - time_start
+            report["export_seconds"] = export(request)
+            report["ok"] = True
+        except Exception:
+            report["error"] = traceback.format_exc()
+            print(report["error"], file=sys.stderr)
+        reply(report)
+    return 0
+
+
+#
+# ## Command line ##
+#
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export .blend files headless, in parallel blender workers")
+    parser.add_argument("jobs", help="job list (json, see the module doc)")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"),
+                        help="blender command, or anything taking its command line (default: $BLENDER)")
+    parser.add_argument("--workers", "-j", type=int, default=0, help="blender processes at a time (0: a cpu each)")
+    parser.add_argument("--timeout", type=float, default=0.0, help="seconds a job may take (0: no limit)")
+    parser.add_argument("--retries", type=int, default=2, help="attempts after a crash or timeout")
+    parser.add_argument("--warm", action="store_true",
+                        help="long-lived workers: blender starts once per worker, a file loads once for all its jobs")
+    parser.add_argument("--log-dir", help="keep every job's blender output in this directory")
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(format="BOE %(levelname)s: %(message)s", level=args.log_level)
+    
+    jobs = load_jobs(args.jobs)
+    blender = shlex.split(args.blender, posix=os.name != "nt")
+    runner = (WarmRunner if args.warm else JobRunner)(blender, args.workers, args.timeout, args.retries, args.log_dir)
+    log.info("%d jobs, %d workers", len(jobs), runner.workers)
+    
+    time_start = time.time()
+    results = runner.run(jobs)
+    report = summary(results, time.time() - time_start, runner.workers, runner.startups, runner.startup_seconds)
+    
+    for line in summary_lines(report):
+        print(line)
+    if args.json:
+        with open(args.json, mode="w") as f:
+            json.dump(report, f, indent=1)
+    return 0 if not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    # blender hands the script everything, its own arguments are after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    if argv[:1] == ["--worker"]:
+        sys.exit(worker(argv[1]))
+    if argv[:1] == ["--serve"]:
+        sys.exit(serve())
+    sys.exit(main(argv))
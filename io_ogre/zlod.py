@@ -0,0 +1,284 @@
+import math
+import heapq
+
+import numpy as np
+
+
+#
+# ## LOD levels (what to simplify to, and when to switch) ##
+#
+
+
+# the view the screen space error is measured in
+SCREEN_HEIGHT = 1080
+FIELD_OF_VIEW = math.radians(60.0)
+
+
+def screen_tolerance(distance, pixel_error=1.0) -> float:
+    """Geometric error that shows up as pixel_error pixels at the given distance"""
+    return distance * 2.0 * math.tan(FIELD_OF_VIEW / 2.0) / SCREEN_HEIGHT * pixel_error
+
+
+def lod_levels(count, mode="RATIO", ratio=0.5, distance=25.0, pixel_error=1.0) -> list:
+    """
+    (usage distance, tri ratio to keep, max error) per LOD level.
+    Every level switches in at twice the distance of the one before.
+    RATIO keeps ratio^i of the tris at level i; SCREEN simplifies as far as the screen space error allows.
+    """
+    levels = list()
+    for i in range(1, count + 1):
+        usage = distance * 2.0 ** (i - 1)
+        if mode == "SCREEN":
+            levels.append((usage, 0.0, screen_tolerance(usage, pixel_error)))
+        else:
+            levels.append((usage, ratio ** i, math.inf))
+    return levels
+
+
+def normal(a, b, c) -> tuple:
+    """(Unnormalized) normal of a tri; plain python, it's called for a handful of tris at a time"""
+    ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+    return uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+
+
+#
+# ## Simplifier class (quadric error metric, half-edge collapses) ##
+#
+
+
+class Simplifier(object):
+    """
+    Garland-Heckbert quadric error simplification, with half-edge collapses: a vertex is merged into
+    one of its neighbours, so vertices never move and every level indexes the original vertex data.
+    Vertices on seams (several vertices at one position), open borders and submesh borders stay put.
+    """
+    
+    def __init__(self, positions, indices, tri_submesh=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+        n_verts = len(self.positions)
+        n_tris = len(indices)
+        if tri_submesh is None:
+            tri_submesh = np.zeros(n_tris, dtype=np.int64)
+        tri_submesh = np.asarray(tri_submesh, dtype=np.int64)
+        
+        self.quadrics = self.plane_quadrics(self.positions, indices, n_verts)
+        self.locked = self.locked_vertices(self.positions, indices, tri_submesh, n_verts)
+        
+        # plain python structures: collapses happen one at a time
+        self.points = self.positions.tolist()
+        self.tris = indices.tolist()
+        self.tri_submesh = tri_submesh.tolist()
+        # the normals the tris started out with, so small turns can't add up to a flip
+        self.tri_normals = [normal(*(self.points[v] for v in tri)) for tri in self.tris]
+        self.tri_alive = [True] * n_tris
+        self.live = n_tris
+        self.vert_alive = [True] * n_verts
+        self.vert_tris = [set() for i in range(n_verts)]
+        for t, tri in enumerate(self.tris):
+            for v in tri:
+                self.vert_tris[v].add(t)
+        
+        # per vertex: its cheapest collapse in the heap, and the version of that entry
+        self.stamp = [0] * n_verts
+        self.blocked = [None] * n_verts
+        self.heap = list()
+        for v in range(n_verts):
+            self.update(v)
+    
+    # ## setup ##
+    
+    @staticmethod
+    def plane_quadrics(positions, indices, n_verts) -> np.ndarray:
+        """Sum of the (fundamental error) plane quadrics of the tris around every vertex"""
+        a = positions[indices[:, 0]]
+        normal = np.cross(positions[indices[:, 1]] - a, positions[indices[:, 2]] - a)
+        length = np.linalg.norm(normal, axis=1)
+        valid = length > 0.0
+        normal[valid] /= length[valid, None]
+        plane = np.concatenate([normal, -(normal * a).sum(axis=1)[:, None]], axis=1)
+        plane[~valid] = 0.0
+        
+        quadric = plane[:, :, None] * plane[:, None, :]
+        quadrics = np.zeros((n_verts, 4, 4), dtype=np.float64)
+        for k in range(3):
+            np.add.at(quadrics, indices[:, k], quadric)
+        return quadrics
+    
+    @staticmethod
+    def locked_vertices(positions, indices, tri_submesh, n_verts) -> list:
+        locked = np.zeros(n_verts, dtype=bool)
+        
+        # seams: more than one vertex at a position (split normals, uvs, ...)
+        _, pos_id, pos_count = np.unique(positions, axis=0, return_inverse=True, return_counts=True)
+        locked |= pos_count[pos_id.ravel()] > 1
+        
+        # open borders: edges of a single tri
+        edges = np.sort(np.concatenate([indices[:, [0, 1]], indices[:, [1, 2]], indices[:, [2, 0]]]), axis=1)
+        edges, edge_count = np.unique(edges, axis=0, return_counts=True)
+        locked[edges[edge_count == 1].ravel()] = True
+        
+        # submesh borders: vertices used by more than one submesh
+        if len(indices):
+            first = np.full(n_verts, -1, dtype=np.int64)
+            for k in range(3):
+                first[indices[:, k]] = tri_submesh
+            for k in range(3):
+                locked[indices[:, k][first[indices[:, k]] != tri_submesh]] = True
+        
+        # unused vertices don't take part
+        used = np.zeros(n_verts, dtype=bool)
+        used[indices.ravel()] = True
+        return (locked | ~used).tolist()
+    
+    # ## collapses ##
+    
+    def neighbours(self, v) -> set:
+        ring = set()
+        for t in self.vert_tris[v]:
+            ring.update(self.tris[t])
+        ring.discard(v)
+        return ring
+    
+    def update(self, v) -> None:
+        """(Re)compute the cheapest collapse of v, and push it"""
+        self.stamp[v] += 1
+        if self.locked[v] or not self.vert_alive[v]:
+            return
+        ring = self.neighbours(v)
+        if self.blocked[v]:
+            ring -= self.blocked[v]
+        if not ring:
+            return
+        
+        targets = np.fromiter(ring, dtype=np.int64, count=len(ring))
+        h = np.ones((len(targets), 4), dtype=np.float64)
+        h[:, :3] = self.positions[targets]
+        q = self.quadrics[v] + self.quadrics[targets]
+        cost = np.einsum("ki,kij,kj->k", h, q, h)
+        best = int(np.argmin(cost))
+        heapq.heappush(self.heap, (max(float(cost[best]), 0.0), v, int(targets[best]), self.stamp[v]))
+    
+    def flips(self, v, u) -> bool:
+        """Whether moving v onto u turns any of v's remaining tris more than ~75 degrees, or over"""
+        p = self.points
+        for t in self.vert_tris[v]:
+            tri = self.tris[t]
+            if u in tri:
+                continue
+            before = normal(p[tri[0]], p[tri[1]], p[tri[2]])
+            after = normal(*(p[u] if w == v else p[w] for w in tri))
+            dot = before[0] * after[0] + before[1] * after[1] + before[2] * after[2]
+            if dot <= 0.25 * math.sqrt((before[0] ** 2 + before[1] ** 2 + before[2] ** 2) *
+                                       (after[0] ** 2 + after[1] ** 2 + after[2] ** 2)):
+                return True
+            start = self.tri_normals[t]
+            if start[0] * after[0] + start[1] * after[1] + start[2] * after[2] <= 0.0:
+                return True
+        return False
+    
+    def collapse(self, v, u) -> None:
+        for t in list(self.vert_tris[v]):
+            tri = self.tris[t]
+            if u in tri:
+                # the tri on the edge degenerates
+                self.tri_alive[t] = False
+                self.live -= 1
+                for w in tri:
+                    self.vert_tris[w].discard(t)
+            else:
+                tri[tri.index(v)] = u
+                self.vert_tris[u].add(t)
+        self.vert_tris[v] = set()
+        self.vert_alive[v] = False
+        self.quadrics[u] += self.quadrics[v]
+        
+        # everything around u has new tris (and costs)
+        self.blocked[u] = None
+        self.update(u)
+        for w in self.neighbours(u):
+            self.blocked[w] = None
+            self.update(w)
+    
+    def simplify(self, target_tris=0, max_error=math.inf) -> None:
+        """Collapse until at most target_tris are left, or the next collapse costs more than max_error"""
+        max_cost = max_error * max_error
+        while self.heap and self.live > target_tris:
+            cost, v, u, stamp = self.heap[0]
+            if cost > max_cost:
+                break
+            heapq.heappop(self.heap)
+            if stamp != self.stamp[v] or not self.vert_alive[v] or not self.vert_alive[u]:
+                continue
+            if self.flips(v, u):
+                # try the next best target instead
+                if self.blocked[v] is None:
+                    self.blocked[v] = set()
+                self.blocked[v].add(u)
+                self.update(v)
+                continue
+            self.collapse(v, u)
+    
+    def faces(self, n_submeshes) -> list:
+        """Index array of the tris still alive, per submesh"""
+        faces = [list() for i in range(n_submeshes)]
+        for t, tri in enumerate(self.tris):
+            if self.tri_alive[t]:
+                faces[self.tri_submesh[t]].append(tri)
+        return [np.asarray(f, dtype=np.uint32).reshape(-1, 3) for f in faces]
+
+
+#
+# ## LOD generation ##
+#
+
+
+def simplify_levels(positions, submesh_indices, levels) -> list:
+    """
+    Simplify one vertex buffer (and the submeshes indexing it) level after level.
+    Returns (tris left, index array per submesh) per level.
+    """
+    sizes = [len(indices) for indices in submesh_indices]
+    indices = np.concatenate([np.asarray(i, dtype=np.int64).reshape(-1, 3) for i in submesh_indices])
+    tri_submesh = np.repeat(np.arange(len(sizes)), sizes)
+    
+    simplifier = Simplifier(positions, indices, tri_submesh)
+    results = list()
+    for usage, ratio, max_error in levels:
+        simplifier.simplify(int(len(indices) * ratio), max_error)
+        results.append((simplifier.live, simplifier.faces(len(sizes))))
+    return results
+
+
+def generate_lods(geometry, submeshes, levels) -> list:
+    """
+    Fill every submesh's lods with an index array per level, over the vertices it already uses.
+    Submeshes on the shared geometry are simplified together, the ones with their own vertices alone.
+    Levels that don't take anything away are dropped; returns the usage values of the ones kept.
+    """
+    groups = list()
+    shared = [s for s in submeshes if s.geometry is None]
+    if shared:
+        groups.append((geometry.positions, shared))
+    for submesh in submeshes:
+        if submesh.geometry is not None:
+            groups.append((submesh.geometry.positions, [submesh]))
+    
+    for submesh in submeshes:
+        submesh.lods = list()
+    
+    results = [simplify_levels(positions, [s.indices for s in group], levels) for positions, group in groups]
+    
+    usages = list()
+    last = sum(len(s.indices) for s in submeshes)
+    for level, (usage, ratio, max_error) in enumerate(levels):
+        live = sum(result[level][0] for result in results)
+        if live >= last:
+            continue
+        last = live
+        usages.append(usage)
+        for (positions, group), result in zip(groups, results):
+            for submesh, faces in zip(group, result[level][1]):
+                submesh.lods.append(faces)
+    return usages
@@ -0,0 +1,466 @@
+import struct
+
+import numpy as np
+
+from . import zgeom
+
+
+#
+# ## Ogre binary .mesh format constants (see OgreMeshFileFormat.h) ##
+#
+
+
+# header string per supported serializer version
+VERSIONS = {
+    "1.100": "[MeshSerializer_v1.100]",
+    "1.8": "[MeshSerializer_v1.8]",
+}
+
+# name of the distance LOD strategy per version
+LOD_STRATEGIES = {
+    "1.100": "distance_sphere",
+    "1.8": "Distance",
+}
+
+# chunk ids
+M_HEADER = 0x1000
+M_MESH = 0x3000
+M_SUBMESH = 0x4000
+M_SUBMESH_OPERATION = 0x4010
+M_SUBMESH_BONE_ASSIGNMENT = 0x4100
+M_GEOMETRY = 0x5000
+M_GEOMETRY_VERTEX_DECLARATION = 0x5100
+M_GEOMETRY_VERTEX_ELEMENT = 0x5110
+M_GEOMETRY_VERTEX_BUFFER = 0x5200
+M_GEOMETRY_VERTEX_BUFFER_DATA = 0x5210
+M_MESH_SKELETON_LINK = 0x6000
+M_MESH_BONE_ASSIGNMENT = 0x7000
+M_MESH_LOD_LEVEL = 0x8000
+M_MESH_LOD_USAGE = 0x8100
+M_MESH_LOD_GENERATED = 0x8120
+M_MESH_BOUNDS = 0x9000
+M_SUBMESH_NAME_TABLE = 0xA000
+M_SUBMESH_NAME_TABLE_ELEMENT = 0xA100
+M_POSES = 0xC000
+M_POSE = 0xC100
+M_POSE_VERTEX = 0xC111
+M_ANIMATIONS = 0xD000
+M_ANIMATION = 0xD100
+M_ANIMATION_TRACK = 0xD110
+M_ANIMATION_POSE_KEYFRAME = 0xD112
+M_ANIMATION_POSE_REF = 0xD113
+
+# VertexElementType
+VET_FLOAT2 = 1
+VET_FLOAT3 = 2
+VET_FLOAT4 = 3
+VET_COLOUR_ABGR = 11
+VET_BYTE4_NORM = 29
+VET_UBYTE4_NORM = 30
+VET_HALF2 = 37
+
+# VertexElementSemantic
+VES_POSITION = 1
+VES_NORMAL = 4
+VES_DIFFUSE = 5
+VES_TEXTURE_COORDINATES = 7
+VES_BINORMAL = 8
+VES_TANGENT = 9
+
+# RenderOperation::OperationType
+OT_TRIANGLE_LIST = 4
+
+# VertexAnimationType
+VAT_POSE = 2
+
+# chunk header: unsigned short id, unsigned int length (header included)
+CHUNK_HEADER = struct.Struct("<HI")
+
+# a bone assignment chunk, whole: header, vertex index, bone handle, weight
+BONE_ASSIGNMENT = np.dtype([("id", "<u2"), ("length", "<u4"), ("vertex", "<u4"), ("bone", "<u2"), ("weight", "<f4")])
+# a pose vertex chunk, whole: header, vertex index, offset (no normals)
+POSE_VERTEX = np.dtype([("id", "<u2"), ("length", "<u4"), ("vertex", "<u4"), ("offset", "<f4", 3)])
+
+
+#
+# ## Vertex declaration (what goes into the single, interleaved vertex buffer) ##
+#
+
+
+def snorm8(a) -> np.ndarray:
+    """[-1, 1] floats as signed normalized bytes"""
+    return np.clip(np.round(a * 127.0), -127, 127).astype(np.int8)
+
+
+def unorm8(a) -> np.ndarray:
+    """[0, 1] floats as unsigned normalized bytes"""
+    return np.clip(np.round(a * 255.0), 0, 255).astype(np.uint8)
+
+
+class VertexFormat(object):
+    """
+    Which elements go into the vertex buffer, and in what types.
+    packed: normals and tangents as signed normalized bytes, and no binormal element; the tangent's w
+    holds the handedness instead (binormal = cross(normal, tangent) * w).
+    half_uvs: uvs as half floats. colours: a diffuse colour element, RGBA bytes.
+    quantized False keeps the layout, but in floats (all the xml can describe, and all 1.8 knows).
+    """
+    
+    def __init__(self, packed=False, half_uvs=False, colours=False, quantized=True):
+        self.packed = packed
+        self.half_uvs = half_uvs
+        self.colours = colours
+        self.quantized = quantized
+    
+    def elements(self, version="1.100") -> list:
+        """(semantic, type, dtype field) of every vertex element, in buffer order"""
+        elements = [(VES_POSITION, VET_FLOAT3, ("position", "<f4", 3))]
+        if self.packed and self.quantized:
+            # w is padding
+            elements.append((VES_NORMAL, VET_BYTE4_NORM, ("normal", "i1", 4)))
+        else:
+            elements.append((VES_NORMAL, VET_FLOAT3, ("normal", "<f4", 3)))
+        if self.colours:
+            # same bytes in memory (r, g, b, a), 1.8 only knows the colour type
+            vtype = VET_COLOUR_ABGR if version == "1.8" else VET_UBYTE4_NORM
+            elements.append((VES_DIFFUSE, vtype, ("colour", "u1", 4)))
+        if self.half_uvs and self.quantized:
+            elements.append((VES_TEXTURE_COORDINATES, VET_HALF2, ("texcoord", "<f2", 2)))
+        else:
+            elements.append((VES_TEXTURE_COORDINATES, VET_FLOAT2, ("texcoord", "<f4", 2)))
+        if self.packed and self.quantized:
+            elements.append((VES_TANGENT, VET_BYTE4_NORM, ("tangent", "i1", 4)))
+        elif self.packed:
+            elements.append((VES_TANGENT, VET_FLOAT4, ("tangent", "<f4", 4)))
+        else:
+            elements.append((VES_TANGENT, VET_FLOAT3, ("tangent", "<f4", 3)))
+            elements.append((VES_BINORMAL, VET_FLOAT3, ("binormal", "<f4", 3)))
+        return elements
+    
+    def vertex_size(self, version="1.100") -> int:
+        return np.dtype([field for semantic, vtype, field in self.elements(version)]).itemsize
+    
+    def columns(self, geometry) -> dict:
+        """Element name -> the geometry's values for it, in the element's width (and type, if quantized)"""
+        columns = {"position": geometry.positions, "texcoord": geometry.uvs}
+        
+        if self.packed:
+            tangents = np.hstack([geometry.tangents, geometry.tangent_signs()[:, None]])
+            normals = np.hstack([geometry.normals, np.zeros((geometry.vertexcount, 1), dtype=np.float32)])
+            if self.quantized:
+                columns["normal"] = snorm8(normals)
+                columns["tangent"] = snorm8(tangents)
+            else:
+                columns["normal"] = geometry.normals
+                columns["tangent"] = tangents
+        else:
+            columns["normal"] = geometry.normals
+            columns["tangent"] = geometry.tangents
+            columns["binormal"] = geometry.binormals
+        
+        if self.colours:
+            columns["colour"] = unorm8(geometry.colours) if self.quantized else geometry.colours
+        return columns
+    
+    def declaration(self, geometry, version="1.100") -> list:
+        """List of (semantic, type, index, dtype field, source array) for every vertex element"""
+        columns = self.columns(geometry)
+        return [(semantic, vtype, 0, field, columns[field[0]]) for semantic, vtype, field in self.elements(version)]
+
+
+def vertex_declaration(geometry, vertex_format=None, version="1.100") -> list:
+    """List of (semantic, type, index, dtype field, source array) for every vertex element"""
+    if vertex_format is None:
+        vertex_format = VertexFormat()
+    return vertex_format.declaration(geometry, version)
+
+
+def interleave(geometry, declaration) -> np.ndarray:
+    """Pack the vertex attributes into one contiguous, interleaved (structured) array"""
+    vdtype = np.dtype([field for semantic, vtype, index, field, source in declaration])
+    buffer = np.empty(geometry.vertexcount, dtype=vdtype)
+    for semantic, vtype, index, field, source in declaration:
+        buffer[field[0]] = source
+    return buffer
+
+
+def bounds(positions) -> tuple:
+    """AABB (min, max) and bounding radius (from the origin) of a position array"""
+    lo, hi, radius = zgeom.extents(positions)
+    return lo.tolist(), hi.tolist(), radius
+
+
+def mesh_positions(geometry, submeshes) -> np.ndarray:
+    """All vertex positions of a mesh: the shared ones and the submeshes' own"""
+    positions = [s.geometry.positions for s in submeshes if s.geometry is not None]
+    if geometry is not None:
+        positions.append(geometry.positions)
+    if not positions:
+        return np.zeros((0, 3), dtype=np.float32)
+    return np.concatenate(positions)
+
+
+#
+# ## Serializer classes (to write binary .mesh files without OgreXMLConverter) ##
+#
+
+
+class ChunkSerializer(object):
+    """Low level writes of Ogre's chunked binary files (meshes, skeletons)"""
+    
+    def __init__(self):
+        self.fw = None
+        self.chunks = list()
+    
+    def begin_chunk(self, cid) -> None:
+        """Write a chunk header; its length is patched in by end_chunk"""
+        self.chunks.append(self.fw.tell())
+        self.fw.write(CHUNK_HEADER.pack(cid, 0))
+    
+    def end_chunk(self) -> None:
+        start = self.chunks.pop()
+        end = self.fw.tell()
+        self.fw.seek(start + 2)
+        self.fw.write(struct.pack("<I", end - start))
+        self.fw.seek(end)
+    
+    def write(self, fmt, *values) -> None:
+        self.fw.write(struct.pack("<" + fmt, *values))
+    
+    def write_string(self, s) -> None:
+        # strings are newline terminated
+        self.fw.write(s.encode("UTF-8") + b"\n")
+    
+    def write_buffer(self, a) -> None:
+        # no copies: write straight from the contiguous array memory
+        self.fw.write(memoryview(np.ascontiguousarray(a).reshape(-1).view(np.uint8)))
+
+
+class MESHserializer(ChunkSerializer):
+    """Class for serializing binary meshes"""
+    
+    def __init__(self, version="1.100"):
+        if version not in VERSIONS:
+            raise ValueError("Unsupported mesh version: %s" % version)
+        super().__init__()
+        self.version = version
+        self.vertex_format = None
+    
+    # ## chunks ##
+    
+    def write_geometry(self, geometry) -> None:
+        declaration = vertex_declaration(geometry, self.vertex_format, self.version)
+        buffer = interleave(geometry, declaration)
+        
+        self.begin_chunk(M_GEOMETRY)
+        self.write("I", geometry.vertexcount)
+        
+        self.begin_chunk(M_GEOMETRY_VERTEX_DECLARATION)
+        offset = 0
+        for semantic, vtype, index, field, source in declaration:
+            self.begin_chunk(M_GEOMETRY_VERTEX_ELEMENT)
+            # source, type, semantic, offset, index
+            self.write("5H", 0, vtype, semantic, offset, index)
+            self.end_chunk()
+            offset += buffer.dtype.fields[field[0]][0].itemsize
+        self.end_chunk()
+        
+        self.begin_chunk(M_GEOMETRY_VERTEX_BUFFER)
+        # bind index, vertex size
+        self.write("2H", 0, buffer.dtype.itemsize)
+        self.begin_chunk(M_GEOMETRY_VERTEX_BUFFER_DATA)
+        self.write_buffer(buffer)
+        self.end_chunk()
+        self.end_chunk()
+        
+        self.end_chunk()
+    
+    def write_bone_assignments(self, cid, geometry) -> None:
+        """A chunk per (vertex, bone, weight) influence, all packed in one go"""
+        vertex, bone, weight = geometry.bone_assignments()
+        chunks = np.empty(len(vertex), dtype=BONE_ASSIGNMENT)
+        chunks["id"] = cid
+        chunks["length"] = BONE_ASSIGNMENT.itemsize
+        chunks["vertex"] = vertex
+        chunks["bone"] = bone
+        chunks["weight"] = weight
+        self.write_buffer(chunks)
+    
+    def write_submesh(self, submesh, shared=None) -> None:
+        indices = submesh.indices.ravel()
+        use32bitindexes = submesh.use32bitindexes(shared)
+        
+        self.begin_chunk(M_SUBMESH)
+        self.write_string(submesh.material)
+        # use shared vertices
+        self.write("?", submesh.geometry is None)
+        self.write("I", len(indices))
+        self.write("?", use32bitindexes)
+        self.write_buffer(indices.astype("<u4" if use32bitindexes else "<u2"))
+        
+        if submesh.geometry is not None:
+            self.write_geometry(submesh.geometry)
+        
+        self.begin_chunk(M_SUBMESH_OPERATION)
+        self.write("H", OT_TRIANGLE_LIST)
+        self.end_chunk()
+        
+        if submesh.geometry is not None and submesh.geometry.bone_weights is not None:
+            self.write_bone_assignments(M_SUBMESH_BONE_ASSIGNMENT, submesh.geometry)
+        
+        self.end_chunk()
+    
+    def write_lod(self, submeshes, lod_values, shared=None) -> None:
+        """Generated LOD levels: per level its usage value, and an index buffer per submesh"""
+        self.begin_chunk(M_MESH_LOD_LEVEL)
+        self.write_string(LOD_STRATEGIES[self.version])
+        # the full detail level counts, too
+        self.write("H", len(lod_values) + 1)
+        
+        if self.version == "1.8":
+            # manual (separate meshes)
+            self.write("?", False)
+            for level, value in enumerate(lod_values):
+                self.begin_chunk(M_MESH_LOD_USAGE)
+                self.write("f", value)
+                for submesh in submeshes:
+                    indices = submesh.lods[level].ravel()
+                    use32bitindexes = submesh.use32bitindexes(shared)
+                    self.begin_chunk(M_MESH_LOD_GENERATED)
+                    self.write("I", len(indices))
+                    self.write("?", use32bitindexes)
+                    self.write_buffer(indices.astype("<u4" if use32bitindexes else "<u2"))
+                    self.end_chunk()
+                self.end_chunk()
+        else:
+            for level, value in enumerate(lod_values):
+                self.begin_chunk(M_MESH_LOD_GENERATED)
+                self.write("f", value)
+                for submesh in submeshes:
+                    indices = submesh.lods[level].ravel()
+                    use32bitindexes = submesh.use32bitindexes(shared)
+                    # index count, index start, buffer index (none: a buffer of its own)
+                    self.write("3I", len(indices), 0, 0xFFFFFFFF)
+                    self.write("?", use32bitindexes)
+                    self.write("I", len(indices))
+                    self.write_buffer(indices.astype("<u4" if use32bitindexes else "<u2"))
+                self.end_chunk()
+        
+        self.end_chunk()
+    
+    def write_bounds(self, lo, hi, radius) -> None:
+        self.begin_chunk(M_MESH_BOUNDS)
+        self.write("7f", *(list(lo) + list(hi) + [radius]))
+        self.end_chunk()
+    
+    def write_submesh_names(self, submeshes) -> None:
+        self.begin_chunk(M_SUBMESH_NAME_TABLE)
+        for index, submesh in enumerate(submeshes):
+            self.begin_chunk(M_SUBMESH_NAME_TABLE_ELEMENT)
+            self.write("H", index)
+            self.write_string(submesh.material)
+            self.end_chunk()
+        self.end_chunk()
+    
+    def write_poses(self, poses) -> None:
+        """The poses, a chunk per vertex offset (all of a pose's packed in one go)"""
+        self.begin_chunk(M_POSES)
+        for pose in poses:
+            self.begin_chunk(M_POSE)
+            self.write_string(pose.name)
+            # target, includes normals
+            self.write("H?", pose.target, False)
+            chunks = np.empty(len(pose.indices), dtype=POSE_VERTEX)
+            chunks["id"] = M_POSE_VERTEX
+            chunks["length"] = POSE_VERTEX.itemsize
+            chunks["vertex"] = pose.indices
+            chunks["offset"] = pose.offsets
+            self.write_buffer(chunks)
+            self.end_chunk()
+        self.end_chunk()
+    
+    def write_pose_animations(self, animations, poses) -> None:
+        """Pose animations: a track per target, keyframes referencing the poses by index (see write_poses)"""
+        self.begin_chunk(M_ANIMATIONS)
+        for animation in animations:
+            self.begin_chunk(M_ANIMATION)
+            self.write_string(animation.name)
+            self.write("f", animation.length)
+            for target, keyframes in animation.tracks(poses):
+                self.begin_chunk(M_ANIMATION_TRACK)
+                self.write("2H", VAT_POSE, target)
+                for time, refs in keyframes:
+                    self.begin_chunk(M_ANIMATION_POSE_KEYFRAME)
+                    self.write("f", time)
+                    for index, influence in refs:
+                        self.begin_chunk(M_ANIMATION_POSE_REF)
+                        self.write("Hf", index, influence)
+                        self.end_chunk()
+                    self.end_chunk()
+                self.end_chunk()
+            self.end_chunk()
+        self.end_chunk()
+    
+    def write_file(self,
+                   filepath,
+                   geometry,
+                   submeshes=[],
+                   lod_values=[],
+                   vertex_format=None,
+                   mesh_bounds=None,
+                   skeleton_name=None,
+                   poses=[],
+                   pose_animations=[]
+                   ) -> None:
+        """
+        Basic write function. Getting them meshes written.
+        submeshes is a list of zgeom.Submesh, using the shared geometry (if any) or their own.
+        The index width is picked per submesh, from the vertex count it indexes.
+        lod_values are the usage distances of the generated LOD levels in every submesh's lods.
+        vertex_format (a VertexFormat) picks the vertex elements and their types, floats by default.
+        mesh_bounds is the (min, max, radius) the exporter already has; without it they're computed here.
+        skeleton_name links the skeleton file, the bone assignments come from the geometries' bone arrays.
+        poses are zpose.Pose, pose_animations zpose.PoseAnimation of those poses.
+        """
+        
+        with open(filepath, mode="wb") as fw:
+            self.fw = fw
+            self.vertex_format = vertex_format if vertex_format is not None else VertexFormat()
+            
+            # the header is the only chunk without a length
+            self.write("H", M_HEADER)
+            self.write_string(VERSIONS[self.version])
+            
+            self.begin_chunk(M_MESH)
+            # skeletally animated
+            self.write("?", skeleton_name is not None)
+            
+            if geometry is not None:
+                self.write_geometry(geometry)
+            for submesh in submeshes:
+                self.write_submesh(submesh, geometry)
+            
+            if skeleton_name is not None:
+                self.begin_chunk(M_MESH_SKELETON_LINK)
+                self.write_string(skeleton_name)
+                self.end_chunk()
+            if geometry is not None and geometry.bone_weights is not None:
+                self.write_bone_assignments(M_MESH_BONE_ASSIGNMENT, geometry)
+            
+            if lod_values:
+                self.write_lod(submeshes, lod_values, geometry)
+            
+            if mesh_bounds is None:
+                mesh_bounds = bounds(mesh_positions(geometry, submeshes))
+            self.write_bounds(*mesh_bounds)
+            self.write_submesh_names(submeshes)
+            
+            if poses:
+                self.write_poses(poses)
+                if pose_animations:
+                    self.write_pose_animations(pose_animations, poses)
+            
+            self.end_chunk()
+            
+            self.fw = None
+            self.vertex_format = None
@@ -0,0 +1,160 @@
+import numpy as np
+
+from . import zgeom
+from . import zskel
+
+
+#
+# ## Poses (blender shape keys, as sparse vertex offsets) ##
+#
+
+
+# offsets shorter than this (in units) don't move a vertex
+OFFSET_THRESHOLD = 1e-4
+
+
+def sparse_offsets(offsets, threshold=OFFSET_THRESHOLD) -> tuple:
+    """
+    The (shape, vertex, offset) of every vertex a shape moves by more than threshold, from the (shapes, n, 3)
+    offsets of all vertices. All shapes are thresholded at once, the results come out by shape, then vertex.
+    """
+    offsets = np.asarray(offsets, dtype=np.float32)
+    moved = (offsets * offsets).sum(axis=2) > threshold * threshold
+    shapes, vertices = np.nonzero(moved)
+    return shapes, vertices, offsets[shapes, vertices]
+
+
+class Pose(object):
+    """
+    A pose of a .mesh: the offsets (n, 3) of the vertices (n, ) it moves, in one vertex data (target:
+    0 for the shared geometry, i + 1 for submesh i's own). shape is its index in the ShapeKeys.
+    """
+    
+    def __init__(self, name, target, shape, indices, offsets):
+        self.name = name
+        self.target = target
+        self.shape = shape
+        self.indices = indices
+        self.offsets = offsets
+
+
+class ShapeKeys(object):
+    """
+    The shapes of a mesh, sparse and per blender vertex: names, and the (shape, vertex, offset (ogre axes))
+    of every vertex moved, sorted by shape. Only the vertices a shape moves by more than a threshold are kept,
+    so a shape costs what its deformed region costs, not the whole mesh.
+    blocks is the shape key index of every shape in blender.
+    """
+    
+    def __init__(self, names, blocks, shapes, vertices, offsets):
+        self.names = list(names)
+        self.blocks = np.asarray(blocks, dtype=np.int64)
+        self.shapes = np.asarray(shapes, dtype=np.int64)
+        self.vertices = np.asarray(vertices, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.float32).reshape(-1, 3)
+    
+    @classmethod
+    def from_coords(cls, names, blocks, coords, relative, threshold=OFFSET_THRESHOLD):
+        """
+        The shapes of the given blocks (and names), from the (keys, n, 3) blender coordinates of all shape keys
+        and the key each one is relative to
+        """
+        blocks = np.asarray(blocks, dtype=np.int64)
+        coords = np.asarray(coords, dtype=np.float32)
+        offsets = coords[blocks] - coords[np.asarray(relative, dtype=np.int64)[blocks]]
+        shapes, vertices, offsets = sparse_offsets(offsets, threshold)
+        return cls(names, blocks, shapes, vertices, zgeom.swap_axes(offsets))
+    
+    def __len__(self):
+        return len(self.names)
+    
+    @property
+    def offsetcount(self) -> int:
+        return len(self.vertices)
+    
+    def poses(self, geometry, target=0) -> list:
+        """
+        A Pose per shape that moves any vertex of the geometry, which keeps the blender vertex of every
+        vertex (geometry.sources): the offsets of a blender vertex go to every vertex welded from it.
+        """
+        # the vertices of every blender vertex are a run of the geometry's vertices, sorted by source
+        order = np.argsort(geometry.sources, kind="stable")
+        start = np.searchsorted(geometry.sources[order], self.vertices, side="left")
+        counts = np.searchsorted(geometry.sources[order], self.vertices, side="right") - start
+        entry = np.repeat(np.arange(len(self.vertices)), counts)
+        run = np.arange(len(entry)) - np.repeat(np.cumsum(counts) - counts, counts)
+        indices = order[np.repeat(start, counts) + run]
+        
+        shapes = self.shapes[entry]
+        by_shape = np.lexsort((indices, shapes))
+        shapes, indices, offsets = shapes[by_shape], indices[by_shape], self.offsets[entry][by_shape]
+        bounds = np.searchsorted(shapes, np.arange(len(self.names) + 1))
+        return [Pose(name, target, shape, indices[a:b].astype(np.uint32), offsets[a:b])
+                for shape, (name, a, b) in enumerate(zip(self.names, bounds[:-1], bounds[1:])) if b > a]
+
+
+#
+# ## Pose animations (shape key values over time) ##
+#
+
+
+class PoseAnimation(object):
+    """
+    A pose animation: the influences (n, shapes) of the shapes at the keyframe times (n, ) kept
+    (reduced with zskel.reduce_keys).
+    active is whether each shape has any influence in it (the others get no pose references);
+    sampled and kept count influences, like zskel.Animation counts bone keyframes.
+    """
+    
+    def __init__(self, name, length, times, influences, active, sampled=0):
+        self.name = name
+        self.length = length
+        self.times = times
+        self.influences = influences
+        self.active = active
+        self.sampled = sampled
+        self.kept = len(times) * int(active.sum())
+    
+    @property
+    def static(self) -> int:
+        """The shapes left out"""
+        return len(self.active) - int(self.active.sum())
+    
+    @classmethod
+    def from_samples(cls, name, times, influences, tolerance=0.001):
+        """
+        Reduce (frames, shapes) influences sampled at times: keyframes are kept where interpolating the
+        others would be off by more than tolerance, for any shape (a keyframe holds all the poses of a track).
+        """
+        times = np.asarray(times, dtype=np.float64)
+        influences = np.asarray(influences, dtype=np.float32)
+        active = np.abs(influences).max(axis=0, initial=0.0) > tolerance
+        tolerance = max(tolerance, 1e-9)
+        
+        def span_error(a, b, t):
+            ends = influences[[a, b]][:, active]
+            between = ends[0] + (ends[1] - ends[0]) * t[:, None]
+            return np.abs(between - influences[a + 1:b, active]).max(axis=1, initial=0.0) / tolerance
+        
+        keep = zskel.reduce_keys(times, span_error)
+        return cls(name, float(times[-1] - times[0]) if len(times) else 0.0, times[keep],
+                   np.where(active, influences[keep], 0.0).astype(np.float32), active, sampled=influences.size)
+    
+    def tracks(self, poses) -> list:
+        """
+        (target, [(time, [(pose index, influence)])]) per target with poses in the animation:
+        the pose references of every keyframe (zero influences are left out, that's what they default to).
+        """
+        targets = dict()
+        for index, pose in enumerate(poses):
+            if self.active[pose.shape]:
+                targets.setdefault(pose.target, list()).append((index, pose.shape))
+        
+        tracks = list()
+        for target, refs in sorted(targets.items()):
+            keyframes = list()
+            for time, influences in zip(self.times.tolist(), self.influences.tolist()):
+                keyframes.append((time, [(index, influences[shape]) for index, shape in refs
+                                         if influences[shape] != 0.0]))
+            tracks.append((target, keyframes))
+        return tracks
@@ -0,0 +1,265 @@
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+
+
+#
+# ## Process memory (best effort, per platform) ##
+#
+
+
+def _windows_counters():
+    import ctypes
+    from ctypes import wintypes
+    
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+    
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+
+def _proc_status(field):
+    # linux: "VmRSS:     1234 kB"
+    with open("/proc/self/status") as fr:
+        for line in fr:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def current_rss():
+    """Resident memory of this process in bytes, or None if we can't tell"""
+    try:
+        if sys.platform.startswith("linux"):
+            return _proc_status("VmRSS")
+        if sys.platform == "win32":
+            counters = _windows_counters()
+            return counters.WorkingSetSize if counters else None
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def peak_rss():
+    """High-water mark of resident memory in bytes, or None if we can't tell"""
+    try:
+        if sys.platform.startswith("linux"):
+            return _proc_status("VmHWM")
+        if sys.platform == "win32":
+            counters = _windows_counters()
+            return counters.PeakWorkingSetSize if counters else None
+        import resource
+        # bytes on macOS (kilobytes on the other unixes)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (OSError, ValueError, AttributeError, ImportError):
+        pass
+    return None
+
+
+def reset_peak() -> bool:
+    """Reset the high-water mark, so it covers a single stage (linux only)"""
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/clear_refs", "w") as fw:
+                fw.write("5")
+            return True
+    except OSError:
+        pass
+    return False
+
+
+#
+# ## MemoryReport class (memory per export stage) ##
+#
+
+
+class MemoryReport(object):
+    """Records memory at the end of every stage of an export"""
+    
+    def __init__(self):
+        self.stages = list()
+        self.current = None
+        # whether the peaks are per stage, or for the whole process so far
+        self.peak_per_stage = False
+    
+    def stage(self, name) -> None:
+        """Close the running stage (if any) and start the next one"""
+        self.end()
+        self.peak_per_stage = reset_peak()
+        self.current = name
+    
+    def end(self, **extra) -> None:
+        """Close the running stage; extra values (eg. datablock counts) are kept with it"""
+        if self.current is None:
+            return
+        entry = {"stage": self.current, "rss": current_rss(), "peak": peak_rss()}
+        entry.update(extra)
+        self.stages.append(entry)
+        self.current = None
+    
+    def lines(self) -> list:
+        mb = lambda b: "n/a" if b is None else "%.1f MB" % (b / 1048576.0)
+        label = "peak" if self.peak_per_stage else "peak so far"
+        lines = list()
+        for entry in self.stages:
+            line = "%-12s rss %10s   %s %10s" % (entry["stage"], mb(entry["rss"]), label, mb(entry["peak"]))
+            for key in entry:
+                if key not in ("stage", "rss", "peak"):
+                    line += "   %s %s" % (key, entry[key])
+            lines.append(line)
+        return lines
+
+
+#
+# ## Logging (leveled, instead of prints) ##
+#
+
+
+def setup_logging(level="INFO") -> logging.Logger:
+    """Send the addon's log records to the console, from the given level up"""
+    logger = logging.getLogger(__package__)
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("BOE %(levelname)s: %(message)s"))
+        logger.addHandler(handler)
+        # Blender's root logger has nothing to add
+        logger.propagate = False
+    return logger
+
+
+#
+# ## Profiler class (timing spans and counters per export phase) ##
+#
+
+
+# the profiler spans and counts go to; None while nothing is being profiled
+_active = None
+# what span() hands out while inactive, reusable
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(name, **args):
+    """Time a block as phase name, on the active profiler (if any)"""
+    profiler = _active
+    if profiler is None:
+        return _NO_SPAN
+    return profiler.span(name, **args)
+
+
+def count(name, n=1) -> None:
+    """Add n to a counter of the active profiler (if any)"""
+    profiler = _active
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+class Profiler(object):
+    """
+    Collects timing spans (per phase, per thread) and counters during an export.
+    While entered as a context manager, it's the one the module level span() and count() go to.
+    """
+    
+    def __init__(self):
+        self.origin = time.perf_counter()
+        # (name, start, duration, thread, args)
+        self.events = list()
+        # name -> [calls, seconds]
+        self.totals = dict()
+        self.counters = dict()
+        # small thread numbers for the trace, and their names
+        self.threads = dict()
+        self.lock = threading.Lock()
+        self.previous = None
+    
+    def __enter__(self):
+        global _active
+        self.previous = _active
+        _active = self
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active
+        _active = self.previous
+        self.previous = None
+    
+    def thread(self) -> int:
+        ident = threading.get_ident()
+        tid = self.threads.get(ident)
+        if tid is None:
+            with self.lock:
+                tid = self.threads.setdefault(ident, (len(self.threads), threading.current_thread().name))
+        return tid[0]
+    
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        tid = self.thread()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.events.append((name, start - self.origin, duration, tid, args))
+                total = self.totals.setdefault(name, [0, 0.0])
+                total[0] += 1
+                total[1] += duration
+    
+    def count(self, name, n=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def trace_events(self) -> list:
+        """The spans as Chrome trace events (chrome://tracing, Perfetto)"""
+        events = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": name}}
+                  for tid, name in self.threads.values()]
+        for name, start, duration, tid, args in self.events:
+            # complete events, in microseconds
+            events.append({"name": name, "cat": "export", "ph": "X", "pid": 0, "tid": tid,
+                           "ts": start * 1e6, "dur": duration * 1e6, "args": args})
+        return events
+    
+    def report(self) -> dict:
+        return {
+            "phases": {name: {"calls": calls, "seconds": seconds}
+                       for name, (calls, seconds) in self.totals.items()},
+            "counters": dict(self.counters),
+        }
+    
+    def write_json(self, filepath, **extra) -> None:
+        """
+        Dump the report and the spans. The file loads as a Chrome trace as it is,
+        the other keys are ignored there; extra keys (eg. the memory stages) are added as given.
+        """
+        data = self.report()
+        data.update(extra)
+        data["traceEvents"] = self.trace_events()
+        with open(filepath, mode="w", encoding="UTF-8") as fw:
+            json.dump(data, fw, indent=1, default=str)
+    
+    def lines(self) -> list:
+        lines = list()
+        # nested phases are counted in their parents too
+        for name, (calls, seconds) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            lines.append("%-12s %8.4f sec %6d calls" % (name, seconds, calls))
+        for name in sorted(self.counters):
+            lines.append("%-12s %12d" % (name, self.counters[name]))
+        return lines
@@ -0,0 +1,394 @@
+import numpy as np
+
+from . import zgeom
+from . import zmesh
+
+
+#
+# ## Ogre binary .skeleton format constants (see OgreSkeletonFileFormat.h) ##
+#
+
+
+# the header the 1.8 serializer (and everything since) writes; it's the one with the blend mode chunk
+VERSION = "[Serializer_v1.80]"
+
+# chunk ids
+SKELETON_HEADER = 0x1000
+SKELETON_BLENDMODE = 0x1010
+SKELETON_BONE = 0x2000
+SKELETON_BONE_PARENT = 0x3000
+SKELETON_ANIMATION = 0x4000
+SKELETON_ANIMATION_TRACK = 0x4100
+SKELETON_ANIMATION_TRACK_KEYFRAME = 0x4110
+
+# SkeletonAnimationBlendMode
+ANIMBLEND_AVERAGE = 0
+
+# what a vertex can be skinned to on the GPU (Ogre's default for hardware skinning)
+MAX_INFLUENCES = 4
+# weights below it aren't worth an influence
+WEIGHT_THRESHOLD = 0.01
+
+# a keyframe chunk, whole: header, time, rotation (x, y, z, w), translation, scale
+KEYFRAME = np.dtype([("id", "<u2"), ("length", "<u4"), ("time", "<f4"),
+                     ("rotation", "<f4", 4), ("translate", "<f4", 3), ("scale", "<f4", 3)])
+
+
+#
+# ## Transforms (rest pose matrices into bone positions, orientations and scales) ##
+#
+
+
+def quaternions(rotations) -> np.ndarray:
+    """(w, x, y, z) unit quaternions of (n, 3, 3) rotation matrices, with w >= 0"""
+    m = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    # per matrix, the biggest of the four picks the formula that doesn't divide by (almost) zero
+    case = np.argmax(np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=1), axis=1)
+    
+    q = np.empty((len(m), 4), dtype=np.float64)
+    c = case == 0
+    s = np.sqrt(np.maximum(1.0 + trace[c], 0.0)) * 2.0
+    q[c] = np.stack([0.25 * s,
+                     (m[c, 2, 1] - m[c, 1, 2]) / s,
+                     (m[c, 0, 2] - m[c, 2, 0]) / s,
+                     (m[c, 1, 0] - m[c, 0, 1]) / s], axis=1)
+    c = case == 1
+    s = np.sqrt(np.maximum(1.0 + m[c, 0, 0] - m[c, 1, 1] - m[c, 2, 2], 0.0)) * 2.0
+    q[c] = np.stack([(m[c, 2, 1] - m[c, 1, 2]) / s,
+                     0.25 * s,
+                     (m[c, 0, 1] + m[c, 1, 0]) / s,
+                     (m[c, 0, 2] + m[c, 2, 0]) / s], axis=1)
+    c = case == 2
+    s = np.sqrt(np.maximum(1.0 + m[c, 1, 1] - m[c, 0, 0] - m[c, 2, 2], 0.0)) * 2.0
+    q[c] = np.stack([(m[c, 0, 2] - m[c, 2, 0]) / s,
+                     (m[c, 0, 1] + m[c, 1, 0]) / s,
+                     0.25 * s,
+                     (m[c, 1, 2] + m[c, 2, 1]) / s], axis=1)
+    c = case == 3
+    s = np.sqrt(np.maximum(1.0 + m[c, 2, 2] - m[c, 0, 0] - m[c, 1, 1], 0.0)) * 2.0
+    q[c] = np.stack([(m[c, 1, 0] - m[c, 0, 1]) / s,
+                     (m[c, 0, 2] + m[c, 2, 0]) / s,
+                     (m[c, 1, 2] + m[c, 2, 1]) / s,
+                     0.25 * s], axis=1)
+    
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    q[q[:, 0] < 0.0] *= -1.0
+    return q
+
+
+def decompose(matrices) -> tuple:
+    """Positions (n, 3), orientations ((w, x, y, z) quaternions, (n, 4)) and scales (n, 3) of (n, 4, 4) matrices"""
+    m = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+    linear = m[:, :3, :3]
+    scales = np.linalg.norm(linear, axis=1)
+    # a mirror goes into the x scale
+    scales[np.linalg.det(linear) < 0.0, 0] *= -1.0
+    rotations = linear / np.where(scales == 0.0, 1.0, scales)[:, None, :]
+    return m[:, :3, 3].copy(), quaternions(rotations), scales
+
+
+def angle_axis(quaternions) -> tuple:
+    """Angles (n, radians) and unit axes (n, 3) of (w, x, y, z) quaternions, the way the xml has rotations"""
+    q = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+    angles = 2.0 * np.arccos(np.clip(q[:, 0], -1.0, 1.0))
+    length = np.linalg.norm(q[:, 1:], axis=1)
+    # no rotation: any axis does
+    axes = np.tile([1.0, 0.0, 0.0], (len(q), 1))
+    turned = length > 1e-12
+    axes[turned] = q[turned, 1:] / length[turned, None]
+    return angles, axes
+
+
+def local_matrices(matrices, parents, space=None) -> np.ndarray:
+    """
+    Bone matrices relative to their parent, from (..., n, 4, 4) armature space matrices (eg. the rest pose,
+    or a pose per frame) and the parent index per bone (-1 for roots).
+    Roots are relative to the armature, or moved by space (a 4x4 matrix) into another.
+    """
+    matrices = np.asarray(matrices, dtype=np.float64)
+    parents = np.asarray(parents, dtype=np.int64)
+    local = matrices.copy()
+    child = parents >= 0
+    local[..., child, :, :] = np.linalg.inv(matrices[..., parents[child], :, :]) @ matrices[..., child, :, :]
+    if space is not None:
+        local[..., ~child, :, :] = np.asarray(space, dtype=np.float64) @ matrices[..., ~child, :, :]
+    return local
+
+
+def quaternion_multiply(a, b) -> np.ndarray:
+    """Hamilton products of (..., 4) (w, x, y, z) quaternions"""
+    aw, ax, ay, az = np.moveaxis(np.asarray(a), -1, 0)
+    bw, bx, by, bz = np.moveaxis(np.asarray(b), -1, 0)
+    return np.stack([aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw], axis=-1)
+
+
+def conjugate(q) -> np.ndarray:
+    return np.asarray(q) * np.array([1.0, -1.0, -1.0, -1.0])
+
+
+def slerp(a, b, t) -> np.ndarray:
+    """Spherical interpolation from (n, 4) quaternions a to b, by (n, ) fractions t (the shorter way round)"""
+    dot = (a * b).sum(axis=1)
+    b = np.where(dot[:, None] < 0.0, -b, b)
+    dot = np.abs(dot)
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin = np.sin(theta)
+    # (almost) the same rotation: lerp is as good, and doesn't divide by zero
+    close = sin < 1e-6
+    wa = np.where(close, 1.0 - t, np.sin((1.0 - t) * theta) / np.where(close, 1.0, sin))
+    wb = np.where(close, t, np.sin(t * theta) / np.where(close, 1.0, sin))
+    q = wa[:, None] * a + wb[:, None] * b
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+#
+# ## Animation (keyframes relative to the rest pose, and keyframe reduction) ##
+#
+
+
+def pose_keys(posed, parents, space, rest_positions, rest_rotations, rest_scales) -> tuple:
+    """
+    Keyframe transforms of sampled poses: (frames, bones, 4, 4) armature space bone matrices (blender axes,
+    handle order) into translations (frames, bones, 3), rotations (frames, bones, 4) and scales (frames, bones, 3),
+    relative to the rest pose the way ogre applies them: position = rest + translate,
+    orientation = rest * rotate, scale = rest * scale.
+    The rotations of a bone are kept in one hemisphere from frame to frame, so they interpolate the short way.
+    """
+    posed = np.asarray(posed, dtype=np.float64)
+    n_frames, n_bones = posed.shape[:2]
+    local = zgeom.swap_matrices(local_matrices(posed, parents, space))
+    positions, rotations, scales = decompose(local.reshape(-1, 4, 4))
+    
+    translates = positions.reshape(n_frames, n_bones, 3) - rest_positions
+    rotates = quaternion_multiply(conjugate(rest_rotations), rotations.reshape(n_frames, n_bones, 4))
+    scales = scales.reshape(n_frames, n_bones, 3) / np.where(rest_scales == 0.0, 1.0, rest_scales)
+    
+    # flip every frame that turned over from the one before it (and all after it, with it)
+    if n_frames > 1:
+        turned = (rotates[1:] * rotates[:-1]).sum(axis=2) < 0.0
+        signs = np.cumprod(np.where(turned, -1.0, 1.0), axis=0)
+        rotates[1:] *= signs[:, :, None]
+    return translates, rotates, scales
+
+
+def reduce_keys(times, span_error) -> np.ndarray:
+    """
+    Indices of the keyframes to keep: splits at the worst sample until every span fits (Ramer-Douglas-Peucker).
+    span_error(a, b, t) is the error of interpolating keyframes a and b at the samples between them
+    (t: 0..1 between a and b), scaled so that 1 is the most allowed.
+    The first and last keyframes always stay.
+    """
+    n = len(times)
+    if n <= 2:
+        return np.arange(n)
+    
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    todo = [(0, n - 1)]
+    while todo:
+        a, b = todo.pop()
+        if b - a < 2:
+            continue
+        t = (times[a + 1:b] - times[a]) / (times[b] - times[a])
+        error = span_error(a, b, t)
+        worst = int(np.argmax(error))
+        if error[worst] <= 1.0:
+            continue
+        split = a + 1 + worst
+        keep[split] = True
+        todo.append((a, split))
+        todo.append((split, b))
+    return np.nonzero(keep)[0]
+
+
+def reduce_track(times, translates, rotates, scales, tolerance=0.001, angle=0.002) -> np.ndarray:
+    """
+    Indices of the keyframes to keep, so that interpolating between them (lerp for translation and scale,
+    slerp for rotation) stays within tolerance (distance, and scale factor) and angle (radians) of every
+    sample dropped (see reduce_keys).
+    """
+    # zero tolerances keep every keyframe that changes anything
+    tolerance = max(tolerance, 1e-9)
+    angle = max(angle, 1e-9)
+    
+    def span_error(a, b, t):
+        lerp = lambda v: v[a] + (v[b] - v[a]) * t[:, None]
+        error = np.linalg.norm(lerp(translates) - translates[a + 1:b], axis=1) / tolerance
+        error = np.maximum(error, np.abs(lerp(scales) - scales[a + 1:b]).max(axis=1) / tolerance)
+        between = slerp(np.repeat(rotates[a][None], len(t), axis=0), np.repeat(rotates[b][None], len(t), axis=0), t)
+        dot = np.abs((between * rotates[a + 1:b]).sum(axis=1))
+        return np.maximum(error, 2.0 * np.arccos(np.clip(dot, 0.0, 1.0)) / angle)
+    
+    return reduce_keys(times, span_error)
+
+
+def is_rest(translates, rotates, scales, tolerance=0.001, angle=0.002) -> bool:
+    """Whether keyframes leave the bone at its rest pose (within the tolerances), so it needs no track"""
+    return bool(np.all(np.linalg.norm(translates, axis=1) <= tolerance) and
+                np.all(np.abs(scales - 1.0) <= tolerance) and
+                np.all(2.0 * np.arccos(np.clip(np.abs(rotates[:, 0]), 0.0, 1.0)) <= angle))
+
+
+class Track(object):
+    """Keyframes of one bone: times (n, ), translations (n, 3), rotations ((w, x, y, z), (n, 4)), scales (n, 3)"""
+    
+    def __init__(self, handle, times, translates, rotates, scales):
+        self.handle = handle
+        self.times = times
+        self.translates = translates
+        self.rotates = rotates
+        self.scales = scales
+
+
+class Animation(object):
+    """
+    A skeletal animation: a track per bone that moves in it, with the keyframes reduction kept.
+    sampled and kept count keyframes (over all bones), static the bones left without a track.
+    """
+    
+    def __init__(self, name, length, tracks, sampled=0, static=0):
+        self.name = name
+        self.length = length
+        self.tracks = tracks
+        self.sampled = sampled
+        self.kept = sum(len(track.times) for track in tracks)
+        self.static = static
+    
+    @classmethod
+    def from_samples(cls, name, times, translates, rotates, scales, tolerance=0.001, angle=0.002):
+        """Reduce (frames, bones, ...) keyframes (see pose_keys) sampled at times, bone by bone"""
+        times = np.asarray(times, dtype=np.float64)
+        tracks = list()
+        static = 0
+        for handle in range(translates.shape[1]):
+            bone = translates[:, handle], rotates[:, handle], scales[:, handle]
+            if is_rest(*bone, tolerance, angle):
+                static += 1
+                continue
+            keep = reduce_track(times, *bone, tolerance, angle)
+            tracks.append(Track(handle, times[keep], *(channel[keep] for channel in bone)))
+        return cls(name, float(times[-1] - times[0]) if len(times) else 0.0, tracks,
+                   sampled=translates.shape[0] * translates.shape[1], static=static)
+
+
+#
+# ## Vertex weights (fixed width influences per vertex) ##
+#
+
+
+def gather_weights(vertex_ids, group_ids, weights, vertex_count, group_bones,
+                   threshold=WEIGHT_THRESHOLD, max_influences=MAX_INFLUENCES) -> tuple:
+    """
+    Fixed width skinning arrays from flat (vertex, vertex group, weight) memberships.
+    group_bones maps the vertex groups to bones (-1: not a deforming bone). Weights under the threshold go,
+    the max_influences biggest per vertex stay and get renormalized to add up to 1.
+    Vertices left without a weight follow the first bone, fully.
+    Returns the bone indices (n, max_influences) as uint16, the weights (n, max_influences) as float32 and
+    counts of what got dropped (dict).
+    """
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float32)
+    group_bones = np.asarray(group_bones, dtype=np.int64)
+    
+    bones = group_bones[group_ids] if len(group_ids) else np.zeros(0, dtype=np.int64)
+    deforming = bones >= 0
+    keep = deforming & (weights >= threshold)
+    vertex_ids, bones, weights = vertex_ids[keep], bones[keep], weights[keep]
+    
+    # per vertex, the biggest weights first; the rank is the position within the vertex's run
+    order = np.lexsort((-weights, vertex_ids))
+    vertex_ids, bones, weights = vertex_ids[order], bones[order], weights[order]
+    rank = np.arange(len(vertex_ids)) - np.searchsorted(vertex_ids, vertex_ids, side="left")
+    fits = rank < max_influences
+    
+    out_bones = np.zeros((vertex_count, max_influences), dtype=np.uint16)
+    out_weights = np.zeros((vertex_count, max_influences), dtype=np.float32)
+    out_bones[vertex_ids[fits], rank[fits]] = bones[fits]
+    out_weights[vertex_ids[fits], rank[fits]] = weights[fits]
+    
+    total = out_weights.sum(axis=1)
+    unweighted = total <= 0.0
+    out_weights[unweighted, 0] = 1.0
+    total[unweighted] = 1.0
+    out_weights /= total[:, None]
+    
+    stats = {
+        "influences": int(np.count_nonzero(fits)),
+        "culled": int(np.count_nonzero(deforming & ~keep)),
+        "clamped": len(np.unique(vertex_ids[~fits])),
+        "unweighted": int(np.count_nonzero(unweighted)),
+    }
+    return out_bones, out_weights, stats
+
+
+#
+# ## Serializer class (to write binary .skeleton files without OgreXMLConverter) ##
+#
+
+
+class SKELETONserializer(zmesh.ChunkSerializer):
+    """Class for serializing binary skeletons"""
+    
+    def write_bones(self, skeleton) -> None:
+        for handle, bone in enumerate(skeleton.bones):
+            w, x, y, z = skeleton.rotations[handle].tolist()
+            self.begin_chunk(SKELETON_BONE)
+            self.write_string(bone.name)
+            self.write("H", handle)
+            self.write("3f", *skeleton.positions[handle].tolist())
+            # ogre quaternions go x, y, z, w
+            self.write("4f", x, y, z, w)
+            self.write("3f", *skeleton.scales[handle].tolist())
+            self.end_chunk()
+        
+        for handle, bone in enumerate(skeleton.bones):
+            if bone.parent is not None:
+                self.begin_chunk(SKELETON_BONE_PARENT)
+                self.write("2H", handle, bone.parent)
+                self.end_chunk()
+    
+    def write_animation(self, animation) -> None:
+        self.begin_chunk(SKELETON_ANIMATION)
+        self.write_string(animation.name)
+        self.write("f", animation.length)
+        for track in animation.tracks:
+            self.begin_chunk(SKELETON_ANIMATION_TRACK)
+            self.write("H", track.handle)
+            # the keyframe chunks, all packed in one go
+            keyframes = np.empty(len(track.times), dtype=KEYFRAME)
+            keyframes["id"] = SKELETON_ANIMATION_TRACK_KEYFRAME
+            keyframes["length"] = KEYFRAME.itemsize
+            keyframes["time"] = track.times
+            # ogre quaternions go x, y, z, w
+            keyframes["rotation"] = np.roll(track.rotates, -1, axis=1)
+            keyframes["translate"] = track.translates
+            keyframes["scale"] = track.scales
+            self.write_buffer(keyframes)
+            self.end_chunk()
+        self.end_chunk()
+    
+    def write_file(self, filepath, skeleton) -> None:
+        """
+        Write a skeleton (see ogre_types.Skeleton): its bones in handle order,
+        with their rest pose relative to their parents, and its animations (see Animation).
+        """
+        with open(filepath, mode="wb") as fw:
+            self.fw = fw
+            
+            self.write("H", SKELETON_HEADER)
+            self.write_string(VERSION)
+            
+            self.begin_chunk(SKELETON_BLENDMODE)
+            self.write("H", ANIMBLEND_AVERAGE)
+            self.end_chunk()
+            
+            self.write_bones(skeleton)
+            for animation in skeleton.animations:
+                self.write_animation(animation)
+            
+            self.fw = None
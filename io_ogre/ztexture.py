@@ -0,0 +1,163 @@
+import os
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import zprof
+from .zcache import file_hash
+
+
+log = logging.getLogger(__name__)
+
+#
+# ## File utils ##
+#
+
+
+def same_path(a, b) -> bool:
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+def copy_hashed(src, dst, chunk=1 << 20) -> tuple:
+    """Copy src to dst, hashing the data on the way (like zcache.file_hash); returns (bytes copied, hash)"""
+    h = hashlib.blake2b(digest_size=20)
+    size = 0
+    with open(src, mode="rb") as fr, open(dst, mode="wb") as fw:
+        for block in iter(lambda: fr.read(chunk), b""):
+            h.update(block)
+            fw.write(block)
+            size += len(block)
+    return size, h.hexdigest()
+
+
+#
+# ## TextureJob class (one source to one destination) ##
+#
+
+
+class TextureJob(object):
+    """A texture to stage, and what happened to it"""
+    
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+        # 'copied', 'skipped' or 'failed'
+        self.status = None
+        self.nbytes = 0
+        self.hash = None
+        self.error = None
+
+
+#
+# ## TextureStager class (deduped, parallel texture copies) ##
+#
+
+
+class TextureStager(object):
+    """
+    Collects the textures to copy next to the exported files, then copies them on a thread pool.
+    Every destination is written once: repeats of a texture are dropped, and so are other sources
+    with the same file name (the first one queued wins, the others are reported as conflicts).
+    Copies are skipped if the destination already matches the source (same size and mtime, or same content).
+    """
+    
+    def __init__(self, workers=0, cache=None):
+        self.workers = workers if workers > 0 else min(32, (os.cpu_count() or 1) + 4)
+        # optional zcache.ExportCache: it can vouch for a texture without any i/o on the destination
+        self.cache = cache
+        
+        # normalized destination -> TextureJob
+        self.jobs = dict()
+        self.duplicates = 0
+        # (source, destination) of the textures dropped for another source's copy
+        self.conflicts = list()
+    
+    def add(self, src, dst) -> None:
+        """Queue a texture copy; a destination already queued isn't queued again, whatever its source"""
+        key = os.path.normcase(os.path.abspath(dst))
+        job = self.jobs.get(key)
+        if job is None:
+            self.jobs[key] = TextureJob(src, dst)
+        elif same_path(job.src, src):
+            self.duplicates += 1
+        else:
+            log.warning("texture %s has the same file name as %s, only the first one is copied to %s",
+                        src, job.src, dst)
+            self.conflicts.append((src, dst))
+    
+    def process(self, job) -> TextureJob:
+        """Stage one texture (on a pool thread)"""
+        try:
+            st_src = os.stat(job.src)
+            job.nbytes = st_src.st_size
+            
+            if same_path(job.src, job.dst):
+                job.status = "skipped"
+                return job
+            
+            try:
+                st_dst = os.stat(job.dst)
+            except FileNotFoundError:
+                st_dst = None
+            
+            if st_dst is not None and st_dst.st_size == st_src.st_size:
+                if st_dst.st_mtime_ns == st_src.st_mtime_ns:
+                    # we copied it last time (copies get the source's mtime)
+                    job.status = "skipped"
+                    if self.cache is not None:
+                        job.hash = file_hash(job.src)
+                    return job
+                
+                job.hash = file_hash(job.src)
+                if job.hash == file_hash(job.dst):
+                    # same content; take over the mtime, so next time the cheap check is enough
+                    os.utime(job.dst, ns=(st_src.st_atime_ns, st_src.st_mtime_ns))
+                    job.status = "skipped"
+                    return job
+            
+            with zprof.span("copy", file=job.dst):
+                job.nbytes, job.hash = copy_hashed(job.src, job.dst)
+            os.utime(job.dst, ns=(st_src.st_atime_ns, st_src.st_mtime_ns))
+            job.status = "copied"
+        except OSError as e:
+            job.status = "failed"
+            job.error = e
+        return job
+    
+    def run(self) -> dict:
+        """Copy everything that needs copying, and report bytes copied versus skipped"""
+        time_start = time.time()
+        
+        todo = list()
+        for job in self.jobs.values():
+            if self.cache is not None and self.cache.texture_fresh(job.src, job.dst):
+                job.status = "skipped"
+                job.nbytes = os.path.getsize(job.src)
+            else:
+                todo.append(job)
+        
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(todo))) as executor:
+                list(executor.map(self.process, todo))
+        
+        failed = [job for job in self.jobs.values() if job.status == "failed"]
+        
+        if self.cache is not None:
+            for job in todo:
+                if job.status != "failed":
+                    self.cache.record_texture(job.src, job.dst, content_hash=job.hash)
+        
+        jobs = self.jobs.values()
+        return {
+            "textures": len(self.jobs),
+            "duplicates": self.duplicates,
+            "conflicts": self.conflicts,
+            "copied": sum(1 for job in jobs if job.status == "copied"),
+            "skipped": sum(1 for job in jobs if job.status == "skipped"),
+            "failed": failed,
+            "bytes_copied": sum(job.nbytes for job in jobs if job.status == "copied"),
+            "bytes_skipped": sum(job.nbytes for job in jobs if job.status == "skipped"),
+            "seconds": time.time() - time_start,
+        }
+
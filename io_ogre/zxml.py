@@ -1,4 +1,5 @@
 import os
+import itertools
 import xml.etree.ElementTree as et
 
 
@@ -136,3 +137,178 @@ class XMLserializer(object):
         with open(filepath, mode="w", encoding="UTF-8"):
             # "ugly" printing of xml, sadly "pretty" is hard.
             tree.write(filepath, encoding="UTF-8")
+
+
+
+#
+# ## Writer class (to stream uniform-looking files, without building a graph) ##
+#
+
+
+def escape_attr(value) -> str:
+    """Escape an attribute value the way ElementTree does"""
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    if "\"" in value:
+        value = value.replace("\"", "&quot;")
+    if "\r" in value:
+        value = value.replace("\r", "&#13;")
+    if "\n" in value:
+        value = value.replace("\n", "&#10;")
+    if "\t" in value:
+        value = value.replace("\t", "&#09;")
+    return value
+
+
+def format_attr(value) -> str:
+    """Same stringification as XMLserializer.serialize"""
+    if type(value) is float:
+        return f"{value:.6f}"
+    return escape_attr(str(value))
+
+
+class XMLwriter(object):
+    """
+    Write xml to a file element by element, in the same format XMLserializer produces.
+    Nothing but the stack of open elements is kept, so memory doesn't grow with the file.
+    """
+    
+    # rows are written to the file in batches of this many
+    batch = 4096
+    
+    def __init__(self, filepath, ind="\t"):
+        self.ind = ind
+        self.fw = open(filepath, mode="w", encoding="UTF-8", errors="xmlcharrefreplace")
+        # names of the open elements
+        self.stack = list()
+        # start tag of the last opened element, until we know if it has children
+        self.pending = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_all()
+        self.fw.close()
+    
+    def tag(self, name, attr) -> str:
+        if not attr:
+            return "<" + name
+        return "<" + name + " " + " ".join(at + '="' + format_attr(attr[at]) + '"' for at in attr)
+    
+    def flush_pending(self) -> None:
+        """The pending element gets a child, so it's written as a start tag"""
+        if self.pending is not None:
+            self.fw.write(self.pending + ">\n")
+            self.pending = None
+    
+    def open(self, name="", attr={}) -> None:
+        """Open an element; children go into it until close()"""
+        self.flush_pending()
+        self.pending = self.ind * len(self.stack) + self.tag(name, attr)
+        self.stack.append(name)
+    
+    def close(self) -> None:
+        """Close the last opened element"""
+        name = self.stack.pop()
+        if self.pending is not None:
+            # no children after all
+            self.fw.write(self.pending + " />\n")
+            self.pending = None
+        else:
+            # XMLserializer.indent leaves end tags on the level of the children, so do we
+            self.fw.write(self.ind * (len(self.stack) + 1) + "</" + name + ">\n")
+    
+    def close_all(self) -> None:
+        while self.stack:
+            self.close()
+    
+    def leaf(self, name="", attr={}) -> None:
+        """Write an element without children"""
+        self.flush_pending()
+        self.fw.write(self.ind * len(self.stack) + self.tag(name, attr) + " />\n")
+    
+    @staticmethod
+    def row_attrs(keys, row) -> dict:
+        """Row values mapped onto the keys; a single key takes all of them, space separated (eg. value="r g b a")"""
+        if len(keys) == 1 and len(row) > 1:
+            return {keys[0]: " ".join(format_attr(value) for value in row)}
+        return dict(zip(keys, row))
+    
+    def template(self, name, keys, row, level) -> str:
+        """%-format string for one leaf element, with the value types of the given row"""
+        if len(keys) == 1 and len(row) > 1:
+            if not all(type(value) is float for value in row):
+                return None
+            return self.ind * level + "<" + name + " " + keys[0] + '="' + " ".join(["%.6f"] * len(row)) + '" />\n'
+        parts = list()
+        for key, value in zip(keys, row):
+            if type(value) is float:
+                parts.append(key + '="%.6f"')
+            elif type(value) is int:
+                parts.append(key + '="%d"')
+            else:
+                # strings need escaping, no template for those
+                return None
+        return self.ind * level + "<" + name + " " + " ".join(parts) + " />\n"
+    
+    def write_rows(self, fmt, rows) -> None:
+        fw = self.fw
+        buf = list()
+        for row in rows:
+            buf.append(fmt % row)
+            if len(buf) >= self.batch:
+                fw.write("".join(buf))
+                buf.clear()
+        fw.write("".join(buf))
+    
+    def leaves(self, name, keys, rows) -> None:
+        """
+        Write one leaf element per row, row values mapped onto the keys as attributes.
+        eg.: leaves("face", ("v1", "v2", "v3"), faces)
+        """
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return
+        self.flush_pending()
+        fmt = self.template(name, keys, first, len(self.stack))
+        if fmt is None:
+            for row in (first, ) + tuple(rows):
+                self.leaf(name, self.row_attrs(keys, row))
+            return
+        self.fw.write(fmt % tuple(first))
+        self.write_rows(fmt, (tuple(row) for row in rows))
+    
+    def nodes(self, name, children, rows) -> None:
+        """
+        Write one element per row, with a leaf child per (child name, keys) pair.
+        Rows hold one value sequence per child.
+        eg.: nodes("vertex", (("position", ("x", "y", "z")), ("texcoord", ("u", "v"))), vertices)
+        """
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return
+        self.flush_pending()
+        level = len(self.stack)
+        
+        fmts = [self.template(cname, keys, value, level + 1) for (cname, keys), value in zip(children, first)]
+        if None in fmts:
+            for row in (first, ) + tuple(rows):
+                self.open(name)
+                for (cname, keys), value in zip(children, row):
+                    self.leaf(cname, self.row_attrs(keys, value))
+                self.close()
+            return
+        
+        ind = self.ind * level
+        fmt = ind + "<" + name + ">\n" + "".join(fmts) + ind + self.ind + "</" + name + ">\n"
+        
+        flat = itertools.chain.from_iterable
+        self.fw.write(fmt % tuple(flat(first)))
+        self.write_rows(fmt, (tuple(flat(row)) for row in rows))